@@ -0,0 +1,232 @@
+"""
+Activity logging and activity log queries.
+
+log_activity() does not write in the request path: entries are buffered in
+memory per process and written with one bulk_create when the buffer fills
+up, on a timer, at the end of the request and when the process exits, so
+a page that logs many actions costs one short write transaction instead
+of one per action.
+
+The log is paged with a keyset cursor on (timestamp, id) instead of
+OFFSET, so every page is an index range scan on
+activitylog_user_recent_idx no matter how deep the reader scrolls.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import close_old_connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.timesince import timesince
+
+from .models import ActivityLog, User
+from .search import index_activities
+from .writes import run_write
+
+logger = logging.getLogger(__name__)
+
+# Pending entries kept after failed flushes; the oldest are dropped beyond this
+MAX_PENDING = 10000
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# action_filter value -> keyword matched against ActivityLog.action
+ACTION_FILTERS = {
+    'class': 'class',
+    'student': 'student',
+    'attendance': 'attendance',
+    'grade': 'grade',
+    'profile': 'profile',
+}
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(activity):
+    """Opaque cursor pointing just past activity: '<epoch microseconds>.<id>'"""
+    micros = (activity.timestamp - EPOCH) // timedelta(microseconds=1)
+    return f"{micros}.{activity.pk}"
+
+
+def decode_cursor(value):
+    """Return (timestamp, id) for a cursor string, or raise ValueError"""
+    try:
+        micros, pk = (int(part) for part in value.split('.'))
+        return EPOCH + timedelta(microseconds=micros), pk
+    except (AttributeError, TypeError, ValueError, OverflowError):
+        raise ValueError(f"Invalid activity cursor: {value!r}")
+
+
+def filtered_activities(user, class_id=None, student_id=None, action=None, date_from=None, date_to=None):
+    activities = ActivityLog.objects.filter(user=user)
+    if class_id:
+        activities = activities.filter(class_obj_id=class_id)
+    if student_id:
+        activities = activities.filter(student_id=student_id)
+    if action in ACTION_FILTERS:
+        activities = activities.filter(action__icontains=ACTION_FILTERS[action])
+    if date_from:
+        activities = activities.filter(timestamp__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        activities = activities.filter(timestamp__lte=timezone.make_aware(datetime.combine(date_to, time.max)))
+    return activities
+
+
+def activity_page(user, cursor=None, limit=PAGE_SIZE, **filters):
+    """
+    One page of user's activity log, newest first.
+
+    filters are those of filtered_activities(). Returns (activities,
+    next_cursor); next_cursor is None on the last page. Raises ValueError
+    for a malformed cursor.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    activities = filtered_activities(user, **filters).prefetch_related('class_obj', 'student')
+    if cursor:
+        stamp, pk = decode_cursor(cursor)
+        activities = activities.filter(Q(timestamp__lt=stamp) | Q(timestamp=stamp, id__lt=pk))
+    rows = list(activities.order_by('-timestamp', '-id')[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def activity_json(activity):
+    return {
+        'id': activity.pk,
+        'action': activity.action,
+        'description': activity.description,
+        'timestamp': activity.timestamp.isoformat(),
+        'timesince': timesince(activity.timestamp),
+        'class_id': activity.class_obj_id,
+        'class_name': activity.class_obj.class_name if activity.class_obj else None,
+        'student_id': activity.student_id,
+        'student_name': activity.student.display_name if activity.student else None,
+    }
+
+
+# -----------------------------
+# Buffered logger
+# -----------------------------
+class ActivityBuffer:
+    """Per-process buffer of unsaved ActivityLog rows with a background flusher thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def add(self, entry):
+        with self._lock:
+            self._pending.append(entry)
+            size = len(self._pending)
+        self._ensure_thread()
+        if size >= settings.ACTIVITY_LOG_BUFFER_SIZE:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write every pending entry; on failure they are kept for the next flush"""
+        with self._lock:
+            entries, self._pending = self._pending, []
+        if not entries:
+            return 0
+        try:
+            write_activities(entries)
+        except Exception:
+            logger.exception("Could not write %d activity log entries; will retry", len(entries))
+            for entry in entries:
+                # The insert was rolled back; don't retry with ids it handed out
+                entry.pk = None
+            with self._lock:
+                self._pending = (entries + self._pending)[-MAX_PENDING:]
+            return 0
+        return len(entries)
+
+    def _ensure_thread(self):
+        # A forked worker inherits the buffer but not the thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="activity-log-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(settings.ACTIVITY_LOG_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+_buffer = ActivityBuffer()
+
+
+def write_activities(entries):
+    """
+    Insert ActivityLog rows and their search index rows in one transaction,
+    then bump each user's activity_count.
+
+    Raises only when the insert failed (and was rolled back), so the caller
+    may queue the entries again. The counters live on the default database,
+    not necessarily the log's; a failed counter update is logged, never
+    retried by inserting the rows a second time.
+    """
+    with transaction.atomic(using=router.db_for_write(ActivityLog)):
+        ActivityLog.objects.bulk_create(entries, batch_size=500)
+        # bulk_create skips post_save, which indexes single saves
+        index_activities(entries)
+    # ...and the receiver that maintains the counter
+    counts = Counter(entry.user_id for entry in entries)
+    try:
+        run_write("activity_count", _bump_activity_counts, counts, using=router.db_for_write(User))
+    except Exception:
+        logger.exception(
+            "Could not update activity_count for %d logged activities; the counters are now short "
+            "(fix with `manage.py migrate_activity_log --recount`)", len(entries),
+        )
+
+
+def _bump_activity_counts(counts):
+    for user_id, count in counts.items():
+        User.objects.filter(pk=user_id).update(activity_count=F('activity_count') + count)
+
+
+def log_activity(user, action, description='', class_obj=None, student=None):
+    """Record an activity; written later in a batch unless ACTIVITY_LOG_BUFFERED is off"""
+    entry = ActivityLog(
+        user=user, action=action, description=description,
+        class_obj=class_obj, student=student, timestamp=timezone.now(),
+    )
+    if not settings.ACTIVITY_LOG_BUFFERED:
+        entry.save()
+        return
+    _buffer.add(entry)
+
+
+def flush_activity_log(**kwargs):
+    """Write buffered activities now (also connected to request_finished and atexit)"""
+    return _buffer.flush()
+
+
+def _flush_at_request_end(**kwargs):
+    if settings.ACTIVITY_LOG_FLUSH_ON_REQUEST_END:
+        flush_activity_log()
+
+
+request_finished.connect(_flush_at_request_end, dispatch_uid="activity_log_flush")
+atexit.register(flush_activity_log)
@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class MyprojectConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'myproject'
+
+    def ready(self):
+        from django.conf import settings
+
+        from . import signals  # noqa: F401
+        from .metrics import install_template_timer
+
+        if settings.METRICS_ENABLED:
+            install_template_timer()
@@ -0,0 +1,245 @@
+"""
+Activity log retention.
+
+Entries older than ACTIVITY_LOG_RETENTION_DAYS are moved out of the hot
+ActivityLog table by `manage.py archive_activity_logs` into gzipped JSON
+Lines files, one per instructor per month:
+
+    <ACTIVITY_ARCHIVE_DIR>/<user id>/<YYYY-MM>.jsonl.gz
+
+A month file starts with a format line and holds its entries newest
+first, without duplicates. Archiving walks the old rows per instructor,
+newest first (the activitylog_user_recent_idx order), so each month
+arrives in one piece: it is merged with the month's existing file, which
+is replaced atomically (written to a temporary file, fsynced, then
+renamed) once per run, before the month's rows are deleted. An
+interrupted run at worst archives a month again, and the merge drops the
+duplicate ids.
+
+Because of that order the activity log view streams a month and stops as
+soon as it has a page: reading page n costs the entries up to that page,
+not the whole month.
+"""
+import gzip
+import json
+import os
+import re
+from collections import defaultdict
+from contextlib import closing
+from datetime import datetime, time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .activity import ACTION_FILTERS, decode_cursor, encode_cursor
+from .models import ActivityLog
+
+MONTH_RE = re.compile(r"^\d{4}-\d{2}$")
+ARCHIVE_SUFFIX = ".jsonl.gz"
+# First line of every month file
+ARCHIVE_HEADER = {"format": 1, "order": "timestamp-desc"}
+
+
+def _user_dir(user_id):
+    return Path(settings.ACTIVITY_ARCHIVE_DIR) / str(user_id)
+
+
+def archive_path(user_id, month):
+    return _user_dir(user_id) / f"{month}{ARCHIVE_SUFFIX}"
+
+
+def archived_months(user):
+    """Months (YYYY-MM, newest first) with archived activity for user"""
+    directory = _user_dir(user.pk)
+    if not directory.is_dir():
+        return []
+    months = [name[:-len(ARCHIVE_SUFFIX)] for name in os.listdir(directory) if name.endswith(ARCHIVE_SUFFIX)]
+    return sorted((m for m in months if MONTH_RE.match(m)), reverse=True)
+
+
+def _record(activity):
+    return {
+        "id": activity.pk,
+        "action": activity.action,
+        "description": activity.description,
+        "timestamp": activity.timestamp.isoformat(),
+        "class_id": activity.class_obj_id,
+        "class_name": activity.class_obj.class_name if activity.class_obj else None,
+        "student_id": activity.student_id,
+        "student_name": activity.student.display_name if activity.student else None,
+    }
+
+
+def archive_activities(before, batch_size=1000, dry_run=False):
+    """
+    Move ActivityLog rows older than before into the monthly archives.
+
+    Rows are read batch_size at a time; each (user, month) is written once
+    and its rows are then deleted, batch_size per short transaction. Only
+    one month's entries are held in memory.
+    Returns {(user id, month): rows archived}.
+    """
+    totals = defaultdict(int)
+    stale = (
+        ActivityLog.objects.filter(timestamp__lt=before)
+        .prefetch_related("class_obj", "student")
+        .order_by("user_id", "-timestamp", "-id")
+    )
+    current, records = None, {}
+    position = None
+    while True:
+        chunk = stale
+        if position:
+            user_id, stamp, pk = position
+            chunk = chunk.filter(
+                Q(user_id__gt=user_id) | Q(user_id=user_id, timestamp__lt=stamp)
+                | Q(user_id=user_id, timestamp=stamp, id__lt=pk)
+            )
+        chunk = list(chunk[:batch_size])
+        if not chunk:
+            break
+        last = chunk[-1]
+        position = (last.user_id, last.timestamp, last.pk)
+
+        for activity in chunk:
+            key = (activity.user_id, timezone.localtime(activity.timestamp).strftime("%Y-%m"))
+            if key != current:
+                if records:
+                    _archive_month(current, records, batch_size)
+                current, records = key, {}
+            totals[key] += 1
+            if not dry_run:
+                records[activity.pk] = _record(activity)
+    if records:
+        _archive_month(current, records, batch_size)
+    return dict(totals)
+
+
+def _archive_month(key, records, batch_size):
+    """Merge records ({id: record}) into the (user id, month) file, then delete their rows"""
+    path = archive_path(*key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    merged = _load_records(path)
+    merged.update(records)
+    _write_month(path, merged)
+    ids = list(records)
+    for start in range(0, len(ids), batch_size):
+        with transaction.atomic(using=router.db_for_write(ActivityLog)):
+            ActivityLog.objects.filter(id__in=ids[start:start + batch_size]).delete()
+
+
+def _sort_key(record):
+    return parse_datetime(record["timestamp"]), record["id"]
+
+
+def _load_records(path):
+    """{id: record} of a month file ({} if it does not exist)"""
+    records = {}
+    if not path.exists():
+        return records
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                # Skips the format line
+                if "id" in record:
+                    records[record["id"]] = record
+    return records
+
+
+def _write_month(path, records):
+    """Atomically replace path with records ({id: record}) sorted newest first"""
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            gz.write(json.dumps(ARCHIVE_HEADER).encode("utf-8") + b"\n")
+            for record in sorted(records.values(), key=_sort_key, reverse=True):
+                gz.write(json.dumps(record).encode("utf-8") + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temporary, path)
+
+
+def archived_counts():
+    """{user id: number of archived entries} across every month file"""
+    root = Path(settings.ACTIVITY_ARCHIVE_DIR)
+    counts = defaultdict(int)
+    if not root.is_dir():
+        return counts
+    for path in root.glob(f"*/*{ARCHIVE_SUFFIX}"):
+        if path.parent.name.isdigit() and MONTH_RE.match(path.name[:-len(ARCHIVE_SUFFIX)]):
+            counts[int(path.parent.name)] += len(_load_records(path))
+    return counts
+
+
+class _Related:
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+class ArchivedActivity:
+    """Read-only stand-in for an archived ActivityLog row (same attributes the log templates use)"""
+
+    def __init__(self, record):
+        self.pk = self.id = record["id"]
+        self.action = record["action"]
+        self.description = record["description"]
+        self.timestamp = parse_datetime(record["timestamp"])
+        self.class_obj_id = record["class_id"]
+        self.student_id = record["student_id"]
+        self.class_obj = _Related(id=record["class_id"], class_name=record["class_name"]) if record["class_id"] else None
+        self.student = _Related(id=record["student_id"], display_name=record["student_name"]) if record["student_id"] else None
+
+
+def iter_archived_month(user, month):
+    """User's archived activities in month, newest first, read as they are consumed"""
+    if not MONTH_RE.match(month or ""):
+        raise ValueError(f"Invalid archive month: {month!r}")
+    path = archive_path(user.pk, month)
+    if not path.exists():
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        first = f.readline()
+        if json.loads(first) != ARCHIVE_HEADER:
+            raise ValueError(f"Unknown activity archive format in {path}")
+        for line in f:
+            if line.strip():
+                yield ArchivedActivity(json.loads(line))
+
+
+def archived_page(user, month, cursor=None, limit=50, class_id=None, student_id=None, action=None,
+                  date_from=None, date_to=None):
+    """
+    Like activity.activity_page(), over one archived month. The month is
+    streamed newest first and reading stops once the page is full.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    start = timezone.make_aware(datetime.combine(date_from, time.min)) if date_from else None
+    end = timezone.make_aware(datetime.combine(date_to, time.max)) if date_to else None
+    keyword = ACTION_FILTERS.get(action)
+
+    activities = []
+    with closing(iter_archived_month(user, month)) as archived:
+        for activity in archived:
+            if position and (activity.timestamp, activity.pk) >= position:
+                continue
+            if end and activity.timestamp > end:
+                continue
+            if start and activity.timestamp < start:
+                # Everything after this is older still
+                break
+            if class_id and activity.class_obj_id != class_id:
+                continue
+            if student_id and activity.student_id != student_id:
+                continue
+            if keyword and keyword not in activity.action.lower():
+                continue
+            activities.append(activity)
+            if len(activities) > limit:
+                break
+    next_cursor = encode_cursor(activities[limit - 1]) if len(activities) > limit else None
+    return activities[:limit], next_cursor
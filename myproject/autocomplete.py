@@ -0,0 +1,114 @@
+"""
+Student type-ahead across an instructor's classes for one school year.
+
+The candidates are a sorted list of normalized keys (student code, last
+name, first name, "last first" and "first last") with the student each
+key belongs to. A lookup bisects to the first key at or after the prefix
+and walks forward while keys still start with it, so it costs a
+binary search plus the matches read, however many students there are.
+
+The structure is built with one query and stored through caching.py in
+the instructor's namespace, which signals.py bumps whenever a class or
+roster changes. Each process also keeps the last few structures in
+memory under the same versioned key, so a warm lookup never unpickles.
+"""
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+from .caching import get_or_compute, make_key
+from .models import Class, Student
+from .routers import reading_from_replica
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+# Instructors whose structures each process keeps in memory
+LOCAL_CACHE_SIZE = 32
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+def normalize(text):
+    """Lower-case, accent-free, single-spaced form used for keys and queries"""
+    text = text or ""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.replace(",", " ").casefold().split())
+
+
+class PrefixIndex:
+    def __init__(self, students):
+        self.students = {}
+        entries = set()
+        for student in students:
+            self.students[student["id"]] = student
+            last, first = normalize(student["last_name"]), normalize(student["first_name"])
+            for key in (normalize(student["student_id"]), last, first, f"{last} {first}", f"{first} {last}"):
+                if key:
+                    entries.add((key, student["id"]))
+        entries = sorted(entries)
+        self.keys = [key for key, _ in entries]
+        self.ids = [pk for _, pk in entries]
+
+    def lookup(self, query, limit=DEFAULT_LIMIT):
+        """Students with a key starting with query, in key order, at most limit"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        position = bisect_left(self.keys, prefix)
+        while position < len(self.keys) and len(found) < limit:
+            if not self.keys[position].startswith(prefix):
+                break
+            pk = self.ids[position]
+            if pk not in seen:
+                seen.add(pk)
+                found.append(self.students[pk])
+            position += 1
+        return found
+
+
+def _build(user, school_year):
+    classes = Class.objects.filter(instructor=user, school_year=school_year)
+    class_names = {class_obj.id: class_obj.class_name for class_obj in classes}
+    rows = Student.objects.filter(class_obj__in=list(class_names)).values_list(
+        "id", "student_id", "last_name", "first_name", "middle_initial", "class_obj_id"
+    )
+    return PrefixIndex({
+        "id": pk,
+        "student_id": student_id,
+        "last_name": last_name,
+        "first_name": first_name,
+        "name": Student.format_display_name(last_name, first_name, middle_initial),
+        "class_id": class_id,
+        "class_name": class_names[class_id],
+    } for pk, student_id, last_name, first_name, middle_initial, class_id in rows)
+
+
+def student_index(user, school_year):
+    """The instructor's PrefixIndex for school_year, from memory, the cache or the database"""
+    name = f"autocomplete:{school_year}"
+    # The key embeds the namespace version, so a bumped namespace misses here too
+    key = make_key(user.pk, name)
+    with _local_lock:
+        index = _local.get(key)
+        if index is not None:
+            _local.move_to_end(key)
+            return index
+    index = get_or_compute(user, name, lambda: _build(user, school_year))
+    if reading_from_replica():
+        # Possibly stale; get_or_compute() did not store it either
+        return index
+    with _local_lock:
+        _local[key] = index
+        while len(_local) > LOCAL_CACHE_SIZE:
+            _local.popitem(last=False)
+    return index
+
+
+def autocomplete_students(user, school_year, query, limit=DEFAULT_LIMIT):
+    return student_index(user, school_year).lookup(query, max(1, min(limit, MAX_LIMIT)))
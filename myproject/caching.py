@@ -0,0 +1,98 @@
+"""
+Cached derived data, namespaced per instructor and per class.
+
+Every key embeds the current version of its instructor namespace (and of
+its class namespace for class-scoped data). Invalidation never deletes
+keys: it bumps the namespace version, so every entry built from the old
+data becomes unreachable at once and simply ages out of the cache.
+
+    stats = get_or_compute(request.user, f"dashboard:{school_year}", build_stats)
+    rows = get_or_compute(request.user, "grade-rows", build_rows, class_id=class_obj.id)
+
+signals.py invalidates the class and its instructor whenever class data
+changes; the bump is deferred until the surrounding transaction commits
+so a concurrent request cannot cache pre-commit data under the new version.
+For the same reason requests reading from the replica use the cache but
+never fill it: their data may predate a bump the primary already made.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import reading_from_replica
+
+_MISSING = object()
+
+
+def _version_key(scope, pk):
+    return f"ns:{scope}:{pk}"
+
+
+def _initial_version():
+    # Clock based, so a namespace whose version key was evicted can never
+    # come back at a version that older entries were stored under
+    return int(time.time() * 1000)
+
+
+def _versions(keys):
+    """Current version of each namespace key, starting new namespaces fresh"""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # add() keeps a version another process just created
+            cache.add(key, _initial_version(), timeout=None)
+            versions[key] = cache.get(key) or _initial_version()
+    return versions
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), timeout=None)
+
+
+def make_key(user_id, name, class_id=None):
+    user_key = _version_key("user", user_id)
+    version_keys = [user_key]
+    if class_id is not None:
+        class_key = _version_key("class", class_id)
+        version_keys.append(class_key)
+    versions = _versions(version_keys)
+    key = f"derived:u{user_id}v{versions[user_key]}"
+    if class_id is not None:
+        key += f":c{class_id}v{versions[class_key]}"
+    return f"{key}:{name}"
+
+
+def get_or_compute(user, name, compute, class_id=None, timeout=None):
+    """
+    Return the cached value of name for user (and class_id), computing and
+    storing it with compute() on a miss (unless the request reads from the
+    replica). user may be a User or its pk.
+    """
+    user_id = getattr(user, "pk", user)
+    key = make_key(user_id, name, class_id)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        value = compute()
+        if not reading_from_replica():
+            cache.set(key, value, settings.CACHE_TIMEOUT if timeout is None else timeout)
+    return value
+
+
+def invalidate_class(*class_ids):
+    """Drop every cached entry built from these classes (after commit)"""
+    keys = [_version_key("class", pk) for pk in set(class_ids) if pk]
+    if keys:
+        transaction.on_commit(lambda: _bump(keys))
+
+
+def invalidate_user(*user_ids):
+    """Drop every cached entry of these instructors, class-scoped ones included (after commit)"""
+    keys = [_version_key("user", pk) for pk in set(user_ids) if pk]
+    if keys:
+        transaction.on_commit(lambda: _bump(keys))
@@ -0,0 +1,77 @@
+"""
+Conditional GET support (ETag / Last-Modified) for class-scoped pages.
+
+Validators are derived from Class.updated_at (kept current by signals.py),
+the user's Setting (theme and school year) and the CSRF cookie, so a page is
+only answered with 304 when nothing it renders could have changed.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Count, Max
+
+from .models import Class
+from .preferences import get_user_setting
+
+
+def _is_cacheable(request):
+    if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+        return False
+    # Pages carrying flash messages must always be rendered so they are consumed
+    return len(messages.get_messages(request)) == 0
+
+
+def _setting_stamp(request):
+    return get_user_setting(request.user).updated_at
+
+
+def _class_stamp(request, class_id):
+    stamps = request.__dict__.setdefault('_class_stamps', {})
+    if class_id not in stamps:
+        stamps[class_id] = (
+            Class.objects.filter(id=class_id, instructor=request.user)
+            .values_list('updated_at', flat=True)
+            .first()
+        )
+    return stamps[class_id]
+
+
+def _make_etag(request, *parts):
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    raw = '|'.join(str(part) for part in (request.user.pk, _setting_stamp(request), csrf_cookie) + parts)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def class_etag(request, class_id, *args, **kwargs):
+    """ETag for pages rendered from a single class"""
+    if not _is_cacheable(request):
+        return None
+    stamp = _class_stamp(request, class_id)
+    if stamp is None:
+        return None
+    return _make_etag(request, class_id, stamp.isoformat())
+
+
+def class_last_modified(request, class_id, *args, **kwargs):
+    """Last-Modified for pages rendered from a single class"""
+    if not _is_cacheable(request):
+        return None
+    stamp = _class_stamp(request, class_id)
+    if stamp is None:
+        return None
+    setting_stamp = _setting_stamp(request)
+    return max(stamp, setting_stamp) if setting_stamp else stamp
+
+
+def instructor_classes_etag(request, *args, **kwargs):
+    """ETag for pages rendered from all of the instructor's classes (grades_panel)"""
+    if not _is_cacheable(request):
+        return None
+    if not hasattr(request, '_instructor_stamp'):
+        request._instructor_stamp = Class.objects.filter(instructor=request.user).aggregate(
+            latest=Max('updated_at'), total=Count('id')
+        )
+    stamp = request._instructor_stamp
+    latest = stamp['latest'].isoformat() if stamp['latest'] else ''
+    return _make_etag(request, request.get_full_path(), latest, stamp['total'])
@@ -0,0 +1,17 @@
+from django.utils.functional import SimpleLazyObject
+
+from .preferences import DEFAULT_SCHOOL_YEAR, DEFAULT_THEME, get_user_setting
+
+
+def user_setting(request):
+    """Expose the user's Setting as app_setting, current_school_year and user_theme (loaded on first use)"""
+    if not hasattr(request, 'user'):
+        return {}
+    setting = getattr(request, 'app_setting', None)
+    if setting is None:
+        setting = SimpleLazyObject(lambda: get_user_setting(request.user))
+    return {
+        'app_setting': setting,
+        'current_school_year': lambda: (setting and setting.school_year) or DEFAULT_SCHOOL_YEAR,
+        'user_theme': lambda: (setting and setting.theme) or DEFAULT_THEME,
+    }
@@ -0,0 +1,157 @@
+"""
+Dashboard widgets for an instructor's school year.
+
+The dashboard page itself renders no data; each widget fetches its own JSON
+endpoint (views.dashboard_widget) in parallel. Widget data is built in a
+handful of grouped queries and cached per (instructor, school year,
+widget) in the instructor's namespace (caching.py), which signals.py bumps
+whenever one of their classes, rosters, attendance records or grades
+changes. Widgets hold plain dicts and lists only, so they pickle cheaply
+and serialize straight to JSON.
+"""
+import time
+
+from django.db.models import Count, Q
+from django.utils.timesince import timesince
+
+from .caching import get_or_compute
+from .models import ActivityLog, Attendance, Class, GradeSummary, Student
+
+# Students absent from more than this share of their class sessions are listed as at risk
+DROPPING_ABSENCE_RATE = 20
+DROPPING_LIST_SIZE = 10
+TOP_STUDENTS_SIZE = 5
+RECENT_CLASSES_SIZE = 5
+RECENT_ACTIVITY_SIZE = 10
+
+
+def widget_data(user, school_year, name):
+    """
+    Return (data, compute_seconds) for a dashboard widget; compute_seconds
+    is None when the data came from the cache. Raises KeyError for an
+    unknown widget.
+    """
+    build = WIDGETS[name]
+    if name in UNCACHED_WIDGETS:
+        started = time.perf_counter()
+        return build(user, school_year), time.perf_counter() - started
+
+    timing = {}
+
+    def compute():
+        started = time.perf_counter()
+        data = build(user, school_year)
+        timing['seconds'] = time.perf_counter() - started
+        return data
+
+    data = get_or_compute(user, f"dashboard:{name}:{school_year}", compute)
+    return data, timing.get('seconds')
+
+
+def stats(user, school_year):
+    """Stat cards, attendance breakdown and classes-by-semester chart"""
+    classes = Class.objects.filter(instructor=user, school_year=school_year)
+    attendance = Attendance.objects.filter(class_obj__instructor=user, class_obj__school_year=school_year)
+
+    class_distribution = list(classes.values('semester').annotate(count=Count('id')).order_by('semester'))
+
+    status_counts = attendance.aggregate(
+        total=Count('id'),
+        present=Count('id', filter=Q(status='Present')),
+        absent=Count('id', filter=Q(status='Absent')),
+        late=Count('id', filter=Q(status='Late')),
+        excused=Count('id', filter=Q(status='Excused')),
+    )
+    total_attendance = status_counts['total']
+    attendance_percentage = (status_counts['present'] / total_attendance * 100) if total_attendance > 0 else 0
+
+    return {
+        'total_classes': sum(row['count'] for row in class_distribution),
+        'total_students': Student.objects.filter(
+            class_obj__instructor=user, class_obj__school_year=school_year
+        ).distinct().count(),
+        'pending_grades': GradeSummary.objects.filter(
+            class_obj__instructor=user, class_obj__school_year=school_year, is_locked=False
+        ).count(),
+        'total_attendance_records': total_attendance,
+        'present_count': status_counts['present'],
+        'absent_count': status_counts['absent'],
+        'late_count': status_counts['late'],
+        'excused_count': status_counts['excused'],
+        'attendance_percentage': round(attendance_percentage, 2),
+        'class_distribution': class_distribution,
+    }
+
+
+def top_students(user, school_year):
+    return {'rows': [
+        {
+            'student': {'first_name': g.student.first_name, 'last_name': g.student.last_name},
+            'class_obj': {'class_name': g.class_obj.class_name},
+            'final_grade': g.final_grade,
+            'remarks': g.remarks,
+        }
+        for g in GradeSummary.objects.filter(class_obj__instructor=user, class_obj__school_year=school_year)
+        .select_related('student', 'class_obj')
+        .order_by('-final_grade')[:TOP_STUDENTS_SIZE]
+    ]}
+
+
+def recent_classes(user, school_year):
+    return {'rows': [
+        {'class_name': c.class_name, 'subject': c.subject, 'section': c.section}
+        for c in Class.objects.filter(instructor=user, school_year=school_year).order_by('-id')[:RECENT_CLASSES_SIZE]
+    ]}
+
+
+def recent_activity(user, school_year):
+    """Latest activity log entries (not cached: every logged action changes it)"""
+    return {'rows': [
+        {
+            'action': a.action,
+            'description': a.description,
+            'timestamp': a.timestamp.isoformat(),
+            'timesince': timesince(a.timestamp),
+        }
+        for a in ActivityLog.objects.filter(user=user)[:RECENT_ACTIVITY_SIZE]
+    ]}
+
+
+def dropping_list(user, school_year):
+    """Students with the highest absence rates above DROPPING_ABSENCE_RATE, from one grouped query"""
+    rates = []
+    per_student = (
+        Attendance.objects.filter(class_obj__instructor=user, class_obj__school_year=school_year)
+        .values('student_id', 'class_obj_id')
+        .annotate(total=Count('id'), absent=Count('id', filter=Q(status='Absent')))
+    )
+    for row in per_student:
+        absence_rate = row['absent'] / row['total'] * 100
+        if absence_rate > DROPPING_ABSENCE_RATE:
+            rates.append((absence_rate, row['student_id'], row['class_obj_id']))
+    rates.sort(key=lambda r: r[0], reverse=True)
+    rates = rates[:DROPPING_LIST_SIZE]
+    if not rates:
+        return {'rows': []}
+
+    students = Student.objects.in_bulk([student_id for _, student_id, _ in rates])
+    classes = Class.objects.in_bulk([class_id for _, _, class_id in rates])
+    return {'rows': [
+        {
+            'student': {'first_name': students[student_id].first_name, 'last_name': students[student_id].last_name},
+            'class': {'class_name': classes[class_id].class_name},
+            'absence_rate': round(absence_rate, 2),
+        }
+        for absence_rate, student_id, class_id in rates
+        if student_id in students and class_id in classes
+    ]}
+
+
+WIDGETS = {
+    'stats': stats,
+    'top-students': top_students,
+    'dropping-list': dropping_list,
+    'recent-classes': recent_classes,
+    'recent-activity': recent_activity,
+}
+UNCACHED_WIDGETS = {'recent-activity'}
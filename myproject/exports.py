@@ -0,0 +1,117 @@
+"""
+Full and incremental ("since cursor") data export for export_all_data.
+
+A cursor is the UTC time an export started, minus a small overlap so rows
+committed by transactions still in flight at that moment are picked up by
+the next export. Rows may therefore appear in two consecutive exports;
+consumers should upsert by the natural keys (Student ID, dates, item names).
+Deleted rows are not reported.
+
+Rows are streamed with QuerySet.iterator(), EXPORT_CHUNK_SIZE at a time:
+on PostgreSQL that is a server-side cursor, so a large export never holds
+every model instance of a table in memory at once.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+import openpyxl
+from openpyxl.styles import Font
+
+from .models import Attendance, Class, GradeSummary, Student, StudentScore
+
+CURSOR_OVERLAP = timedelta(seconds=5)
+CURSOR_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def format_cursor(value):
+    return value.astimezone(dt_timezone.utc).strftime(CURSOR_FORMAT)
+
+
+def parse_cursor(value):
+    """Return an aware datetime for a cursor string, or raise ValueError"""
+    parsed = parse_datetime(value or '')
+    if parsed is None:
+        raise ValueError(f"Invalid export cursor: {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _sheet(wb, title, headers, rows, first=False):
+    ws = wb.active if first else wb.create_sheet(title)
+    ws.title = title
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = Font(bold=True)
+    for row, values in enumerate(rows, 2):
+        for col, value in enumerate(values, 1):
+            ws.cell(row=row, column=col, value=value)
+
+
+def _stamp(value):
+    return format_cursor(value) if value else ''
+
+
+def build_data_export(user, since=None):
+    """
+    Build the export workbook for an instructor.
+
+    With since=None every row is exported; otherwise only rows created or
+    changed after the cursor. Returns (workbook, next_cursor).
+    """
+    next_cursor = format_cursor(timezone.now() - CURSOR_OVERLAP)
+    changed = {'updated_at__gt': since} if since else {}
+    chunk_size = settings.EXPORT_CHUNK_SIZE
+
+    classes = Class.objects.filter(instructor=user, **changed).order_by('id')
+    students = (
+        Student.objects.filter(class_obj__instructor=user, **changed)
+        .select_related('class_obj')
+        .order_by('id')
+    )
+    attendance = (
+        Attendance.objects.filter(class_obj__instructor=user, **changed)
+        .select_related('student', 'class_obj')
+        .order_by('id')
+    )
+    scores = (
+        StudentScore.objects.filter(item__category__class_obj__instructor=user, **changed)
+        .select_related('student', 'item__category__class_obj')
+        .order_by('id')
+    )
+    grades = (
+        GradeSummary.objects.filter(class_obj__instructor=user, **changed)
+        .select_related('student', 'class_obj')
+        .order_by('id')
+    )
+
+    wb = openpyxl.Workbook()
+    _sheet(wb, "Classes", ['Program', 'Subject', 'Year Level', 'Section', 'Semester', 'School Year', 'Updated At'], (
+        (c.program, c.subject, c.year_level, c.section, c.semester, c.school_year, _stamp(c.updated_at))
+        for c in classes.iterator(chunk_size=chunk_size)
+    ), first=True)
+    _sheet(wb, "Students", ['Student ID', 'Last Name', 'First Name', 'Middle Initial', 'Program', 'Year Level', 'Section', 'Class', 'Updated At'], (
+        (s.student_id, s.last_name, s.first_name, s.middle_initial or '', s.program, s.year_level,
+         s.section, s.class_obj.program, _stamp(s.updated_at))
+        for s in students.iterator(chunk_size=chunk_size)
+    ))
+    _sheet(wb, "Attendance", ['Student ID', 'Student Name', 'Class', 'Date', 'Status', 'Updated At'], (
+        (a.student.student_id, a.student.display_name, a.class_obj.program, a.date, a.status, _stamp(a.updated_at))
+        for a in attendance.iterator(chunk_size=chunk_size)
+    ))
+    _sheet(wb, "Scores", ['Student ID', 'Student Name', 'Class', 'Category', 'Item', 'Total Items', 'Score', 'Updated At'], (
+        (s.student.student_id, s.student.display_name, s.item.category.class_obj.program, s.item.category.name,
+         s.item.item_name, s.item.total_items, s.score_percentage, _stamp(s.updated_at))
+        for s in scores.iterator(chunk_size=chunk_size)
+    ))
+    _sheet(wb, "Grades", ['Student ID', 'Student Name', 'Class', 'Final Grade', 'Equivalent Grade', 'Remarks', 'Updated At'], (
+        (g.student.student_id, g.student.display_name, g.class_obj.program, f"{g.final_grade:.2f}%",
+         g.equivalent_grade or '-', g.remarks, _stamp(g.updated_at))
+        for g in grades.iterator(chunk_size=chunk_size)
+    ))
+    _sheet(wb, "Export Info", ['Mode', 'Since', 'Next Cursor'], [
+        ('incremental' if since else 'full', format_cursor(since) if since else '', next_cursor),
+    ])
+    return wb, next_cursor
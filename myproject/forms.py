@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
 from .models import User, Class, Student, Attendance, Score, GradeCalculationSettings
+from .preferences import get_user_setting
 import re  # ✅ Regex import
 
 class RegisterForm(forms.ModelForm):
@@ -136,7 +137,7 @@ class ClassForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         if user and not self.instance.pk:  # Only for new classes
             try:
-                user_setting = user.app_setting
+                user_setting = get_user_setting(user)
                 self.fields['school_year'].initial = user_setting.school_year
             except:
                 pass
@@ -0,0 +1,117 @@
+"""
+Final grade computation shared by grades_panel and the bulk score import.
+
+recompute_grade_summaries() replaces the per-student / per-item query loop:
+categories, items and scores are read in three queries, every student's
+weighted average is computed in memory and the GradeSummary rows are
+written back with one bulk_create and one bulk_update.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import GradeCalculationSettings, GradeCategory, GradeItem, GradeSummary, Student, StudentScore
+from .signals import mark_class_changed
+
+DEFAULT_PASSING_GRADE = 75.0
+
+# (min %, max %, equivalent) on the 1.0-5.0 scale, checked after rounding
+FINAL_GRADE_SCALE = [
+    (90, 100, 1.0), (89, 89, 1.1), (88, 88, 1.2), (87, 87, 1.3), (86, 86, 1.4),
+    (85, 85, 1.5), (84, 84, 1.6), (83, 83, 1.7), (82, 82, 1.8), (81, 81, 1.9),
+    (80, 80, 2.0), (79, 79, 2.1), (78, 78, 2.2), (77, 77, 2.3), (76, 76, 2.4),
+    (75, 75, 2.5), (74, 74, 2.6), (73, 73, 2.7), (72, 72, 2.8), (71, 71, 2.9),
+    (70, 70, 3.0), (69, 69, 3.1), (68, 68, 3.2), (67, 67, 3.3), (66, 66, 3.4),
+    (65, 65, 3.5), (64, 64, 3.6), (63, 63, 3.7), (62, 62, 3.8), (61, 61, 3.9),
+    (60, 60, 4.0), (59, 59, 4.1), (58, 58, 4.2), (57, 57, 4.3), (56, 56, 4.4),
+    (55, 55, 4.5), (54, 54, 4.6), (53, 53, 4.7), (52, 52, 4.8), (0, 51, 4.9),
+]
+
+
+class InvalidCategoryWeights(ValueError):
+    pass
+
+
+def get_final_equivalent_grade(percentage):
+    """Convert final grade percentage to equivalent grade (1.0-5.0 scale)"""
+    percentage = round(percentage)  # Round to nearest integer
+    for min_pct, max_pct, equiv in FINAL_GRADE_SCALE:
+        if min_pct <= percentage <= max_pct:
+            return equiv
+    return 5.0  # Default for very low scores
+
+
+def recompute_grade_summaries(class_obj):
+    """
+    Recompute every student's GradeSummary for class_obj.
+
+    Each item counts as its score / total_items percentage (0 when missing),
+    a category is the average of its items and the final grade is the
+    weighted sum of categories. Raises InvalidCategoryWeights unless the
+    category weights add up to 100%. Returns the number of summaries written.
+    """
+    categories = list(GradeCategory.objects.filter(class_obj=class_obj))
+    total_percentage = sum(c.percentage for c in categories)
+    if abs(total_percentage - 100.0) > 0.001:
+        raise InvalidCategoryWeights("Total category percentage must equal 100%.")
+
+    try:
+        passing_threshold = class_obj.grade_settings.passing_grade
+    except GradeCalculationSettings.DoesNotExist:
+        passing_threshold = DEFAULT_PASSING_GRADE
+
+    items_by_category = defaultdict(list)
+    for item in GradeItem.objects.filter(category__class_obj=class_obj).only("id", "category_id", "total_items"):
+        items_by_category[item.category_id].append(item)
+
+    scores = defaultdict(dict)
+    for student_id, item_id, score in StudentScore.objects.filter(
+        item__category__class_obj=class_obj
+    ).values_list("student_id", "item_id", "score_percentage"):
+        scores[student_id][item_id] = score
+
+    existing = {}
+    for summary in GradeSummary.objects.filter(class_obj=class_obj).order_by("id"):
+        existing.setdefault(summary.student_id, summary)
+
+    now = timezone.now()
+    to_create, to_update = [], []
+    for student_id in Student.objects.filter(class_obj=class_obj).values_list("id", flat=True):
+        student_scores = scores.get(student_id, {})
+        final_percentage = 0.0
+        for category in categories:
+            items = items_by_category.get(category.id, [])
+            item_percentages = [
+                (student_scores[item.id] / item.total_items) * 100
+                if item.id in student_scores and item.total_items > 0 else 0.0
+                for item in items
+            ]
+            category_average = sum(item_percentages) / len(item_percentages) if item_percentages else 0.0
+            final_percentage += category_average * (category.percentage / 100)
+
+        final_percentage = round(final_percentage, 2)
+        values = {
+            "final_grade": final_percentage,
+            "equivalent_grade": get_final_equivalent_grade(final_percentage),
+            "remarks": "Passed" if final_percentage >= passing_threshold else "Failed",
+            "is_locked": False,
+        }
+        summary = existing.get(student_id)
+        if summary is None:
+            to_create.append(GradeSummary(student_id=student_id, class_obj=class_obj, **values))
+            continue
+        for field, value in values.items():
+            setattr(summary, field, value)
+        summary.updated_at = now
+        to_update.append(summary)
+
+    with transaction.atomic():
+        GradeSummary.objects.bulk_create(to_create, batch_size=500)
+        GradeSummary.objects.bulk_update(
+            to_update, ["final_grade", "equivalent_grade", "remarks", "is_locked", "updated_at"], batch_size=500
+        )
+        if to_create or to_update:
+            # Bulk writes bypass the post_save handlers
+            mark_class_changed(class_obj.id)
+    return len(to_create) + len(to_update)
@@ -0,0 +1,540 @@
+"""
+Student roster, gradebook score and attendance log import pipelines.
+
+Uploads are read as a stream of rows, normalized and validated in batches,
+and each batch is diffed against the stored rows with one student_id lookup
+(unchanged rows are detected by content hash and skipped), then applied with
+bulk_create / bulk_update. Roster batches are committed by the background
+jobs in jobs.py; score and attendance log imports write in a single
+transaction each (import_scores, import_attendance_logs). Every write goes
+through writes.run_write(), which retries it on a locked database.
+"""
+import codecs
+import csv
+import itertools
+import zipfile
+from datetime import date, datetime
+
+import chardet
+import openpyxl
+from openpyxl.utils.exceptions import InvalidFileException
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .grading import InvalidCategoryWeights, recompute_grade_summaries
+from .models import Attendance, GradeItem, Student, StudentScore, student_content_hash
+from .search import index_students
+from .signals import mark_class_changed
+from .writes import run_write
+
+REQUIRED_HEADERS = [
+    "code", "last name", "first name", "middle name",
+    "sex", "course", "year", "units", "section"
+]
+
+# Allowed variations (in case CSV uses 'middlename' instead of 'middle name')
+HEADER_ALIASES = {
+    "middlename": "middle name",
+    "middle": "middle name",
+    "middle initial": "middle name",
+}
+
+# Student field -> roster column
+FIELD_COLUMNS = {
+    "student_id": "code",
+    "last_name": "last name",
+    "first_name": "first name",
+    "middle_initial": "middle name",
+    "program": "course",
+    "year_level": "year",
+    "section": "section",
+}
+REQUIRED_FIELDS = ("student_id", "last_name", "first_name")
+UPDATE_FIELDS = [f for f in FIELD_COLUMNS if f != "student_id"] + ["class_obj", "content_hash", "updated_at"]
+
+BATCH_SIZE = 500
+SNIFF_BYTES = 64 * 1024
+FALLBACK_ENCODING = "cp1252"
+
+
+def normalize_headers(headers):
+    normalized = [str(h or "").strip().lower().replace("_", " ") for h in headers]
+    return [HEADER_ALIASES.get(h, h) for h in normalized]
+
+
+def header_problems(headers):
+    """Return (missing, unexpected) header names for a normalized header row"""
+    missing = [h for h in REQUIRED_HEADERS if h not in headers]
+    unexpected = [h for h in headers if h and h not in REQUIRED_HEADERS]
+    return missing, unexpected
+
+
+def clean_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def normalize_student_row(headers, row):
+    """Map a raw roster row onto Student field values, or raise ValueError"""
+    data = dict(zip(headers, row))
+    values = {field: clean_value(data.get(column)) for field, column in FIELD_COLUMNS.items()}
+
+    for field in REQUIRED_FIELDS:
+        if not values[field]:
+            raise ValueError(f"Missing {FIELD_COLUMNS[field]}")
+    for field, value in values.items():
+        max_length = Student._meta.get_field(field).max_length
+        if max_length and len(value) > max_length:
+            raise ValueError(f"{FIELD_COLUMNS[field].title()} is longer than {max_length} characters")
+    return values
+
+
+def iter_normalized_batches(headers, rows, batch_size=BATCH_SIZE, first_row=2):
+    """
+    Yield batches of normalized roster rows.
+
+    Each batch is a list of (row_number, values, error) where exactly one of
+    values (Student field dict) and error (message) is set. Blank rows are
+    dropped. Row numbers are spreadsheet row numbers (the header is row 1).
+    """
+    batch = []
+    for row_number, row in enumerate(rows, first_row):
+        if not any(row):
+            continue
+        try:
+            batch.append((row_number, normalize_student_row(headers, row), None))
+        except ValueError as e:
+            batch.append((row_number, {"student_id": clean_value(dict(zip(headers, row)).get("code"))}, str(e)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def apply_student_batch(class_obj, batch, seen_codes, result, dry_run=False):
+    """
+    Diff one normalized batch against the database and write what changed.
+
+    Existing students are fetched with one query; a row whose content hash
+    matches the stored Student.content_hash is left untouched, new rows are
+    bulk-created and changed rows bulk-updated. With dry_run nothing is
+    written. seen_codes tracks codes already seen in this file so duplicates
+    in later batches are reported. result ({'created', 'updated',
+    'unchanged', 'errors', 'inserted_rows', 'changed_rows'}) is updated in
+    place.
+    """
+    records = {}
+    for row_number, values, error in batch:
+        code = values["student_id"]
+        if error is None and (code in seen_codes or code in records):
+            error = "Duplicate code in file"
+        if error:
+            result["errors"].append({"row": row_number, "code": code, "message": error})
+            continue
+        records[code] = (row_number, values)
+    seen_codes.update(records)
+
+    existing = Student.objects.in_bulk(list(records), field_name="student_id")
+    previous_classes = set()
+    now = timezone.now()
+    to_create, to_update = [], []
+    for code, (row_number, values) in records.items():
+        content_hash = student_content_hash(dict(values, class_obj_id=class_obj.id))
+        student = existing.get(code)
+        if student is None:
+            to_create.append(Student(class_obj=class_obj, content_hash=content_hash, **values))
+            result["inserted_rows"].append({"row": row_number, "code": code})
+            continue
+        if student.content_hash == content_hash:
+            result["unchanged"] += 1
+            continue
+
+        changed = [field for field, value in values.items() if (getattr(student, field) or "") != value]
+        if student.class_obj_id != class_obj.id:
+            changed.append("class")
+        result["changed_rows"].append({"row": row_number, "code": code, "fields": changed})
+        previous_classes.add(student.class_obj_id)
+        for field, value in values.items():
+            setattr(student, field, value)
+        student.class_obj = class_obj
+        student.content_hash = content_hash
+        student.updated_at = now
+        to_update.append(student)
+
+    result["created"] += len(to_create)
+    result["updated"] += len(to_update)
+    if dry_run:
+        return
+
+    Student.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+    Student.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=BATCH_SIZE)
+    if to_create or to_update:
+        # Bulk writes bypass the post_save handlers
+        mark_class_changed(class_obj.id, *previous_classes)
+        index_students(to_create + to_update)
+
+
+# -----------------------------
+# Streaming file readers
+# -----------------------------
+class UnsupportedFileType(ValueError):
+    pass
+
+
+def detect_encoding(sample):
+    """Pick a text encoding from the first chunk of an upload"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False tolerates a multi-byte character cut at the chunk boundary
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    guess = chardet.detect(sample)
+    if guess["encoding"] and guess["confidence"] >= 0.5:
+        return guess["encoding"]
+    # Short Latin-script rosters rarely give chardet enough signal; they are
+    # almost always Excel "CSV" exports in the Windows code page
+    return FALLBACK_ENCODING
+
+
+def _iter_text_lines(chunks, encoding):
+    """Decode byte chunks incrementally into newline-terminated lines"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ""
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def iter_csv_rows(uploaded_file):
+    chunks = iter(uploaded_file.chunks(chunk_size=SNIFF_BYTES))
+    first = next(chunks, b"")
+    encoding = detect_encoding(first)
+    yield from csv.reader(_iter_text_lines(itertools.chain([first], chunks), encoding))
+
+
+def iter_xlsx_rows(uploaded_file):
+    """Rows of the first sheet; a corrupt or non-workbook file raises ValueError"""
+    try:
+        wb = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError, OSError) as e:
+        raise ValueError(f"the file is not a valid .xlsx workbook ({e})")
+    try:
+        yield from wb.active.iter_rows(values_only=True)
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ValueError(f"the workbook is damaged ({e})")
+    finally:
+        wb.close()
+
+
+def iter_upload_rows(uploaded_file):
+    """
+    Yield the raw rows (header row first) of a CSV or XLSX upload.
+
+    Nothing is materialized: CSV is decoded chunk by chunk and workbooks are
+    opened in openpyxl's read-only mode.
+    """
+    ext = uploaded_file.name.split(".")[-1].lower()
+    if ext == "csv":
+        yield from iter_csv_rows(uploaded_file)
+    elif ext == "xlsx":
+        yield from iter_xlsx_rows(uploaded_file)
+    elif ext == "xls":
+        # openpyxl reads only the Office Open XML formats
+        raise UnsupportedFileType("Legacy .xls files are not supported. Please save the sheet as .xlsx or .csv.")
+    else:
+        raise UnsupportedFileType("Unsupported file type. Please upload a .csv or .xlsx file.")
+
+
+# -----------------------------
+# Gradebook score import
+# -----------------------------
+# Headers that identify the student column; the first column is used otherwise
+STUDENT_CODE_HEADERS = {"code", "student id", "student code", "id number", "id"}
+# Descriptive columns that are never treated as grade items
+SCORE_IGNORED_HEADERS = set(REQUIRED_HEADERS) | {"name", "student name", "full name"}
+DEFAULT_TOTAL_ITEMS = 100
+
+
+def score_columns(headers):
+    """
+    Split a score sheet header row into the student code column index and
+    [(column index, item name)] for every grade item column.
+    """
+    normalized = normalize_headers(headers)
+    code_index = next((i for i, h in enumerate(normalized) if h in STUDENT_CODE_HEADERS), 0)
+    items = [
+        (i, clean_value(header))
+        for i, (header, name) in enumerate(zip(headers, normalized))
+        if i != code_index and name and name not in SCORE_IGNORED_HEADERS
+    ]
+    return code_index, items
+
+
+def _parse_score(value, item_name, total_items):
+    if isinstance(value, (int, float)):
+        score = float(value)
+    else:
+        try:
+            score = float(clean_value(value))
+        except ValueError:
+            raise ValueError(f"{item_name}: '{clean_value(value)}' is not a number")
+    if score < 0:
+        raise ValueError(f"{item_name}: score cannot be negative")
+    if total_items and score > total_items:
+        raise ValueError(f"{item_name}: score {score:g} is above the total of {total_items}")
+    return score
+
+
+def import_scores(class_obj, category, uploaded_file, total_items=DEFAULT_TOTAL_ITEMS):
+    """
+    Import a gradebook sheet (student codes as rows, GradeItem names as columns).
+
+    Item columns missing from category are created with total_items. The
+    class roster is mapped with one query and the whole sheet is parsed
+    first; the scores are then upserted on (student, item) in batches inside
+    one transaction (retried on a locked database), and every GradeSummary
+    of the class is recomputed once. Blank cells are left alone. Returns
+    {'scores', 'items_created', 'errors', 'recomputed', 'message'}; raises
+    UnsupportedFileType or ValueError for unreadable files.
+    """
+    result = {"scores": 0, "items_created": [], "errors": [], "recomputed": 0, "message": ""}
+    rows = iter_upload_rows(uploaded_file)
+    try:
+        headers = list(next(rows, None) or [])
+        code_index, columns = score_columns(headers)
+        if not columns:
+            raise ValueError("No grade item columns found next to the student code column.")
+        names = [name for _, name in columns]
+        duplicated = sorted({n for n in names if names.count(n) > 1})
+        if duplicated:
+            raise ValueError(f"Duplicate item columns: {', '.join(duplicated)}")
+
+        students = dict(Student.objects.filter(class_obj=class_obj).values_list("student_id", "id"))
+        existing = {item.item_name.lower(): item for item in GradeItem.objects.filter(category=category)}
+        # (column index, item name, total items) as the item will be once created
+        column_items = []
+        for index, name in columns:
+            item = existing.get(name.lower())
+            column_items.append((index, item.item_name, item.total_items) if item else (index, name, total_items))
+
+        # (student pk, item name, score)
+        scores = []
+        seen_codes = set()
+        for row_number, row in enumerate(rows, 2):
+            if not row or not any(row):
+                continue
+            code = clean_value(row[code_index]) if len(row) > code_index else ""
+            error = None
+            if not code:
+                error = "Missing student code"
+            elif code not in students:
+                error = "Student is not enrolled in this class"
+            elif code in seen_codes:
+                error = "Duplicate code in file"
+            if error:
+                result["errors"].append({"row": row_number, "code": code, "message": error})
+                continue
+            seen_codes.add(code)
+
+            for index, item_name, item_total in column_items:
+                value = row[index] if len(row) > index else None
+                if clean_value(value) == "":
+                    continue
+                try:
+                    score = _parse_score(value, item_name, item_total)
+                except ValueError as e:
+                    result["errors"].append({"row": row_number, "code": code, "message": str(e)})
+                    continue
+                scores.append((students[code], item_name, score))
+    finally:
+        rows.close()
+
+    result["items_created"], result["scores"] = run_write(
+        "import_scores", _write_scores, class_obj, category, names, scores, total_items
+    )
+    try:
+        result["recomputed"] = run_write("compute_final", recompute_grade_summaries, class_obj)
+    except InvalidCategoryWeights as e:
+        result["message"] = f"Final grades were not recomputed: {e}"
+    return result
+
+
+def _write_scores(class_obj, category, names, scores, total_items):
+    """Create the missing items and upsert scores; returns (created item names, scores written)"""
+    items = {item.item_name.lower(): item for item in GradeItem.objects.filter(category=category)}
+    created = []
+    for name in names:
+        if name.lower() not in items:
+            items[name.lower()] = GradeItem.objects.create(category=category, item_name=name, total_items=total_items)
+            created.append(name)
+    written = upsert_scores([
+        StudentScore(student_id=student_pk, item=items[item_name.lower()], score_percentage=score)
+        for student_pk, item_name, score in scores
+    ])
+    if written:
+        # Bulk writes bypass the post_save handlers
+        mark_class_changed(class_obj.id)
+    return created, written
+
+
+def upsert_scores(scores):
+    """Insert or update StudentScore rows on (student, item); returns how many were written"""
+    if not scores:
+        return 0
+    now = timezone.now()
+    for score in scores:
+        score.updated_at = now
+    StudentScore.objects.bulk_create(
+        scores,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["student", "item"],
+        update_fields=["score_percentage", "updated_at"],
+    )
+    return len(scores)
+
+# -----------------------------
+# Attendance log import
+# -----------------------------
+TIMESTAMP_HEADERS = {"timestamp", "time", "date time", "datetime", "check in", "checked in", "time in", "scanned at"}
+TIMESTAMP_FORMATS = [
+    "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%m/%d/%Y %I:%M:%S %p", "%m/%d/%Y %I:%M %p",
+    "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%d-%b-%Y %H:%M:%S", "%d-%b-%Y %H:%M",
+]
+
+
+def log_columns(headers):
+    """Return the (student code, timestamp) column indexes of a check-in log header row"""
+    normalized = normalize_headers(headers)
+    code_index = next((i for i, h in enumerate(normalized) if h in STUDENT_CODE_HEADERS), 0)
+    time_index = next((i for i, h in enumerate(normalized) if h in TIMESTAMP_HEADERS), None)
+    if time_index is None:
+        time_index = 1 if code_index == 0 else 0
+    return code_index, time_index
+
+
+def parse_timestamp(value):
+    """Return a naive local datetime for a log cell, or raise ValueError"""
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, date):
+        raise ValueError("Timestamp has no time of day")
+    else:
+        text = clean_value(value)
+        parsed = parse_datetime(text.replace(" ", "T", 1)) if text else None
+        for fmt in TIMESTAMP_FORMATS:
+            if parsed is not None:
+                break
+            try:
+                parsed = datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+        if parsed is None:
+            raise ValueError(f"Unrecognized timestamp '{text}'")
+    if timezone.is_aware(parsed):
+        parsed = timezone.make_naive(parsed)
+    return parsed
+
+
+def import_attendance_logs(class_obj, uploaded_file, late_after, date_from=None, date_to=None):
+    """
+    Turn a check-in log of (student code, timestamp) rows into Attendance.
+
+    Every date on which a student of class_obj checked in is a session (the
+    optional date_from / date_to bound them). A student's first check-in of
+    the session decides Present (at or before late_after, a time) or Late;
+    enrolled students with no check-in are Absent. Records already marked
+    Excused are kept. Rows are upserted on (class_obj, student, date) in
+    batches inside one transaction (retried on a locked database). Returns
+    {'sessions', 'present', 'late', 'absent', 'excused', 'ignored',
+    'errors'}; raises UnsupportedFileType or ValueError for unreadable files.
+    """
+    result = {"sessions": [], "present": 0, "late": 0, "absent": 0, "excused": 0, "ignored": 0, "errors": []}
+    students = dict(Student.objects.filter(class_obj=class_obj).values_list("student_id", "id"))
+
+    # (student pk, date) -> earliest check-in time
+    first_seen = {}
+    rows = iter_upload_rows(uploaded_file)
+    try:
+        code_index, time_index = log_columns(list(next(rows, None) or []))
+        for row_number, row in enumerate(rows, 2):
+            if not row or not any(row):
+                continue
+            code = clean_value(row[code_index]) if len(row) > code_index else ""
+            student_pk = students.get(code)
+            if student_pk is None:
+                # Readers log every student in the room, not only this class
+                result["ignored"] += 1
+                continue
+            try:
+                checked_in = parse_timestamp(row[time_index] if len(row) > time_index else None)
+            except ValueError as e:
+                result["errors"].append({"row": row_number, "code": code, "message": str(e)})
+                continue
+            day = checked_in.date()
+            if (date_from and day < date_from) or (date_to and day > date_to):
+                result["ignored"] += 1
+                continue
+            key = (student_pk, day)
+            if key not in first_seen or checked_in.time() < first_seen[key]:
+                first_seen[key] = checked_in.time()
+    finally:
+        rows.close()
+
+    sessions = sorted({day for _, day in first_seen})
+    result["sessions"] = sessions
+    if not sessions:
+        return result
+
+    excused = set(
+        Attendance.objects.filter(class_obj=class_obj, date__in=sessions, status="Excused")
+        .values_list("student_id", "date")
+    )
+    now = timezone.now()
+    records = []
+    for day in sessions:
+        for student_pk in students.values():
+            if (student_pk, day) in excused:
+                result["excused"] += 1
+                continue
+            checked_in = first_seen.get((student_pk, day))
+            if checked_in is None:
+                status = "Absent"
+            elif checked_in <= late_after:
+                status = "Present"
+            else:
+                status = "Late"
+            result[status.lower()] += 1
+            records.append(Attendance(
+                class_obj=class_obj, student_id=student_pk, date=day, status=status, updated_at=now
+            ))
+
+    run_write("import_attendance", _write_attendance, class_obj, records)
+    return result
+
+
+def _write_attendance(class_obj, records):
+    for record in records:
+        # A retried attempt must not reuse ids handed out by a rolled-back insert
+        record.pk = None
+    Attendance.objects.bulk_create(
+        records,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["class_obj", "student", "date"],
+        update_fields=["status", "updated_at"],
+    )
+    # Bulk writes bypass the post_save handlers
+    mark_class_changed(class_obj.id)
@@ -0,0 +1,233 @@
+"""
+Background roster import jobs.
+
+The upload request only stores the file and an ImportJob row; the import
+runs on a small thread pool (or in a dedicated `manage.py run_import_jobs`
+worker). Every batch is committed together with the job's progress, so
+rows_processed is a checkpoint: a job interrupted by a restart resumes from
+the last committed batch instead of starting over. With the thread pool,
+the first request a process serves, and then one request every
+IMPORT_JOB_STALE_SECONDS, hands resume_import_jobs() to the pool, which
+picks up queued jobs and jobs whose worker died. A batch that hits a
+locked database is retried (see writes.py).
+
+A dry-run job walks the same pipeline without writing students and records
+the inserted / changed / unchanged / invalid diff; commit_dry_run() then
+queues the real import of the same file, which writes only changed rows.
+A dry run can be committed once; the files of dry runs left uncommitted
+for IMPORT_DRY_RUN_RETENTION_HOURS are deleted by expire_dry_runs(),
+which runs whenever a dry run finishes and on every run_import_jobs poll.
+"""
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .importers import (
+    apply_student_batch, iter_normalized_batches, iter_upload_rows, normalize_headers, clean_value
+)
+from .models import ImportJob
+from .writes import run_write
+
+logger = logging.getLogger(__name__)
+
+# Only the most recent problems are kept on the job row; error_count has the total
+MAX_STORED_ERRORS = 500
+# Inserted/changed rows listed in a job's diff (counts are always complete)
+MAX_DIFF_ROWS = 500
+
+_executor = None
+_resume_lock = threading.Lock()
+# monotonic time of this process's last resume pass (None: not yet)
+_last_resume = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.IMPORT_JOB_WORKERS, thread_name_prefix="import-job")
+    return _executor
+
+
+class AlreadyCommitted(Exception):
+    pass
+
+
+def commit_dry_run(job):
+    """
+    Queue the real import for a finished dry run, reusing its uploaded file.
+    Raises AlreadyCommitted if the dry run was committed before (a double
+    submit or a second tab), since both imports would share one file.
+    """
+    with transaction.atomic():
+        commit_job = ImportJob.objects.create(
+            user=job.user, class_obj=job.class_obj, file=job.file.name, original_name=job.original_name,
+        )
+        claimed = ImportJob.objects.filter(pk=job.pk, committed_job__isnull=True).update(committed_job=commit_job)
+        if not claimed:
+            # Rolls back commit_job as well
+            raise AlreadyCommitted(f"Import job {job.pk} has already been committed")
+        enqueue_import_job(commit_job)
+    job.committed_job = commit_job
+    return commit_job
+
+
+def expire_dry_runs():
+    """Delete the files of finished dry runs that were not committed in time; returns how many"""
+    cutoff = timezone.now() - timedelta(hours=settings.IMPORT_DRY_RUN_RETENTION_HOURS)
+    expired = ImportJob.objects.filter(
+        dry_run=True, committed_job__isnull=True, status__in=("completed", "failed"), finished_at__lt=cutoff,
+    ).exclude(file="")
+    count = 0
+    for job in expired:
+        job.file.delete(save=False)
+        # Also makes the preview uncommittable
+        ImportJob.objects.filter(pk=job.pk).update(file="")
+        count += 1
+    return count
+
+
+def enqueue_import_job(job):
+    """Start job once the surrounding transaction has committed"""
+    if settings.IMPORT_JOBS_ASYNC:
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, run_import_job, job.pk))
+    else:
+        transaction.on_commit(lambda: run_import_job(job.pk))
+
+
+def _run_in_thread(fn, *args):
+    close_old_connections()
+    try:
+        fn(*args)
+    except Exception:
+        logger.exception("Import job task %s failed", fn.__name__)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id):
+    """Atomically take ownership of a queued job or of a running job whose worker died"""
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    claimed = ImportJob.objects.filter(pk=job_id, status="queued").update(
+        status="running", started_at=now, updated_at=now
+    )
+    if not claimed:
+        claimed = ImportJob.objects.filter(pk=job_id, status="running", updated_at__lt=stale_before).update(
+            updated_at=now
+        )
+    return bool(claimed)
+
+
+def run_import_job(job_id):
+    """Process (or resume) one import job; returns False if another worker owns it"""
+    if not claim_job(job_id):
+        return False
+    job = ImportJob.objects.select_related("class_obj").get(pk=job_id)
+    try:
+        _process(job)
+    except Exception as e:
+        logger.exception("Import job %s failed", job.pk)
+        ImportJob.objects.filter(pk=job.pk).update(
+            status="failed", message=f"Error reading file: {e}", finished_at=timezone.now()
+        )
+        return True
+
+    job.status = "completed"
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "finished_at", "updated_at"])
+    if job.dry_run:
+        # Dry runs keep the file so the previewed import can be committed
+        expire_dry_runs()
+    else:
+        job.file.delete(save=False)
+    return True
+
+
+def _process(job):
+    with job.file.open("rb") as f:
+        rows = iter_upload_rows(f)
+        headers = normalize_headers(next(rows))
+
+        # Resume after the last committed batch; codes already imported are
+        # remembered so duplicates later in the file are still reported
+        seen_codes = set()
+        code_index = headers.index("code")
+        for row in itertools.islice(rows, job.rows_processed):
+            if row and len(row) > code_index:
+                seen_codes.add(clean_value(row[code_index]))
+        seen_codes.discard("")
+
+        batches = iter_normalized_batches(
+            headers, rows, batch_size=settings.IMPORT_JOB_BATCH_SIZE, first_row=job.rows_processed + 2
+        )
+        for batch in batches:
+            fields, seen_codes = run_write("import_job", _commit_batch, job, batch, seen_codes)
+            for name, value in fields.items():
+                setattr(job, name, value)
+
+
+def _commit_batch(job, batch, seen_codes):
+    """
+    Apply one batch and checkpoint the job in the same transaction. The
+    job and seen_codes are left untouched so a retried attempt starts over;
+    returns the job's new field values and the codes seen so far.
+    """
+    seen_codes = set(seen_codes)
+    result = {
+        "created": 0, "updated": 0, "unchanged": 0, "errors": [],
+        "inserted_rows": [], "changed_rows": [],
+    }
+    apply_student_batch(job.class_obj, batch, seen_codes, result, dry_run=job.dry_run)
+    fields = {
+        "rows_processed": batch[-1][0] - 1,
+        "created_count": job.created_count + result["created"],
+        "updated_count": job.updated_count + result["updated"],
+        "unchanged_count": job.unchanged_count + result["unchanged"],
+        "error_count": job.error_count + len(result["errors"]),
+        "errors": (job.errors + result["errors"])[-MAX_STORED_ERRORS:],
+        "diff": {
+            "inserted": (job.diff.get("inserted", []) + result["inserted_rows"])[:MAX_DIFF_ROWS],
+            "changed": (job.diff.get("changed", []) + result["changed_rows"])[:MAX_DIFF_ROWS],
+        },
+    }
+    ImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now(), **fields)
+    return fields, seen_codes
+
+
+def resumable_jobs():
+    stale_before = timezone.now() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    return ImportJob.objects.filter(status="queued") | ImportJob.objects.filter(
+        status="running", updated_at__lt=stale_before
+    )
+
+
+def resume_import_jobs():
+    """Run every queued or abandoned job, oldest first; returns the ids this call processed"""
+    processed = []
+    for job_id in resumable_jobs().order_by("created_at").values_list("pk", flat=True):
+        if run_import_job(job_id):
+            processed.append(job_id)
+    return processed
+
+
+def _resume_on_request(sender, **kwargs):
+    global _last_resume
+    if not settings.IMPORT_JOBS_ASYNC:
+        return
+    now = time.monotonic()
+    with _resume_lock:
+        if _last_resume is not None and now - _last_resume < settings.IMPORT_JOB_STALE_SECONDS:
+            return
+        _last_resume = now
+    _get_executor().submit(_run_in_thread, resume_import_jobs)
+
+
+request_started.connect(_resume_on_request, dispatch_uid="import_jobs_resume")
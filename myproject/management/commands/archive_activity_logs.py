@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from myproject.activity import flush_activity_log
+from myproject.archive import archive_activities
+
+
+class Command(BaseCommand):
+    help = "Move activity log entries past the retention horizon into gzipped monthly archives"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=settings.ACTIVITY_LOG_RETENTION_DAYS,
+            help="Archive entries older than this many days (default: ACTIVITY_LOG_RETENTION_DAYS)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows read, and deleted, per chunk")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be archived without writing")
+
+    def handle(self, *args, **options):
+        flush_activity_log()
+        before = timezone.now() - timedelta(days=options["days"])
+        totals = archive_activities(before, batch_size=options["batch_size"], dry_run=options["dry_run"])
+        verb = "Would archive" if options["dry_run"] else "Archived"
+        for (user_id, month), count in sorted(totals.items()):
+            self.stdout.write(f"{verb} {count} entries for user {user_id} in {month}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {sum(totals.values())} activity log entries older than {before:%Y-%m-%d}"
+        ))
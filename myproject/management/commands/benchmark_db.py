@@ -0,0 +1,182 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+from myproject.exports import build_data_export
+from myproject.grading import recompute_grade_summaries
+from myproject.importers import upsert_scores
+from myproject.models import Attendance, Class, GradeCategory, GradeItem, Student, StudentScore, User
+from myproject.reports import attendance_counts, summary_rows
+from myproject.signals import mark_class_changed
+from myproject.writes import reset_write_stats, run_write, write_stats
+
+ITEMS_PER_CLASS = 5
+ATTENDANCE_DAYS = 10
+STATUSES = ("Present", "Absent", "Late", "Excused")
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency benchmark through the ORM against the configured default database "
+        "(DATABASE_URL, e.g. a local PostgreSQL): gradebook score saves, attendance saves and "
+        "final grade computation against report reads and full exports. Runs in a throwaway "
+        "test database that is created and dropped (for SQLite files, benchmark_sqlite is closer to production)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=10.0, help="Duration of the run")
+        parser.add_argument("--writers", type=int, default=4, help="Threads saving scores and attendance")
+        parser.add_argument("--readers", type=int, default=4, help="Threads running reports and exports")
+        parser.add_argument("--classes", type=int, default=4)
+        parser.add_argument("--students", type=int, default=200, help="Students per class")
+
+    def handle(self, *args, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        database = settings.DATABASES[DEFAULT_DB_ALIAS]
+        self.stdout.write(
+            f"{connection.vendor} ({database['ENGINE']}), pool={settings.DATABASE_POOL or 'none'}, "
+            f"CONN_MAX_AGE={database.get('CONN_MAX_AGE', 0)}, "
+            f"server-side cursors={'off' if database.get('DISABLE_SERVER_SIDE_CURSORS') else 'on'}"
+        )
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            user, classes = self.seed(options["classes"], options["students"])
+            reset_write_stats()
+            results = self.run(user, classes, options["seconds"], options["writers"], options["readers"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f"{options['writers']} writers, {options['readers']} readers, {options['classes']} classes "
+            f"x {options['students']} students, {options['seconds']:g}s"
+        )
+        self.stdout.write(f"{'operation':<16}{'count':>8}{'per s':>9}{'p50':>10}{'p99':>10}{'max':>11}{'errors':>8}")
+        for name, (latencies, error_count, elapsed) in results.items():
+            ordered = sorted(latency * 1000 for latency in latencies) or [0.0]
+            self.stdout.write(
+                f"{name:<16}{len(latencies):>8}{len(latencies) / elapsed:>9.1f}{_percentile(ordered, 0.5):>8.2f}ms"
+                f"{_percentile(ordered, 0.99):>8.2f}ms{ordered[-1]:>9.2f}ms{error_count:>8}"
+            )
+        for name, stats in sorted(write_stats().items()):
+            self.stdout.write(
+                f"{name}: {stats['retries']} retries, {stats['failures']} failures, "
+                f"{stats['wait_seconds'] * 1000:.1f} ms waiting"
+            )
+
+    def seed(self, class_count, student_count):
+        user = User.objects.create_user(
+            username="benchmark", password="benchmark", email="benchmark@example.com", instructor_id="BENCH"
+        )
+        classes = Class.objects.bulk_create([
+            Class(instructor=user, program="BENCH", subject=f"Subject {n}", year_level="1", section=str(n),
+                  semester="1st", school_year="2024-2025")
+            for n in range(class_count)
+        ])
+        students = Student.objects.bulk_create([
+            Student(class_obj=class_obj, last_name=f"Last{n:05d}", first_name=f"First{n}",
+                    student_id=f"B{class_obj.id}-{n:05d}", program="BENCH", year_level="1",
+                    section=class_obj.section, academic_year="2024-2025")
+            for class_obj in classes for n in range(student_count)
+        ], batch_size=1000)
+        categories = GradeCategory.objects.bulk_create([
+            GradeCategory(class_obj=class_obj, name="Quizzes", percentage=100) for class_obj in classes
+        ])
+        GradeItem.objects.bulk_create([
+            GradeItem(category=category, item_name=f"Quiz {n}", total_items=20)
+            for category in categories for n in range(ITEMS_PER_CLASS)
+        ])
+        first_day = date(2024, 8, 1)
+        Attendance.objects.bulk_create([
+            Attendance(class_obj_id=student.class_obj_id, student=student,
+                       date=first_day + timedelta(days=day), status=STATUSES[(student.id + day) % 4])
+            for student in students for day in range(ATTENDANCE_DAYS)
+        ], batch_size=1000)
+        return user, classes
+
+    def run(self, user, classes, seconds, writers, readers):
+        latencies, errors = {}, {}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def timed(name, fn, *args):
+            started = time.perf_counter()
+            try:
+                fn(*args)
+            except OperationalError:
+                # A write that ran out of retries (also in write_stats()) or a refused read
+                with lock:
+                    errors[name] = errors.get(name, 0) + 1
+                return
+            with lock:
+                latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+        def save_scores(class_obj, rng):
+            items = list(GradeItem.objects.filter(category__class_obj=class_obj).values_list("id", flat=True))
+            students = list(Student.objects.filter(class_obj=class_obj).values_list("id", flat=True))
+
+            def write():
+                upsert_scores([
+                    StudentScore(student_id=student_id, item_id=rng.choice(items), score_percentage=rng.randint(0, 20))
+                    for student_id in rng.sample(students, min(30, len(students)))
+                ])
+                mark_class_changed(class_obj.id)
+            run_write("save_scores", write)
+
+        def save_attendance(class_obj, rng):
+            records = list(Attendance.objects.filter(class_obj=class_obj, date=date(2024, 8, 1) + timedelta(
+                days=rng.randrange(ATTENDANCE_DAYS))))
+            for record in records:
+                record.status = rng.choice(STATUSES)
+
+            def write():
+                Attendance.objects.bulk_update(records, ["status"], batch_size=500)
+                mark_class_changed(class_obj.id)
+            run_write("attendance", write)
+
+        def writer(worker):
+            rng = random.Random(worker)
+            operations = [("save_scores", save_scores), ("attendance", save_attendance), ("save_scores", save_scores),
+                          ("compute_final", lambda c, r: run_write("compute_final", recompute_grade_summaries, c))]
+            n = worker
+            try:
+                while time.perf_counter() < deadline:
+                    name, operation = operations[n % len(operations)]
+                    timed(name, operation, classes[n % len(classes)], rng)
+                    n += 1
+            finally:
+                connections.close_all()
+
+        def reader(worker):
+            n = worker
+            try:
+                while time.perf_counter() < deadline:
+                    class_obj = classes[n % len(classes)]
+                    if n % 10 == 9:
+                        timed("export", build_data_export, user)
+                    else:
+                        timed("report", lambda: summary_rows(class_obj, counts=attendance_counts(class_obj)))
+                    n += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {
+            name: (latencies.get(name, []), errors.get(name, 0), elapsed)
+            for name in sorted(set(latencies) | set(errors))
+        }
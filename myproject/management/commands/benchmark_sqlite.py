@@ -0,0 +1,193 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+SCHEMA = [
+    "CREATE TABLE attendance (id INTEGER PRIMARY KEY, student_id INTEGER, status TEXT)",
+    "CREATE TABLE activitylog (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, action TEXT, "
+    "description TEXT, timestamp TEXT)",
+]
+ATTENDANCE_ROWS = 5000
+STATUSES = ("Present", "Absent", "Late", "Excused")
+
+# (label, activity log in its own file, per-connection pragmas, how writers begin)
+SPLIT_SCENARIOS = [
+    ("activity log in same file", False, (), "BEGIN"),
+    ("activity log in own file", True, (), "BEGIN"),
+]
+
+
+def profile_scenarios():
+    return [
+        ("default sqlite settings", False, (), "BEGIN"),
+        ("production profile", False, tuple(settings.SQLITE_PRODUCTION_PRAGMAS), "BEGIN IMMEDIATE"),
+    ]
+
+
+def _connect(path, pragmas=()):
+    # Python's default 5 s busy timeout, as Django uses without OPTIONS
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+    for pragma in pragmas:
+        connection.execute(pragma)
+    return connection
+
+
+def _create(path, pragmas=()):
+    connection = _connect(path, pragmas)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    connection.executemany(
+        "INSERT INTO attendance (id, student_id, status) VALUES (?, ?, 'Present')",
+        [(pk, pk) for pk in range(1, ATTENDANCE_ROWS + 1)],
+    )
+    connection.close()
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _is_locked(error):
+    return "locked" in str(error) or "busy" in str(error)
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrency benchmark on scratch SQLite files: gradebook transactions, activity log "
+        "inserts and dashboard reads. Compares the activity log in the same vs its own file "
+        "(--compare split) and default vs SQLITE_PROFILE=production settings (--compare profile)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--compare", choices=["split", "profile", "all"], default="all")
+        parser.add_argument("--seconds", type=float, default=5.0, help="Duration of each scenario")
+        parser.add_argument("--writers", type=int, default=4, help="Threads running gradebook transactions")
+        parser.add_argument("--loggers", type=int, default=4, help="Threads inserting activity log rows")
+        parser.add_argument("--readers", type=int, default=2, help="Threads running dashboard queries")
+
+    def handle(self, *args, **options):
+        scenarios = []
+        if options["compare"] in ("split", "all"):
+            scenarios += SPLIT_SCENARIOS
+        if options["compare"] in ("profile", "all"):
+            scenarios += profile_scenarios()
+
+        self.stdout.write(
+            f"{options['writers']} gradebook writers, {options['loggers']} activity loggers, "
+            f"{options['readers']} dashboard readers, {options['seconds']:g}s per scenario"
+        )
+        self.stdout.write(
+            f"{'scenario':<28}{'tx/s':>9}{'tx p50':>10}{'p99':>10}{'max':>11}"
+            f"{'locked':>8}{'log rows/s':>12}{'reads/s':>10}"
+        )
+        for label, separate, pragmas, begin in scenarios:
+            result = self.run_scenario(
+                separate, pragmas, begin,
+                options["seconds"], options["writers"], options["loggers"], options["readers"],
+            )
+            self.stdout.write(
+                f"{label:<28}{result['tx_per_second']:>9.1f}{result['p50_ms']:>8.2f}ms"
+                f"{result['p99_ms']:>8.2f}ms{result['max_ms']:>9.2f}ms{result['locked']:>8}"
+                f"{result['log_per_second']:>12.1f}{result['reads_per_second']:>10.1f}"
+            )
+
+    def run_scenario(self, separate, pragmas, begin, seconds, writers, loggers, readers):
+        with tempfile.TemporaryDirectory() as directory:
+            main_path = os.path.join(directory, "main.sqlite3")
+            log_path = os.path.join(directory, "activity.sqlite3") if separate else main_path
+            _create(main_path, pragmas)
+            if separate:
+                _create(log_path, pragmas)
+
+            latencies, counts = [], {"locked": 0, "log": 0, "reads": 0}
+            lock = threading.Lock()
+            deadline = time.perf_counter() + seconds
+
+            def gradebook(worker):
+                connection = _connect(main_path, pragmas)
+                mine, locked, pk = [], 0, worker
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        # An attendance save: read the current rows, then update them
+                        connection.execute(begin)
+                        for offset in range(5):
+                            pk = (pk + 7919) % ATTENDANCE_ROWS + 1
+                            connection.execute("SELECT status FROM attendance WHERE id = ?", (pk,)).fetchone()
+                            connection.execute(
+                                "UPDATE attendance SET status = ? WHERE id = ?", (STATUSES[(pk + offset) % 4], pk)
+                            )
+                        connection.execute("COMMIT")
+                    except sqlite3.OperationalError as e:
+                        if not _is_locked(e):
+                            raise
+                        locked += 1
+                        if connection.in_transaction:
+                            connection.execute("ROLLBACK")
+                        continue
+                    mine.append(time.perf_counter() - started)
+                connection.close()
+                with lock:
+                    latencies.extend(mine)
+                    counts["locked"] += locked
+
+            def logger(worker):
+                connection = _connect(log_path, pragmas)
+                written = locked = 0
+                while time.perf_counter() < deadline:
+                    try:
+                        connection.execute(
+                            "INSERT INTO activitylog (user_id, action, description, timestamp) VALUES (?, ?, ?, ?)",
+                            (worker, "Updated attendance", "Marked a student present", time.time()),
+                        )
+                        written += 1
+                    except sqlite3.OperationalError as e:
+                        if not _is_locked(e):
+                            raise
+                        locked += 1
+                connection.close()
+                with lock:
+                    counts["log"] += written
+                    counts["locked"] += locked
+
+            def reader(worker):
+                connection = _connect(main_path, pragmas)
+                reads = locked = 0
+                while time.perf_counter() < deadline:
+                    try:
+                        connection.execute("SELECT status, COUNT(*) FROM attendance GROUP BY status").fetchall()
+                        reads += 1
+                    except sqlite3.OperationalError as e:
+                        if not _is_locked(e):
+                            raise
+                        locked += 1
+                connection.close()
+                with lock:
+                    counts["reads"] += reads
+                    counts["locked"] += locked
+
+            threads = [threading.Thread(target=gradebook, args=(i,)) for i in range(writers)]
+            threads += [threading.Thread(target=logger, args=(i,)) for i in range(loggers)]
+            threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+        latencies_ms = sorted(latency * 1000 for latency in latencies) or [0.0]
+        return {
+            "tx_per_second": len(latencies) / elapsed,
+            "p50_ms": _percentile(latencies_ms, 0.50),
+            "p99_ms": _percentile(latencies_ms, 0.99),
+            "max_ms": latencies_ms[-1],
+            "locked": counts["locked"],
+            "log_per_second": counts["log"] / elapsed,
+            "reads_per_second": counts["reads"] / elapsed,
+        }
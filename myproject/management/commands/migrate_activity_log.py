@@ -0,0 +1,85 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count
+
+from myproject.activity import flush_activity_log
+from myproject.archive import archived_counts
+from myproject.models import ActivityLog, User
+from myproject.routers import activity_alias
+from myproject.search import index_activities
+from myproject.writes import run_write
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the activity log entries written before ACTIVITY_DB_PATH was set from the default "
+        "database into the activity database, with their search index rows. Safe to run again; "
+        "stop the web and import workers first so nothing is logged meanwhile"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Entries copied per chunk")
+        parser.add_argument(
+            "--delete-source", action="store_true",
+            help="Delete the copied entries from the default database afterwards",
+        )
+        parser.add_argument(
+            "--recount", action="store_true",
+            help="Also reset every user's activity_count to their logged plus archived entries",
+        )
+
+    def handle(self, *args, **options):
+        flush_activity_log()
+        alias = activity_alias()
+        if alias:
+            self.copy(alias, options["batch_size"], options["delete_source"])
+        else:
+            self.stdout.write("ACTIVITY_DB_PATH is not set; nothing to copy")
+        if options["recount"]:
+            self.recount(alias or DEFAULT_DB_ALIAS)
+
+    def copy(self, alias, batch_size, delete_source):
+        if ActivityLog._meta.db_table not in connections[DEFAULT_DB_ALIAS].introspection.table_names():
+            self.stdout.write("The default database has no activity log table; nothing to copy")
+            return
+        field_names = [field.attname for field in ActivityLog._meta.concrete_fields]
+        entries = ActivityLog.objects.using(DEFAULT_DB_ALIAS).order_by("id")
+        copied = last_id = 0
+        while True:
+            chunk = [ActivityLog(**row) for row in entries.filter(id__gt=last_id).values(*field_names)[:batch_size]]
+            if not chunk:
+                break
+            last_id = chunk[-1].pk
+
+            def write():
+                # Same ids, so entries copied by an earlier run are skipped
+                ActivityLog.objects.using(alias).bulk_create(chunk, ignore_conflicts=True)
+                index_activities(chunk)
+            run_write("migrate_activity_log", write, using=alias)
+            copied += len(chunk)
+        self.stdout.write(f"Copied {copied} activity log entries to the {alias!r} database")
+
+        if delete_source and copied:
+            # Raw: the post_delete signal would unindex the copies on the activity database
+            deleted = run_write(
+                "migrate_activity_log", lambda: entries.filter(id__lte=last_id)._raw_delete(DEFAULT_DB_ALIAS),
+            )
+            self.stdout.write(f"Deleted {deleted} entries from the default database")
+
+    def recount(self, alias):
+        counts = archived_counts()
+        logged = (
+            ActivityLog.objects.using(alias).order_by().values("user_id")
+            .annotate(total=Count("id")).values_list("user_id", "total")
+        )
+        for user_id, total in logged:
+            counts[user_id] += total
+
+        def write():
+            User.objects.exclude(pk__in=counts).exclude(activity_count=0).update(activity_count=0)
+            for user_id, total in counts.items():
+                User.objects.filter(pk=user_id).update(activity_count=total)
+        run_write("activity_count", write)
+        self.stdout.write(self.style.SUCCESS(
+            f"Recounted activity_count for {len(counts)} users ({sum(counts.values())} entries)"
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myproject.activity import flush_activity_log
+from myproject.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index of students and activity log entries"
+
+    def handle(self, *args, **options):
+        flush_activity_log()
+        counts = rebuild_index()
+        if counts is None:
+            raise CommandError(
+                "No FTS5 search tables on this database; run migrate on SQLite with FTS5 "
+                "(PostgreSQL and other databases search the tables directly)"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {counts['students']} students and {counts['activities']} activity log entries"
+        ))
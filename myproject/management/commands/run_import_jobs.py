@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from myproject.jobs import expire_dry_runs, resume_import_jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued roster import jobs, resume jobs interrupted by a restart and delete the files "
+        "of expired dry runs"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep polling for new jobs")
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            for job_id in resume_import_jobs():
+                self.stdout.write(f"Processed import job {job_id}")
+            expired = expire_dry_runs()
+            if expired:
+                self.stdout.write(f"Deleted the files of {expired} expired dry runs")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,38 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from myproject.routers import replica_alias
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the local replica file (stands in for replication)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep copying, simulating replication lag")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between copies with --loop")
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if alias is None:
+            raise CommandError("No replica configured; set REPLICA_DB_PATH")
+        primary, replica = settings.DATABASES[DEFAULT_DB_ALIAS], settings.DATABASES[alias]
+        if not (primary["ENGINE"].endswith("sqlite3") and replica["ENGINE"].endswith("sqlite3")):
+            raise CommandError("sync_replica only copies SQLite files; use the database's own replication")
+
+        while True:
+            started = time.perf_counter()
+            source, target = sqlite3.connect(primary["NAME"]), sqlite3.connect(replica["NAME"])
+            try:
+                # Online backup: a consistent snapshot even while the primary is written
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+            self.stdout.write(f"Copied {primary['NAME']} to {replica['NAME']} in {time.perf_counter() - started:.2f}s")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
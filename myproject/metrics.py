@@ -0,0 +1,238 @@
+"""
+Per-view request metrics, kept in memory and exported in Prometheus format.
+
+RequestMetricsMiddleware times each request and, through an execute
+wrapper on every database connection, counts its queries and the time
+spent in them; template rendering is timed by wrapping the Django template
+backend. Observations are filed under the resolved URL name:
+
+    ascrem_request_duration_seconds   whole request (histogram)
+    ascrem_view_duration_seconds      from URL resolution to the response
+    ascrem_request_db_seconds         time inside database queries
+    ascrem_request_template_seconds   template rendering
+    ascrem_request_queries            queries per request
+    ascrem_requests_total             by status class
+    ascrem_query_budget_exceeded_total
+
+Histograms are cumulative, as Prometheus expects (windows come from
+rate() on the scraping side); their size is fixed per view, so memory does
+not grow with traffic. Every worker process keeps its own numbers.
+
+A request over its query budget (METRICS_QUERY_BUDGETS[url name], else
+METRICS_QUERY_BUDGET) logs its most repeated SQL statements, with IN lists
+and literals folded, which is how an N+1 loop shows up.
+"""
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.backends.django import Template as BackendTemplate
+
+from .writes import write_stats
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Repeated statements listed when a request is over its query budget
+TOP_SHAPES = 5
+UNRESOLVED = "unresolved"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+HISTOGRAMS = {
+    "ascrem_request_duration_seconds": ("Request duration", SECONDS_BUCKETS),
+    "ascrem_view_duration_seconds": ("Time from URL resolution to the response", SECONDS_BUCKETS),
+    "ascrem_request_db_seconds": ("Time spent in database queries per request", SECONDS_BUCKETS),
+    "ascrem_request_template_seconds": ("Template rendering time per request", SECONDS_BUCKETS),
+    "ascrem_request_queries": ("Database queries per request", QUERY_BUCKETS),
+}
+
+_lock = threading.Lock()
+# (metric, view) -> Histogram
+_histograms = {}
+# (view, status class) -> count
+_requests = Counter()
+_over_budget = Counter()
+
+
+def observe_request(view, status, total, view_seconds, db_seconds, template_seconds, queries, over_budget=False):
+    values = {
+        "ascrem_request_duration_seconds": total,
+        "ascrem_view_duration_seconds": view_seconds,
+        "ascrem_request_db_seconds": db_seconds,
+        "ascrem_request_template_seconds": template_seconds,
+        "ascrem_request_queries": queries,
+    }
+    with _lock:
+        for metric, value in values.items():
+            histogram = _histograms.get((metric, view))
+            if histogram is None:
+                histogram = _histograms[(metric, view)] = Histogram(HISTOGRAMS[metric][1])
+            histogram.observe(value)
+        _requests[(view, f"{status // 100}xx")] += 1
+        if over_budget:
+            _over_budget[view] += 1
+
+
+def reset_metrics():
+    with _lock:
+        _histograms.clear()
+        _requests.clear()
+        _over_budget.clear()
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus():
+    """Every metric of this process in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        for metric, (description, _) in HISTOGRAMS.items():
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+            for (name, view), histogram in sorted(_histograms.items()):
+                if name != metric:
+                    continue
+                view = _label(view)
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{metric}_bucket{{view="{view}",le="{_number(bound)}"}} {count}')
+                lines.append(f'{metric}_bucket{{view="{view}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{metric}_sum{{view="{view}"}} {_number(histogram.sum)}')
+                lines.append(f'{metric}_count{{view="{view}"}} {histogram.count}')
+
+        lines += ["# HELP ascrem_requests_total Requests by view and status class",
+                  "# TYPE ascrem_requests_total counter"]
+        for (view, status), count in sorted(_requests.items()):
+            lines.append(f'ascrem_requests_total{{view="{_label(view)}",status="{status}"}} {count}')
+        lines += ["# HELP ascrem_query_budget_exceeded_total Requests that ran more queries than their budget",
+                  "# TYPE ascrem_query_budget_exceeded_total counter"]
+        for view, count in sorted(_over_budget.items()):
+            lines.append(f'ascrem_query_budget_exceeded_total{{view="{_label(view)}"}} {count}')
+
+    writes = sorted(write_stats().items())
+    for key, metric, description in (
+        ("calls", "ascrem_db_write_calls_total", "Retried-write operations run"),
+        ("retries", "ascrem_db_write_retries_total", "Write attempts retried after a lock error"),
+        ("failures", "ascrem_db_write_failures_total", "Writes that still failed after every retry"),
+        ("wait_seconds", "ascrem_db_write_wait_seconds_total", "Time writes spent waiting for a lock or a retry"),
+    ):
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+        for name, stats in writes:
+            lines.append(f'{metric}{{operation="{_label(name)}"}} {_number(stats[key])}')
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Per-request collection
+# -----------------------------
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = False
+        self.statements = Counter()
+
+
+_request_stats = ContextVar("request_stats", default=None)
+
+
+def start_request():
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token):
+    _request_stats.reset(token)
+
+
+def query_timer(stats):
+    """Execute wrapper counting the queries of one request and their time"""
+    def timed(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats.db_seconds += time.perf_counter() - started
+            stats.queries += 1
+            stats.statements[sql] += 1
+    return timed
+
+
+IN_LIST = re.compile(r"IN \((?:%s|\?)(?:, ?(?:%s|\?))*\)", re.IGNORECASE)
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+SPACE = re.compile(r"\s+")
+
+
+def sql_shape(sql):
+    """sql with IN lists, literals and whitespace folded, so repeats of one statement compare equal"""
+    sql = IN_LIST.sub("IN (...)", sql)
+    sql = STRING.sub("?", sql)
+    sql = NUMBER.sub("?", sql)
+    return SPACE.sub(" ", sql).strip()
+
+
+def repeated_shapes(stats, limit=TOP_SHAPES):
+    """[(count, shape)] of the statements a request ran more than once, most executed first"""
+    shapes = Counter()
+    for sql, count in stats.statements.items():
+        shapes[sql_shape(sql)] += count
+    return [(count, shape) for shape, count in shapes.most_common(limit) if count > 1]
+
+
+def query_budget(view):
+    return settings.METRICS_QUERY_BUDGETS.get(view, settings.METRICS_QUERY_BUDGET)
+
+
+# -----------------------------
+# Template timing
+# -----------------------------
+_original_render = BackendTemplate.render
+
+
+def _timed_render(self, context=None, request=None):
+    stats = _request_stats.get()
+    if stats is None or stats.rendering:
+        # Outside a request, or render_to_string() called while rendering
+        return _original_render(self, context, request)
+    stats.rendering = True
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        stats.template_seconds += time.perf_counter() - started
+        stats.rendering = False
+
+
+def install_template_timer():
+    """Time Django template rendering (called from AppConfig.ready())"""
+    BackendTemplate.render = _timed_render
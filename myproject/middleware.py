@@ -0,0 +1,158 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.middleware.gzip import GZipMiddleware
+from django.utils.functional import SimpleLazyObject
+
+from .metrics import (
+    UNRESOLVED, end_request, observe_request, query_budget, query_timer, repeated_shapes, start_request,
+)
+from .preferences import get_user_setting
+from .routers import replica_alias, start_request_routing, write_detector
+
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# Request metrics
+# -----------------------------
+class RequestMetricsMiddleware:
+    """
+    Record query count, database, view and template time per URL name
+    (see metrics.py), add a Server-Timing header and log the repeated SQL
+    of requests over their query budget.
+
+    Goes first in MIDDLEWARE so the total covers every other middleware.
+    A streamed response is measured until its first byte, not its last.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        stats, token = start_request()
+        started = time.perf_counter()
+        request._metrics_view_started = None
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(query_timer(stats)))
+                response = self.get_response(request)
+        finally:
+            end_request(token)
+        total = time.perf_counter() - started
+        view_started = request._metrics_view_started
+        view_seconds = time.perf_counter() - view_started if view_started else 0.0
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or UNRESOLVED
+        budget = query_budget(view)
+        over_budget = stats.queries > budget
+        if over_budget:
+            logger.warning(
+                "%s %s ran %d queries (budget %d) in %.1f ms; most repeated: %s",
+                request.method, view, stats.queries, budget, stats.db_seconds * 1000,
+                "; ".join(f"{count}x {shape[:300]}" for count, shape in repeated_shapes(stats)) or "none",
+            )
+        observe_request(
+            view, response.status_code, total, view_seconds, stats.db_seconds, stats.template_seconds,
+            stats.queries, over_budget,
+        )
+        if settings.METRICS_SERVER_TIMING:
+            timing = (
+                f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                f'tpl;dur={stats.template_seconds * 1000:.1f}, view;dur={view_seconds * 1000:.1f}, '
+                f'total;dur={total * 1000:.1f}'
+            )
+            # Keep the metrics a view reported itself (e.g. dashboard widget cache hits)
+            response['Server-Timing'] = ", ".join(filter(None, [response.get('Server-Timing'), timing]))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_started = time.perf_counter()
+        return None
+
+
+# -----------------------------
+# Response compression
+# -----------------------------
+class CompressibleGZipMiddleware(GZipMiddleware):
+    """
+    GZip only large HTML and JSON responses.
+
+    Spreadsheet downloads are already zip containers and small responses are
+    not worth the CPU, so both are passed through untouched.
+    """
+    compressible_types = ('text/html', 'application/json')
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in self.compressible_types:
+            return response
+        if not response.streaming and len(response.content) < settings.GZIP_MIN_LENGTH:
+            return response
+        return super().process_response(request, response)
+
+
+# -----------------------------
+# Per-request user settings
+# -----------------------------
+class UserSettingMiddleware:
+    """
+    Attach request.app_setting, the user's Setting loaded on first access.
+
+    Must come after AuthenticationMiddleware. Pages that never touch the
+    setting pay nothing; the rest share one cached lookup per request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.app_setting = SimpleLazyObject(lambda: get_user_setting(request.user))
+        return self.get_response(request)
+
+
+# -----------------------------
+# Read replica routing
+# -----------------------------
+STICKY_SESSION_KEY = '_replica_primary_until'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let the read-only views named in REPLICA_READ_VIEWS read from the
+    replica (see routers.ReplicaRouter).
+
+    Must come after SessionMiddleware: a request that writes pins its
+    session to the primary for REPLICA_STICKY_SECONDS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = request.replica_state = start_request_routing()
+        if not replica_alias():
+            return self.get_response(request)
+        with connections[DEFAULT_DB_ALIAS].execute_wrapper(write_detector(state)):
+            response = self.get_response(request)
+        if state.wrote:
+            request.session[STICKY_SESSION_KEY] = time.time() + settings.REPLICA_STICKY_SECONDS
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not replica_alias() or request.method not in ('GET', 'HEAD'):
+            return None
+        if request.resolver_match.url_name not in settings.REPLICA_READ_VIEWS:
+            return None
+        if request.session.get(STICKY_SESSION_KEY, 0) > time.time():
+            return None
+        request.replica_state.use_replica = True
+        return None
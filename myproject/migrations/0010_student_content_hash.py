@@ -0,0 +1,60 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:20
+
+import hashlib
+
+from django.db import migrations, models
+
+# Frozen copies of myproject.models.STUDENT_HASH_FIELDS and
+# student_content_hash() as of this migration
+STUDENT_HASH_FIELDS = (
+    "student_id", "last_name", "first_name", "middle_initial",
+    "program", "year_level", "section", "class_obj_id",
+)
+
+
+def student_content_hash(values):
+    raw = "\x1f".join(str(values.get(field) or "") for field in STUDENT_HASH_FIELDS)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def backfill_content_hash(apps, schema_editor):
+    Student = apps.get_model('myproject', 'Student')
+    batch = []
+    for student in Student.objects.all().iterator(chunk_size=1000):
+        student.content_hash = student_content_hash({f: getattr(student, f) for f in STUDENT_HASH_FIELDS})
+        batch.append(student)
+        if len(batch) >= 1000:
+            Student.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    Student.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myproject', '0009_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='diff',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='dry_run',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='unchanged_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='content_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop, hints={'model_name': 'student'}),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:54
+
+from django.db import migrations, models, router
+from django.db.models import Count
+
+
+def backfill_activity_count(apps, schema_editor):
+    User = apps.get_model('myproject', 'User')
+    ActivityLog = apps.get_model('myproject', 'ActivityLog')
+    db = schema_editor.connection.alias
+    if not router.allow_migrate_model(db, ActivityLog):
+        # The log lives in its own database (myproject.routers), which starts empty
+        return
+    counts = ActivityLog.objects.using(db).values('user_id').annotate(total=Count('id')).order_by()
+    for row in counts:
+        User.objects.using(db).filter(pk=row['user_id']).update(activity_count=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myproject', '0010_student_content_hash'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='activitylog',
+            options={'ordering': ['-timestamp', '-id']},
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='activity_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='activitylog_user_recent_idx'),
+        ),
+        migrations.RunPython(backfill_activity_count, migrations.RunPython.noop, hints={'model_name': 'user'}),
+    ]
@@ -0,0 +1,75 @@
+# Full-text search tables (SQLite FTS5) for myproject.search
+
+from django.db import migrations, router
+
+TOKENIZE = "unicode61 remove_diacritics 2"
+
+CREATE_ACTIVITY = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS myproject_activitylog_fts
+USING fts5(action, description, tokenize='{TOKENIZE}', prefix='2 3')
+"""
+# '-' is part of a token so student codes like 2021-00123 match by prefix
+CREATE_STUDENT = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS myproject_student_fts
+USING fts5(student_id, last_name, first_name, middle_initial, tokenize="{TOKENIZE} tokenchars '-'", prefix='2 3')
+"""
+BACKFILL_ACTIVITY = """
+INSERT INTO myproject_activitylog_fts (rowid, action, description)
+SELECT id, action, description FROM myproject_activitylog
+"""
+BACKFILL_STUDENT = """
+INSERT INTO myproject_student_fts (rowid, student_id, last_name, first_name, middle_initial)
+SELECT id, student_id, last_name, first_name, COALESCE(middle_initial, '') FROM myproject_student
+"""
+
+
+def fts5_available(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        if cursor.fetchone()[0]:
+            return True
+        # Builds may load FTS5 without the compile option being reported
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp.fts5_probe")
+        except Exception:
+            return False
+    return True
+
+
+def create_search_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    if not fts5_available(connection):
+        # myproject.search falls back to plain lookups
+        return
+    with connection.cursor() as cursor:
+        for create, backfill, model in (
+            (CREATE_ACTIVITY, BACKFILL_ACTIVITY, 'activitylog'),
+            (CREATE_STUDENT, BACKFILL_STUDENT, 'student'),
+        ):
+            # The index lives in the same database as the table it covers
+            if not router.allow_migrate(connection.alias, 'myproject', model_name=model):
+                continue
+            cursor.execute(create)
+            cursor.execute(backfill)
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS myproject_activitylog_fts")
+        cursor.execute("DROP TABLE IF EXISTS myproject_student_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myproject', '0012_activitylog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
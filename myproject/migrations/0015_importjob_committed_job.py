@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myproject', '0014_activitylog_unconstrained_fks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='committed_job',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='dry_run_source', to='myproject.importjob'),
+        ),
+    ]
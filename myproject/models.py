@@ -1,6 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
+import hashlib
 import random
 import string
 from django.utils import timezone
@@ -25,6 +26,8 @@ class User(AbstractUser):
         ('suspended', 'Suspended'),
     ]
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    # Number of ActivityLog entries ever recorded (kept by signals.py, survives log archival)
+    activity_count = models.PositiveIntegerField(default=0, editable=False)
 
     # ✅ Login with instructor_id instead of username
     USERNAME_FIELD = 'instructor_id'
@@ -81,6 +84,9 @@ class Class(models.Model):
     section = models.CharField(max_length=50)
     semester = models.CharField(max_length=20)
     school_year = models.CharField(max_length=20)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever the class or any of its rosters, attendance or grades change
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     @property
     def class_name(self):
@@ -94,6 +100,19 @@ class Class(models.Model):
 # -----------------------------
 # Student Model
 # -----------------------------
+# Roster fields covered by Student.content_hash (see student_content_hash)
+STUDENT_HASH_FIELDS = (
+    "student_id", "last_name", "first_name", "middle_initial",
+    "program", "year_level", "section", "class_obj_id",
+)
+
+
+def student_content_hash(values):
+    """SHA-256 over the roster fields of a student, given as a dict"""
+    raw = "\x1f".join(str(values.get(field) or "") for field in STUDENT_HASH_FIELDS)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
 class Student(models.Model):
     class_obj = models.ForeignKey(Class, related_name="students", on_delete=models.CASCADE)
     photo = models.ImageField(upload_to="students/photos/", blank=True, null=True)
@@ -108,6 +127,10 @@ class Student(models.Model):
     address = models.TextField(blank=True, null=True)
     contact_number = models.CharField(max_length=20, blank=True, null=True)
     email = models.EmailField(blank=True, null=True)
+    # Hash of the roster fields, used by imports to skip unchanged rows
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     # -----------------------------
     # Display full name as Lastname, Firstname Middlename (blank if no middle)
@@ -115,12 +138,26 @@ class Student(models.Model):
     @property
     def display_name(self):
         """Return the student's name as Lastname, Firstname Middlename (blank if middle is None)."""
-        middle = f" {self.middle_initial}." if self.middle_initial else ""
-        return f"{self.last_name}, {self.first_name}{middle}"
+        return self.format_display_name(self.last_name, self.first_name, self.middle_initial)
+
+    @staticmethod
+    def format_display_name(last_name, first_name, middle_initial=None):
+        middle = f" {middle_initial}." if middle_initial else ""
+        return f"{last_name}, {first_name}{middle}"
 
     # -----------------------------
     # For admin or string representation
     # -----------------------------
+    def compute_content_hash(self):
+        return student_content_hash({field: getattr(self, field) for field in STUDENT_HASH_FIELDS})
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_content_hash()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | {"content_hash"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.display_name
 
@@ -155,6 +192,8 @@ class Attendance(models.Model):
             ("Excused", "Excused")
         ]
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('class_obj', 'student', 'date')
@@ -209,6 +248,8 @@ class GradeSummary(models.Model):
     final_grade = models.FloatField()
     remarks = models.CharField(max_length=10, choices=[("Passed", "Passed"), ("Failed", "Failed")])
     is_locked = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"{self.student.full_name} - {self.final_grade} ({self.remarks})"
@@ -274,20 +315,78 @@ class UserSettings(models.Model):
 # Activity Log
 # -----------------------------
 class ActivityLog(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # May live in another database (routers.py): no FK constraints, and
+    # signals.py deletes a user's entries / clears deleted classes and students
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False)
     action = models.CharField(max_length=200)
     description = models.TextField(blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
-    class_obj = models.ForeignKey(Class, on_delete=models.SET_NULL, null=True, blank=True)
-    student = models.ForeignKey(Student, on_delete=models.SET_NULL, null=True, blank=True)
+    # Set by activity.log_activity when the action happens, not when the buffered row is written
+    timestamp = models.DateTimeField(default=timezone.now)
+    class_obj = models.ForeignKey(Class, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True)
+    student = models.ForeignKey(Student, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True)
 
     class Meta:
-        ordering = ['-timestamp']
+        ordering = ['-timestamp', '-id']
+        indexes = [
+            # Keyset pagination of a user's log (activity.activity_page)
+            models.Index(fields=['user', '-timestamp', '-id'], name='activitylog_user_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.action} ({self.timestamp})"
 
 
+# -----------------------------
+# Background Import Job
+# -----------------------------
+class ImportJob(models.Model):
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("completed", "Completed"),
+        ("failed", "Failed"),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="import_jobs")
+    class_obj = models.ForeignKey(Class, on_delete=models.CASCADE, related_name="import_jobs")
+    file = models.FileField(upload_to="imports/", blank=True)
+    original_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
+    # Dry runs only compute the diff; nothing is written to Student
+    dry_run = models.BooleanField(default=False)
+    # Checkpoint: data rows of the file already committed (resume point)
+    rows_processed = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    unchanged_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    # Sample of inserted/changed rows: {"inserted": [...], "changed": [...]}
+    diff = models.JSONField(default=dict, blank=True)
+    # Set once a dry run has been committed; a preview is imported only once
+    committed_job = models.OneToOneField(
+        "self", on_delete=models.SET_NULL, blank=True, null=True, related_name="dry_run_source"
+    )
+    message = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_finished(self):
+        return self.status in ("completed", "failed")
+
+    @property
+    def rows_per_second(self):
+        if not self.started_at or not self.rows_processed:
+            return 0.0
+        elapsed = ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"Import {self.original_name} → {self.class_obj} ({self.status})"
+
+
 # ============================================================
 # 🆕 NEW MODELS for Dynamic Grading System
 # ============================================================
@@ -325,6 +424,8 @@ class StudentScore(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="scores")
     item = models.ForeignKey(GradeItem, on_delete=models.CASCADE, related_name="student_scores")
     score_percentage = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         unique_together = ('student', 'item')
@@ -0,0 +1,48 @@
+"""
+Per-user Setting (school year, theme) lookups.
+
+A user's Setting row is read at most once per request: it is memoized on the
+request's user object and backed by a per-user cache entry, which signals.py
+drops once a save or delete of the row commits. As in caching.py, requests
+reading from the replica use the entry but never fill it.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Setting
+from .routers import reading_from_replica
+
+DEFAULT_SCHOOL_YEAR = '25-1'
+DEFAULT_THEME = 'light'
+SETTING_CACHE_TIMEOUT = 60 * 60
+
+
+def setting_cache_key(user_id):
+    return f"app-setting:{user_id}"
+
+
+def get_user_setting(user):
+    """Return the user's Setting (created with defaults if missing), or None for anonymous users"""
+    if not user.is_authenticated:
+        return None
+    setting = getattr(user, '_app_setting', None)
+    if setting is None:
+        key = setting_cache_key(user.pk)
+        setting = cache.get(key)
+        if setting is None:
+            setting, _ = Setting.objects.get_or_create(
+                user=user,
+                defaults={'school_year': DEFAULT_SCHOOL_YEAR, 'theme': DEFAULT_THEME},
+            )
+            # Don't pickle the related User into the cache entry
+            setting._state.fields_cache.pop('user', None)
+            if not reading_from_replica():
+                cache.set(key, setting, SETTING_CACHE_TIMEOUT)
+        user._app_setting = setting
+    return setting
+
+
+def invalidate_user_setting(user_id):
+    """Drop the user's cached Setting (after commit, so it cannot be refilled with the old row)"""
+    key = setting_cache_key(user_id)
+    transaction.on_commit(lambda: cache.delete(key))
@@ -0,0 +1,212 @@
+"""
+Bulk report data and the multi-class "class record book" export.
+"""
+import csv
+import io
+import logging
+import multiprocessing
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils.text import slugify
+
+from .models import Attendance, GradeSummary, Student
+from .workbooks import build_record_book
+
+logger = logging.getLogger(__name__)
+
+
+# -----------------------------
+# Bulk data per class
+# -----------------------------
+def attendance_counts(class_obj):
+    """Return {student pk: {'total', 'present', 'absent', 'late', 'excused'}} in one query"""
+    rows = (
+        Attendance.objects.filter(class_obj=class_obj)
+        .values('student_id')
+        .annotate(
+            total=Count('id'),
+            present=Count('id', filter=Q(status='Present')),
+            absent=Count('id', filter=Q(status='Absent')),
+            late=Count('id', filter=Q(status='Late')),
+            excused=Count('id', filter=Q(status='Excused')),
+        )
+    )
+    return {row.pop('student_id'): row for row in rows}
+
+
+def attendance_percentage(counts):
+    if not counts or not counts['total']:
+        return 0
+    return counts['present'] / counts['total'] * 100
+
+
+def student_attendance_stats(class_obj, students=None, counts=None):
+    """Per-student attendance dicts for the report templates, from one grouped count query"""
+    students = Student.objects.filter(class_obj=class_obj) if students is None else students
+    counts = attendance_counts(class_obj) if counts is None else counts
+    stats = []
+    for student in students:
+        c = counts.get(student.id) or {'total': 0, 'present': 0, 'absent': 0, 'late': 0, 'excused': 0}
+        stats.append({
+            'student': student,
+            'total_days': c['total'],
+            'present_days': c['present'],
+            'absent_days': c['absent'],
+            'late_days': c['late'],
+            'excused_days': c['excused'],
+            'attendance_percentage': round(attendance_percentage(c), 2),
+        })
+    return stats
+
+
+def attendance_rows(class_obj, students=None, counts=None):
+    students = Student.objects.filter(class_obj=class_obj) if students is None else students
+    counts = attendance_counts(class_obj) if counts is None else counts
+    rows = []
+    for student in students:
+        c = counts.get(student.id) or {'total': 0, 'present': 0, 'absent': 0, 'late': 0, 'excused': 0}
+        rows.append((
+            student.student_id, student.display_name, c['total'], c['present'],
+            c['absent'], c['late'], c['excused'], f"{attendance_percentage(c):.2f}%",
+        ))
+    return rows
+
+
+def grade_rows(class_obj):
+    summaries = (
+        GradeSummary.objects.filter(class_obj=class_obj)
+        .select_related('student')
+        .order_by('student__last_name')
+    )
+    return [
+        (s.student.student_id, s.student.display_name, f"{s.final_grade:.2f}%", s.equivalent_grade or '-', s.remarks)
+        for s in summaries
+    ]
+
+
+def summary_rows(class_obj, students=None, counts=None):
+    students = Student.objects.filter(class_obj=class_obj) if students is None else students
+    counts = attendance_counts(class_obj) if counts is None else counts
+    summaries = {s.student_id: s for s in GradeSummary.objects.filter(class_obj=class_obj)}
+    rows = []
+    for student in students:
+        summary = summaries.get(student.id)
+        rows.append((
+            student.student_id,
+            student.display_name,
+            f"{summary.final_grade:.2f}%" if summary else '-',
+            summary.equivalent_grade if summary and summary.equivalent_grade else '-',
+            summary.remarks if summary else '-',
+            f"{attendance_percentage(counts.get(student.id)):.2f}%",
+        ))
+    return rows
+
+
+def class_record_payload(class_obj):
+    """Everything build_record_book needs for one class, as plain picklable data"""
+    students = list(Student.objects.filter(class_obj=class_obj))
+    counts = attendance_counts(class_obj)
+    return {
+        'class_id': class_obj.id,
+        'folder': f"{slugify(str(class_obj)) or 'class'}-{class_obj.id}",
+        'attendance': attendance_rows(class_obj, students, counts),
+        'grades': grade_rows(class_obj),
+        'summary': summary_rows(class_obj, students, counts),
+    }
+
+
+# -----------------------------
+# Class record book (ZIP of every class)
+# -----------------------------
+class _ZipStream:
+    """Write-only file object whose buffered bytes are drained after each ZIP entry"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _class_payloads(classes, timings):
+    """class_record_payload of each class, fetched only when the next one is needed"""
+    for class_obj in classes:
+        started = time.perf_counter()
+        payload = class_record_payload(class_obj)
+        timings[class_obj.id] = {'class': str(class_obj), 'fetch': time.perf_counter() - started}
+        yield payload
+
+
+def _built_record_books(classes, timings):
+    """
+    Yield build_record_book results, in a process pool when it is worth it.
+
+    At most two classes per worker are fetched ahead of the builds, so memory
+    and the time to the first archive entry do not grow with the class count.
+    """
+    payloads = _class_payloads(classes, timings)
+    workers = settings.REPORT_EXPORT_WORKERS
+    if workers <= 1 or len(classes) <= 1:
+        for payload in payloads:
+            yield build_record_book(payload)
+        return
+
+    context = multiprocessing.get_context(settings.REPORT_EXPORT_MP_CONTEXT)
+    with ProcessPoolExecutor(max_workers=min(workers, len(classes)), mp_context=context) as pool:
+        pending = set()
+        for payload in payloads:
+            pending.add(pool.submit(build_record_book, payload))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def stream_record_book(classes):
+    """
+    Yield a ZIP archive of attendance/grades/summary workbooks for each class.
+
+    Report data is fetched in bulk per class, just ahead of its build;
+    workbooks are built in parallel and every finished class is written to
+    the archive as soon as it arrives. A timings.csv entry records the
+    per-class fetch and build cost.
+    """
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED)
+
+    timings = {}
+    for class_id, files, build_seconds in _built_record_books(classes, timings):
+        size = 0
+        for filename, data in files:
+            archive.writestr(filename, data)
+            size += len(data)
+        timings[class_id].update(build=build_seconds, bytes=size)
+        logger.info(
+            "Record book: class %s fetched in %.1f ms, built in %.1f ms (%d bytes)",
+            class_id, timings[class_id]['fetch'] * 1000, build_seconds * 1000, size,
+        )
+        yield stream.drain()
+
+    report = io.StringIO()
+    writer = csv.writer(report)
+    writer.writerow(['Class ID', 'Class', 'Fetch (ms)', 'Build (ms)', 'Bytes'])
+    for class_id, t in timings.items():
+        writer.writerow([class_id, t['class'], f"{t['fetch'] * 1000:.1f}", f"{t.get('build', 0) * 1000:.1f}", t.get('bytes', 0)])
+    archive.writestr('timings.csv', report.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+    archive.close()
+    yield stream.drain()
@@ -0,0 +1,168 @@
+"""
+Database routers.
+
+ActivityLogRouter moves the high-volume tables (ActivityLog, and
+optionally EmailVerification and sessions) to their own database alias
+when settings.ACTIVITY_DATABASE is configured, so logging inserts no
+longer take the write lock of the gradebook database. Without that alias
+it routes nothing.
+
+The activity log's foreign keys therefore carry no database constraint:
+queries fetch related rows with prefetch_related() instead of joins, and
+signals.py applies the on-delete behaviour itself.
+
+ReplicaRouter sends reads of the views listed in REPLICA_READ_VIEWS to
+settings.REPLICA_DATABASE while every write stays on the primary. The
+decision is per request (ReplicaRoutingMiddleware sets it in a context
+variable); a request that writes reads from the primary from then on, and
+its session stays on the primary for REPLICA_STICKY_SECONDS so the next
+page sees the write even if the replica lags.
+
+Replica views are cache readers only: caching.get_or_compute() does not
+store what they compute (see reading_from_replica()), because data read
+from a lagging replica would be cached under the namespace version that
+the primary's commit has just bumped.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS
+
+ACTIVITY_MODELS = {"myproject.activitylog"}
+# Always read from the primary: a lagging copy would log people out or
+# hide a just-registered account
+PRIMARY_ONLY_MODELS = {"sessions.session", "myproject.user"}
+
+
+def activity_alias():
+    alias = settings.ACTIVITY_DATABASE
+    return alias if alias and alias in settings.DATABASES else None
+
+
+def activity_models():
+    models = set(ACTIVITY_MODELS)
+    if settings.ACTIVITY_DATABASE_EMAIL_VERIFICATION:
+        models.add("myproject.emailverification")
+    if settings.ACTIVITY_DATABASE_SESSIONS:
+        models.add("sessions.session")
+    return models
+
+
+class ActivityLogRouter:
+    def _route(self, model, hints):
+        alias = activity_alias()
+        if not alias:
+            return None
+        if model._meta.label_lower in activity_models():
+            return alias
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db == alias:
+            # Django would otherwise look up an activity row's user, class
+            # or student in the activity database
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if activity_alias() and {obj1._meta.label_lower, obj2._meta.label_lower} & activity_models():
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = activity_alias()
+        if not alias or model_name is None:
+            # Operations without a model (RunPython, RunSQL) decide for themselves
+            return None
+        if f"{app_label}.{model_name}" in activity_models():
+            return db == alias
+        if db == alias:
+            return False
+        return None
+
+
+# -----------------------------
+# Read replica
+# -----------------------------
+class ReplicaState:
+    def __init__(self, use_replica=False):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+_replica_state = ContextVar("replica_state", default=None)
+
+
+def replica_alias():
+    alias = settings.REPLICA_DATABASE
+    return alias if alias and alias in settings.DATABASES else None
+
+
+def reading_from_replica():
+    """True while the current request's reads go to the replica"""
+    state = _replica_state.get()
+    return bool(state and state.use_replica and replica_alias())
+
+
+def start_request_routing():
+    """Begin a request on the primary; returns its ReplicaState"""
+    state = ReplicaState()
+    _replica_state.set(state)
+    return state
+
+
+def end_request_routing(**kwargs):
+    _replica_state.set(None)
+
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def write_detector(state):
+    """
+    Execute wrapper for the primary connection that switches the request
+    to the primary once it runs a write. (db_for_write can't tell: Django
+    also asks it where to read for get_or_create() and select_for_update().)
+    """
+    def detect(execute, sql, params, many, context):
+        if sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            state.wrote = True
+            state.use_replica = False
+        return execute(sql, params, many, context)
+    return detect
+
+
+# request_finished fires once a streamed export has been fully sent
+request_finished.connect(end_request_routing, dispatch_uid="replica_routing_end")
+
+
+class ReplicaRouter:
+    def _replicated(self, model):
+        return model._meta.label_lower not in PRIMARY_ONLY_MODELS
+
+    def db_for_read(self, model, **hints):
+        state = _replica_state.get()
+        if state is None or not state.use_replica or not self._replicated(model):
+            return None
+        return replica_alias()
+
+    def db_for_write(self, model, **hints):
+        # Also for objects that were read from the replica
+        return DEFAULT_DB_ALIAS if replica_alias() else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if replica_alias() and obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if replica_alias() and db == replica_alias():
+            # Filled by replication (or manage.py sync_replica), never migrated
+            return False
+        return None
@@ -0,0 +1,241 @@
+"""
+Full-text search over the activity log and students.
+
+On SQLite the text lives in two FTS5 tables created by migration 0013,
+keyed by rowid = ActivityLog.id / Student.id:
+
+    myproject_activitylog_fts(action, description)
+    myproject_student_fts(student_id, last_name, first_name, middle_initial)
+
+signals.py keeps them in step with single saves and deletes; bulk writes
+call index_activities() / index_students() themselves. Every query joins
+back to the real table (which also scopes results to the instructor), so
+a stale index row can never surface deleted or foreign data. Queries are
+prefix matches ranked with bm25().
+
+On PostgreSQL the same functions use SearchVector / SearchRank over the
+columns directly; any other database falls back to icontains lookups.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.signals import post_migrate
+
+from .models import ActivityLog, Student
+
+ACTIVITY_FTS_TABLE = "myproject_activitylog_fts"
+STUDENT_FTS_TABLE = "myproject_student_fts"
+ACTIVITY_COLUMNS = "action, description"
+STUDENT_COLUMNS = "student_id, last_name, first_name, middle_initial"
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_TERMS = 8
+
+# bm25() weights per column: a match on the student code outranks a name match
+STUDENT_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+ACTIVITY_WEIGHTS = (2.0, 1.0)
+
+# (alias, table) -> whether the FTS5 table exists; forgotten after every migrate
+_fts_tables = {}
+
+
+def _connection(model):
+    return connections[router.db_for_write(model)]
+
+
+def _has_fts(connection, table):
+    """True when table exists on connection (looked up once per alias)"""
+    if connection.vendor != "sqlite":
+        return False
+    key = (connection.alias, table)
+    if key not in _fts_tables:
+        _fts_tables[key] = table in connection.introspection.table_names()
+    return _fts_tables[key]
+
+
+def _forget_fts_tables(**kwargs):
+    # A migrate run in this process (tests, migrate_activity_log) may have created them
+    _fts_tables.clear()
+
+
+post_migrate.connect(_forget_fts_tables, dispatch_uid="search_fts_tables")
+
+
+def search_terms(query):
+    """Words of a user query, at most MAX_TERMS"""
+    return re.findall(r"\w[\w-]*", query or "")[:MAX_TERMS]
+
+
+def _match_expression(terms):
+    # Each term as a quoted prefix phrase, so FTS5 syntax in the query is inert
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def backend_name():
+    connection = _connection(Student)
+    if _has_fts(connection, STUDENT_FTS_TABLE):
+        return "fts5"
+    return "postgres" if connection.vendor == "postgresql" else "basic"
+
+
+# -----------------------------
+# Index maintenance
+# -----------------------------
+def index_activities(activities):
+    """Add or refresh the index rows of these ActivityLog rows"""
+    rows = [(a.pk, a.action, a.description or "") for a in activities if a.pk]
+    _replace_rows(_connection(ActivityLog), ACTIVITY_FTS_TABLE, ACTIVITY_COLUMNS, rows)
+
+
+def index_students(students):
+    """Add or refresh the index rows of these students"""
+    rows = [
+        (s.pk, s.student_id, s.last_name, s.first_name, s.middle_initial or "")
+        for s in students if s.pk
+    ]
+    _replace_rows(_connection(Student), STUDENT_FTS_TABLE, STUDENT_COLUMNS, rows)
+
+
+def unindex_activities(ids):
+    _delete_rows(_connection(ActivityLog), ACTIVITY_FTS_TABLE, ids)
+
+
+def unindex_students(ids):
+    _delete_rows(_connection(Student), STUDENT_FTS_TABLE, ids)
+
+
+def _replace_rows(connection, table, columns, rows):
+    if not rows or not _has_fts(connection, table):
+        return
+    placeholders = ", ".join(["%s"] * (columns.count(",") + 2))
+    with connection.cursor() as cursor:
+        # FTS5 has no upsert
+        cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(f"INSERT INTO {table} (rowid, {columns}) VALUES ({placeholders})", rows)
+
+
+def _delete_rows(connection, table, ids):
+    ids = [pk for pk in ids if pk]
+    if not ids or not _has_fts(connection, table):
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {table} WHERE rowid = %s", [(pk,) for pk in ids])
+
+
+def rebuild_index():
+    """
+    Refill both FTS5 tables from their source tables. Returns
+    {'activities': rows, 'students': rows}, or None when the database
+    has no FTS5 tables (nothing to rebuild).
+    """
+    counts = {}
+    for key, model, table, columns, select in (
+        ("activities", ActivityLog, ACTIVITY_FTS_TABLE, ACTIVITY_COLUMNS,
+         "SELECT id, action, description FROM myproject_activitylog"),
+        ("students", Student, STUDENT_FTS_TABLE, STUDENT_COLUMNS,
+         "SELECT id, student_id, last_name, first_name, COALESCE(middle_initial, '') FROM myproject_student"),
+    ):
+        connection = _connection(model)
+        if not _has_fts(connection, table):
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(f"INSERT INTO {table} (rowid, {columns}) {select}")
+            cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+            cursor.execute(f"SELECT count(*) FROM {table}")
+            counts[key] = cursor.fetchone()[0]
+    return counts
+
+
+# -----------------------------
+# Queries
+# -----------------------------
+def _ranked_ids(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _in_order(queryset, ids):
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+def search_students(user, query, limit=DEFAULT_LIMIT):
+    """The instructor's students best matching query (code or name prefixes)"""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    students = Student.objects.filter(class_obj__instructor=user).select_related("class_obj")
+    connection = _connection(Student)
+
+    if _has_fts(connection, STUDENT_FTS_TABLE):
+        ids = _ranked_ids(connection, f"""
+            SELECT s.id FROM {STUDENT_FTS_TABLE} f
+            JOIN myproject_student s ON s.id = f.rowid
+            JOIN myproject_class c ON c.id = s.class_obj_id
+            WHERE {STUDENT_FTS_TABLE} MATCH %s AND c.instructor_id = %s
+            ORDER BY bm25({STUDENT_FTS_TABLE}, {', '.join(map(str, STUDENT_WEIGHTS))})
+            LIMIT %s
+        """, [_match_expression(terms), user.pk, limit])
+        return _in_order(students, ids)
+
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = (
+            SearchVector("student_id", weight="A") + SearchVector("last_name", "first_name", weight="B")
+            + SearchVector("middle_initial", weight="D")
+        )
+        tsquery = SearchQuery(_tsquery(terms), search_type="raw")
+        return list(
+            students.annotate(document=vector, rank=SearchRank(vector, tsquery))
+            .filter(document=tsquery).order_by("-rank", "last_name", "first_name")[:limit]
+        )
+
+    for term in terms:
+        students = students.filter(
+            Q(student_id__icontains=term) | Q(last_name__icontains=term) | Q(first_name__icontains=term)
+        )
+    return list(students.order_by("last_name", "first_name")[:limit])
+
+
+def search_activities(user, query, limit=DEFAULT_LIMIT):
+    """The user's activity log entries best matching query"""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    activities = ActivityLog.objects.filter(user=user).prefetch_related("class_obj", "student")
+    connection = _connection(ActivityLog)
+
+    if _has_fts(connection, ACTIVITY_FTS_TABLE):
+        ids = _ranked_ids(connection, f"""
+            SELECT a.id FROM {ACTIVITY_FTS_TABLE} f
+            JOIN myproject_activitylog a ON a.id = f.rowid
+            WHERE {ACTIVITY_FTS_TABLE} MATCH %s AND a.user_id = %s
+            ORDER BY bm25({ACTIVITY_FTS_TABLE}, {', '.join(map(str, ACTIVITY_WEIGHTS))}), a.timestamp DESC
+            LIMIT %s
+        """, [_match_expression(terms), user.pk, limit])
+        return _in_order(activities, ids)
+
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = SearchVector("action", weight="A") + SearchVector("description", weight="B")
+        tsquery = SearchQuery(_tsquery(terms), search_type="raw")
+        return list(
+            activities.annotate(document=vector, rank=SearchRank(vector, tsquery))
+            .filter(document=tsquery).order_by("-rank", "-timestamp")[:limit]
+        )
+
+    for term in terms:
+        activities = activities.filter(Q(action__icontains=term) | Q(description__icontains=term))
+    return list(activities[:limit])
+
+
+def _tsquery(terms):
+    # Prefix match on every word; to_tsquery syntax characters are not \w
+    words = [word for term in terms for word in term.split("-") if word]
+    return " & ".join(f"{word}:*" for word in words)
@@ -0,0 +1,147 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import invalidate_class, invalidate_user
+from .models import (
+    Class, Student, Enrollment, Attendance, GradeSummary,
+    GradeCalculationSettings, GradeCategory, GradeItem, StudentScore, Setting, ActivityLog, User
+)
+from .preferences import invalidate_user_setting
+from .search import index_activities, index_students, unindex_activities, unindex_students
+
+
+# -----------------------------
+# Per-class change tracking
+# -----------------------------
+def mark_class_changed(*class_ids):
+    """
+    Bump Class.updated_at so cached pages for these classes revalidate, and
+    drop cached data derived from them (theirs and their instructors')
+    """
+    class_ids = {class_id for class_id in class_ids if class_id}
+    if class_ids:
+        _touch_classes(Class.objects.filter(id__in=class_ids))
+
+
+def _touch_classes(classes):
+    rows = list(classes.values_list('id', 'instructor_id'))
+    if not rows:
+        return
+    class_ids = [class_id for class_id, _ in rows]
+    Class.objects.filter(id__in=class_ids).update(updated_at=timezone.now())
+    invalidate_class(*class_ids)
+    invalidate_user(*{instructor_id for _, instructor_id in rows})
+
+
+def _is_cascade(sender, kwargs):
+    """True when the row is being removed as part of deleting its parent"""
+    origin = kwargs.get('origin')
+    return origin is not None and hasattr(origin, '_meta') and not isinstance(origin, sender)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+@receiver(post_save, sender=GradeSummary)
+@receiver(post_delete, sender=GradeSummary)
+@receiver(post_save, sender=GradeCalculationSettings)
+@receiver(post_delete, sender=GradeCalculationSettings)
+@receiver(post_save, sender=GradeCategory)
+@receiver(post_delete, sender=GradeCategory)
+def class_data_changed(sender, instance, **kwargs):
+    if _is_cascade(sender, kwargs):
+        return
+    mark_class_changed(instance.class_obj_id)
+
+
+@receiver(post_save, sender=GradeItem)
+@receiver(post_delete, sender=GradeItem)
+def grade_item_changed(sender, instance, **kwargs):
+    if _is_cascade(sender, kwargs):
+        return
+    _touch_classes(Class.objects.filter(grade_categories=instance.category_id))
+
+
+@receiver(post_save, sender=StudentScore)
+@receiver(post_delete, sender=StudentScore)
+def student_score_changed(sender, instance, **kwargs):
+    if _is_cascade(sender, kwargs):
+        return
+    _touch_classes(Class.objects.filter(grade_categories__items=instance.item_id))
+
+
+@receiver(post_save, sender=Class)
+@receiver(post_delete, sender=Class)
+def class_changed(sender, instance, **kwargs):
+    invalidate_class(instance.id)
+    invalidate_user(instance.instructor_id)
+
+
+# -----------------------------
+# Cached user settings
+# -----------------------------
+@receiver(post_save, sender=Setting)
+@receiver(post_delete, sender=Setting)
+def user_setting_changed(sender, instance, **kwargs):
+    invalidate_user_setting(instance.user_id)
+
+
+# -----------------------------
+# Activity counter
+# -----------------------------
+@receiver(post_save, sender=ActivityLog)
+def activity_logged(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.user_id).update(activity_count=F('activity_count') + 1)
+
+
+# -----------------------------
+# Activity log references (no FK constraints, see routers.py)
+# -----------------------------
+@receiver(pre_delete, sender=User)
+def user_activities_deleted(sender, instance, **kwargs):
+    ActivityLog.objects.filter(user_id=instance.pk).delete()
+
+
+@receiver(pre_delete, sender=Class)
+def class_activities_detached(sender, instance, **kwargs):
+    # Once, instead of once per cascaded student
+    student_ids = list(instance.students.values_list('id', flat=True))
+    ActivityLog.objects.filter(class_obj_id=instance.pk).update(class_obj=None)
+    if student_ids:
+        ActivityLog.objects.filter(student_id__in=student_ids).update(student=None)
+
+
+@receiver(post_delete, sender=Student)
+def student_activities_detached(sender, instance, **kwargs):
+    if _is_cascade(sender, kwargs):
+        return
+    ActivityLog.objects.filter(student_id=instance.pk).update(student=None)
+
+
+# -----------------------------
+# Search index (bulk writes index themselves, see search.py)
+# -----------------------------
+@receiver(post_save, sender=Student)
+def student_indexed(sender, instance, **kwargs):
+    index_students([instance])
+
+
+@receiver(post_delete, sender=Student)
+def student_unindexed(sender, instance, **kwargs):
+    unindex_students([instance.pk])
+
+
+@receiver(post_save, sender=ActivityLog)
+def activity_indexed(sender, instance, **kwargs):
+    index_activities([instance])
+
+
+@receiver(post_delete, sender=ActivityLog)
+def activity_unindexed(sender, instance, **kwargs):
+    unindex_activities([instance.pk])
@@ -1,3 +1,916 @@
-from django.test import TestCase
+"""
+Query budgets for every view in myproject/urls.py, plus behaviour tests of
+the caching, import, export and database layers.
 
-# Create your tests here.
+Each view is requested against two instructors whose synthetic data is
+identical except that every roster of the second is twice as long. A view
+fails when it runs more queries than its budget, or when doubling the
+roster adds queries (an N+1 loop such as a per-student
+Attendance.objects.filter(...).count()); the failure lists the repeated
+SQL, as the metrics middleware logs it in production.
+
+Requests run with a cleared cache so the cold path is what gets counted.
+When QUERY_BUDGET_TIMINGS names a CSV file, the query counts and timings
+of each run are appended to it for trend tracking.
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_started
+from django.db import OperationalError, connections
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+import openpyxl
+
+from . import autocomplete
+from .activity import ActivityBuffer, flush_activity_log, log_activity
+from .archive import _write_month, archive_activities, archive_path, archived_page, iter_archived_month
+from .autocomplete import autocomplete_students
+from .dashboard import WIDGETS as DASHBOARD_WIDGETS
+from .grading import recompute_grade_summaries
+from .importers import apply_student_batch
+from .jobs import AlreadyCommitted, _run_in_thread, commit_dry_run, resume_import_jobs, run_import_job
+from .metrics import RequestStats, query_timer, repeated_shapes
+from .models import (
+    ActivityLog, Attendance, Class, Enrollment, GradeCategory, GradeItem, ImportJob, Student, StudentScore, User,
+)
+from .preferences import get_user_setting, setting_cache_key
+from .search import _forget_fts_tables, _has_fts, search_activities
+from .writes import run_write
+
+SMALL_ROSTER = 10
+CLASSES_PER_INSTRUCTOR = 2
+ITEMS_PER_CATEGORY = 3
+ATTENDANCE_DAYS = 5
+STATUSES = ("Present", "Absent", "Late", "Excused")
+SCHOOL_YEAR = "25-1"
+FIRST_DAY = date(2025, 8, 4)
+# Timed repetitions per view and roster size; the median is recorded
+REPEATS = 3
+
+TIMINGS_FILE = os.environ.get("QUERY_BUDGET_TIMINGS")
+
+# Views whose template does not exist, or that delete data or end the session
+NOT_REQUESTED = {
+    "student_detail", "edit_student", "class_list", "grade_report", "class_summary",
+    "delete_class", "delete_student", "logout", "password_reset_confirm",
+}
+
+# "url name" or "url name:variant" -> (method, url(dataset), data(dataset) or None, query budget)
+# A dataset is the dict returned by QueryBudgetTests.seed().
+VIEWS = {
+    "index": ("get", lambda d: reverse("index"), None, 2),
+    "register": ("get", lambda d: reverse("register"), None, 2),
+    "verify_email": ("get", lambda d: reverse("verify_email"), None, 2),
+    "password_reset": ("get", lambda d: reverse("password_reset"), None, 4),
+    "password_reset_done": ("get", lambda d: reverse("password_reset_done"), None, 4),
+    "password_reset_complete": ("get", lambda d: reverse("password_reset_complete"), None, 4),
+    "about": ("get", lambda d: reverse("about"), None, 4),
+    "instructor_panel": ("get", lambda d: reverse("instructor_panel"), None, 2),
+    "dashboard": ("get", lambda d: reverse("dashboard"), None, 8),
+    "class_panel": ("get", lambda d: reverse("class_panel"), None, 6),
+    "class_detail": ("get", lambda d: reverse("class_detail", args=[d["class"].id]), None, 8),
+    "add_class": ("get", lambda d: reverse("add_class"), None, 4),
+    "edit_class": ("get", lambda d: reverse("edit_class", args=[d["class"].id]), None, 3),
+    "add_student": ("get", lambda d: reverse("add_student", args=[d["class"].id]), None, 5),
+    "grades_panel": (
+        "get",
+        lambda d: f"{reverse('grades_panel')}?class_id={d['class'].id}&category_id={d['category'].id}",
+        None, 17,
+    ),
+    "grades_panel:save_scores": (
+        "post", lambda d: reverse("grades_panel"),
+        lambda d: dict(
+            {"action": "save_scores", "selected_class_id": d["class"].id, "selected_category_id": d["category"].id},
+            **{f"scores-{student.id}-{item.id}": "15" for student in d["students"] for item in d["items"]},
+        ),
+        11,
+    ),
+    "grades_panel:compute_final": (
+        "post", lambda d: reverse("grades_panel"),
+        lambda d: {"action": "compute_final", "selected_class_id": d["class"].id}, 17,
+    ),
+    "import_scores": ("get", lambda d: reverse("import_scores", args=[d["class"].id]), None, 5),
+    "attendance_panel": (
+        "get", lambda d: f"{reverse('attendance_panel')}?class_id={d['class'].id}&date={FIRST_DAY}", None, 11,
+    ),
+    "attendance_panel:save": (
+        "post", lambda d: reverse("attendance_panel"),
+        lambda d: dict(
+            {"action": "save_attendance", "class_id": d["class"].id, "date": str(FIRST_DAY)},
+            **{f"attendance_{record.id}": "Late" for record in d["attendance"]},
+        ),
+        14,
+    ),
+    "update_attendance": (
+        "ajax", lambda d: reverse("update_attendance"),
+        lambda d: {"attendance_id": d["attendance"][0].id, "status": "Absent"}, 12,
+    ),
+    "update_attendance_ajax": (
+        "ajax", lambda d: reverse("update_attendance_ajax"),
+        lambda d: {"updates": [{"attendance_id": record.id, "status": "Excused"} for record in d["attendance"]]},
+        12,
+    ),
+    "attendance_summary": ("get", lambda d: reverse("attendance_summary", args=[d["class"].id]), None, 9),
+    "import_attendance": ("get", lambda d: reverse("import_attendance", args=[d["class"].id]), None, 5),
+    "profile": ("get", lambda d: reverse("profile"), None, 7),
+    "settings": ("get", lambda d: reverse("settings"), None, 5),
+    "upload_csv": ("get", lambda d: reverse("upload_csv", args=[d["class"].id]), None, 5),
+    "import_job_progress": ("get", lambda d: reverse("import_job_progress", args=[d["job"].id]), None, 5),
+    "commit_import_job": ("get", lambda d: reverse("commit_import_job", args=[d["job"].id]), None, 5),
+    "activity_log": ("get", lambda d: reverse("activity_log"), None, 8),
+    "activity_feed": ("get", lambda d: reverse("activity_feed"), None, 7),
+    "search": ("get", lambda d: f"{reverse('search')}?q=Last", None, 10),
+    "student_autocomplete": ("get", lambda d: f"{reverse('student_autocomplete')}?q=Las", None, 7),
+    "reports_panel": ("get", lambda d: reverse("reports_panel"), None, 6),
+    "attendance_report": ("get", lambda d: reverse("attendance_report", args=[d["class"].id]), None, 14),
+    "attendance_pdf": ("get", lambda d: reverse("attendance_pdf", args=[d["class"].id]), None, 9),
+    "attendance_excel": ("get", lambda d: reverse("attendance_excel", args=[d["class"].id]), None, 9),
+    "grades_pdf": ("get", lambda d: reverse("grades_pdf", args=[d["class"].id]), None, 8),
+    "grades_excel": ("get", lambda d: reverse("grades_excel", args=[d["class"].id]), None, 8),
+    "summary_pdf": ("get", lambda d: reverse("summary_pdf", args=[d["class"].id]), None, 10),
+    "summary_excel": ("get", lambda d: reverse("summary_excel", args=[d["class"].id]), None, 10),
+    "export_record_book": ("get", lambda d: reverse("export_record_book"), None, 18),
+    "export_all_data": ("get", lambda d: reverse("export_all_data"), None, 9),
+    "metrics": ("get", lambda d: reverse("metrics"), None, 4),
+}
+WIDGET_BUDGETS = {"stats": 9, "top-students": 6, "dropping-list": 8, "recent-classes": 6, "recent-activity": 6}
+VIEWS.update({
+    f"dashboard_widget:{name}": (
+        "get", lambda d, name=name: reverse("dashboard_widget", args=[name]), None, WIDGET_BUDGETS[name],
+    )
+    for name in DASHBOARD_WIDGETS
+})
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "query-budgets"}},
+    # Buffered activity is written once, at request end, inside the measured request
+    ACTIVITY_LOG_BUFFERED=True,
+    ACTIVITY_LOG_FLUSH_ON_REQUEST_END=True,
+    ACTIVITY_LOG_BUFFER_SIZE=10000,
+    ACTIVITY_LOG_FLUSH_INTERVAL=3600,
+    REPORT_EXPORT_WORKERS=1,
+    METRICS_TOKEN="",
+    # Keep job resumption off the test database connection
+    IMPORT_JOBS_ASYNC=False,
+)
+class QueryBudgetTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.small = cls.seed("budget-small", SMALL_ROSTER)
+        cls.large = cls.seed("budget-large", SMALL_ROSTER * 2)
+        flush_activity_log()
+
+    @classmethod
+    def seed(cls, username, roster):
+        user = User.objects.create_user(
+            username=username, password="1234", email=f"{username}@example.com", instructor_id=username,
+            is_staff=True,
+        )
+        classes = Class.objects.bulk_create([
+            Class(instructor=user, program="BSIT", subject=f"Subject {n}", year_level="1", section=str(n),
+                  semester="1st", school_year=SCHOOL_YEAR)
+            for n in range(CLASSES_PER_INSTRUCTOR)
+        ])
+        students = Student.objects.bulk_create([
+            Student(class_obj=class_obj, last_name=f"Last{n:03d}", first_name=f"First{n}",
+                    student_id=f"{username}-{class_obj.id}-{n:03d}", program="BSIT", year_level="1",
+                    section=class_obj.section, academic_year=SCHOOL_YEAR)
+            for class_obj in classes for n in range(roster)
+        ])
+        Enrollment.objects.bulk_create([Enrollment(student=s, class_obj_id=s.class_obj_id) for s in students])
+        categories = GradeCategory.objects.bulk_create([
+            GradeCategory(class_obj=class_obj, name=name, percentage=50)
+            for class_obj in classes for name in ("Quizzes", "Exams")
+        ])
+        items = GradeItem.objects.bulk_create([
+            GradeItem(category=category, item_name=f"{category.name} {n}", total_items=20)
+            for category in categories for n in range(ITEMS_PER_CATEGORY)
+        ])
+        class_of_category = {category.id: category.class_obj_id for category in categories}
+        StudentScore.objects.bulk_create([
+            StudentScore(student=student, item=item, score_percentage=(student.id + item.id) % 21)
+            for item in items for student in students
+            if student.class_obj_id == class_of_category[item.category_id]
+        ])
+        Attendance.objects.bulk_create([
+            Attendance(class_obj_id=student.class_obj_id, student=student,
+                       date=FIRST_DAY + timedelta(days=day), status=STATUSES[(student.id + day) % 4])
+            for student in students for day in range(ATTENDANCE_DAYS)
+        ])
+        for class_obj in classes:
+            recompute_grade_summaries(class_obj)
+        for student in students:
+            log_activity(user=user, action=f"Added {student.display_name}", class_obj=student.class_obj, student=student)
+
+        class_obj = classes[0]
+        return {
+            "user": user,
+            "class": class_obj,
+            "category": categories[0],
+            "students": [s for s in students if s.class_obj_id == class_obj.id],
+            "items": [i for i in items if class_of_category[i.category_id] == class_obj.id],
+            "attendance": list(Attendance.objects.filter(class_obj=class_obj, date=FIRST_DAY)),
+            "job": ImportJob.objects.create(
+                user=user, class_obj=class_obj, original_name="roster.csv", status="completed",
+                dry_run=True, finished_at=timezone.now(),
+            ),
+        }
+
+    def measure(self, dataset, method, url, data):
+        """(RequestStats, status code, seconds) of one cold request, counting queries on every connection"""
+        client = Client(HTTP_HOST="localhost")
+        client.force_login(dataset["user"])
+        cache.clear()
+        stats = RequestStats()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_timer(stats)))
+            started = time.perf_counter()
+            if method == "get":
+                response = client.get(url)
+            elif method == "ajax":
+                response = client.post(url, json.dumps(data), content_type="application/json",
+                                       HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+            else:
+                response = client.post(url, data)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            response.close()
+            seconds = time.perf_counter() - started
+        return stats, response.status_code, seconds
+
+    def run_view(self, name, dataset):
+        method, url, data, _ = VIEWS[name]
+        url, data = url(dataset), data(dataset) if data else None
+        runs = [self.measure(dataset, method, url, data) for _ in range(REPEATS)]
+        stats, status, _ = runs[0]
+        self.assertLess(status, 500, f"{name} returned {status}")
+        return stats, statistics.median(seconds for _, _, seconds in runs)
+
+    def test_every_url_is_covered(self):
+        from . import urls
+
+        covered = {name.split(":")[0] for name in VIEWS}
+        for pattern in urls.urlpatterns:
+            if pattern.name not in NOT_REQUESTED:
+                self.assertIn(pattern.name, covered, f"{pattern.name} has no query budget")
+
+    def test_query_budgets(self):
+        rows = []
+        run_at = timezone.now().isoformat(timespec="seconds")
+        for name, (_, _, _, budget) in VIEWS.items():
+            with self.subTest(view=name):
+                small, small_seconds = self.run_view(name, self.small)
+                large, large_seconds = self.run_view(name, self.large)
+                rows += [
+                    [run_at, name, SMALL_ROSTER, small.queries, f"{small_seconds * 1000:.2f}"],
+                    [run_at, name, SMALL_ROSTER * 2, large.queries, f"{large_seconds * 1000:.2f}"],
+                ]
+                repeated = "\n".join(f"  {count}x {shape[:200]}" for count, shape in repeated_shapes(large))
+                self.assertLessEqual(
+                    large.queries, small.queries,
+                    f"{name}: {small.queries} queries with {SMALL_ROSTER} students, {large.queries} with "
+                    f"{SMALL_ROSTER * 2}; repeated statements:\n{repeated}",
+                )
+                self.assertLessEqual(
+                    small.queries, budget,
+                    f"{name}: {small.queries} queries, budget {budget}; repeated statements:\n{repeated}",
+                )
+        record_timings(rows)
+
+
+def record_timings(rows):
+    if not TIMINGS_FILE:
+        return
+    new_file = not os.path.exists(TIMINGS_FILE)
+    with open(TIMINGS_FILE, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["run", "view", "students", "queries", "median_ms"])
+        writer.writerows(rows)
+
+
+def create_instructor(username):
+    return User.objects.create_user(
+        username=username, password="1234", email=f"{username}@example.com", instructor_id=username,
+    )
+
+
+def create_class(user, section="A"):
+    return Class.objects.create(
+        instructor=user, program="BSIT", subject="Subject", year_level="1", section=section,
+        semester="1st", school_year=SCHOOL_YEAR,
+    )
+
+
+def logged_in_client(user):
+    client = Client(HTTP_HOST="localhost")
+    client.force_login(user)
+    return client
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "server-timing"}},
+    IMPORT_JOBS_ASYNC=False,
+    METRICS_ENABLED=True,
+    METRICS_SERVER_TIMING=True,
+)
+class ServerTimingTests(TestCase):
+    def test_widget_timings_are_kept(self):
+        client = logged_in_client(create_instructor("timing"))
+        url = reverse("dashboard_widget", args=["stats"])
+        client.get(url)
+        timing = client.get(url)["Server-Timing"]
+        self.assertIn('total;desc="stats (hit)"', timing)
+        self.assertIn("db;dur=", timing)
+        self.assertIn("view;dur=", timing)
+
+
+@override_settings(ACTIVITY_LOG_BUFFERED=False, IMPORT_JOBS_ASYNC=False)
+class AttendanceLogImportTests(TestCase):
+    def test_unreadable_workbook_is_reported(self):
+        class_obj = create_class(create_instructor("importer"))
+        client = logged_in_client(class_obj.instructor)
+        response = client.post(reverse("import_attendance", args=[class_obj.id]), {
+            "log_file": SimpleUploadedFile("checkins.xlsx", b"not a workbook"),
+            "late_after": "08:00",
+        })
+        self.assertRedirects(
+            response, f"{reverse('attendance_panel')}?class_id={class_obj.id}", fetch_redirect_response=False,
+        )
+        errors = [str(m) for m in get_messages(response.wsgi_request)]
+        self.assertEqual(len(errors), 1)
+        self.assertTrue(errors[0].startswith("Error reading file:"), errors[0])
+
+
+@override_settings(ACTIVITY_LOG_BUFFERED=False)
+class ActivityRecountTests(TestCase):
+    def test_recount_includes_archived_entries(self):
+        user = create_instructor("recount")
+        for _ in range(3):
+            log_activity(user, "login", "Signed in")
+        User.objects.filter(pk=user.pk).update(activity_count=50)
+        with tempfile.TemporaryDirectory() as archive_dir, override_settings(ACTIVITY_ARCHIVE_DIR=archive_dir):
+            path = archive_path(user.pk, "2024-01")
+            path.parent.mkdir(parents=True)
+            _write_month(path, {
+                i: {"id": i, "action": "login", "description": "Signed in", "timestamp": f"2024-01-0{i}T08:00:00+00:00",
+                    "class_id": None, "class_name": None, "student_id": None, "student_name": None}
+                for i in (1, 2)
+            })
+            call_command("migrate_activity_log", recount=True, stdout=io.StringIO())
+        user.refresh_from_db()
+        self.assertEqual(user.activity_count, 5)
+
+
+@override_settings(ACTIVITY_LOG_BUFFERED=False, IMPORT_JOBS_ASYNC=False, METRICS_ENABLED=False)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.class_obj = create_class(create_instructor("conditional"))
+        self.student = Student.objects.create(
+            class_obj=self.class_obj, last_name="Cruz", first_name="Ana", student_id="C-001",
+            program="BSIT", year_level="1", section="A", academic_year=SCHOOL_YEAR,
+        )
+        self.client = logged_in_client(self.class_obj.instructor)
+        self.url = reverse("attendance_report", args=[self.class_obj.id])
+
+    def test_unchanged_report_is_not_modified(self):
+        # The first page sets the CSRF cookie, which is part of the ETag
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Attendance.objects.create(class_obj=self.class_obj, student=self.student, date=FIRST_DAY, status="Late")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_only_large_responses_are_gzipped(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertGreaterEqual(len(gzip.decompress(response.content)), settings.GZIP_MIN_LENGTH)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+        with override_settings(GZIP_MIN_LENGTH=10 ** 7):
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+@override_settings(ACTIVITY_LOG_BUFFERED=False, IMPORT_JOBS_ASYNC=False)
+class IncrementalExportTests(TestCase):
+    def sheet_rows(self, response, title):
+        workbook = openpyxl.load_workbook(io.BytesIO(response.content), read_only=True)
+        return [row for row in workbook[title].iter_rows(min_row=2, values_only=True)]
+
+    def test_since_cursor_exports_only_changed_rows(self):
+        class_obj = create_class(create_instructor("exporter"))
+        students = [
+            Student.objects.create(
+                class_obj=class_obj, last_name=name, first_name="Ana", student_id=f"E-{n}",
+                program="BSIT", year_level="1", section="A", academic_year=SCHOOL_YEAR,
+            )
+            for n, name in enumerate(["Cruz", "Reyes"])
+        ]
+        Attendance.objects.create(class_obj=class_obj, student=students[0], date=FIRST_DAY, status="Present")
+        client = logged_in_client(class_obj.instructor)
+
+        response = client.get(reverse("export_all_data"))
+        self.assertEqual([row[0] for row in self.sheet_rows(response, "Students")], ["E-0", "E-1"])
+        cursor = response["X-Export-Cursor"]
+        self.assertEqual(self.sheet_rows(response, "Export Info")[0][2], cursor)
+
+        # Everything so far is older than the cursor's overlap window
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Student.objects.update(updated_at=an_hour_ago)
+        Attendance.objects.update(updated_at=an_hour_ago)
+        students[1].last_name = "Santos"
+        students[1].save()
+
+        response = client.get(reverse("export_all_data"), {"since": cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row[:2] for row in self.sheet_rows(response, "Students")], [("E-1", "Santos")])
+        self.assertEqual(self.sheet_rows(response, "Attendance"), [])
+        self.assertGreater(response["X-Export-Cursor"], cursor)
+
+    def test_invalid_cursor_is_rejected(self):
+        client = logged_in_client(create_instructor("exporter"))
+        self.assertEqual(client.get(reverse("export_all_data"), {"since": "yesterday"}).status_code, 400)
+
+
+ROSTER_HEADER = "Code,Last Name,First Name,Middle Name,Sex,Course,Year,Units,Section"
+
+
+def roster_file(*rows, name="roster.csv"):
+    return SimpleUploadedFile(name, "\n".join((ROSTER_HEADER,) + rows).encode("utf-8"))
+
+
+@override_settings(ACTIVITY_LOG_BUFFERED=False, IMPORT_JOBS_ASYNC=False)
+class RosterImportTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.class_obj = create_class(create_instructor("roster"))
+        self.client = logged_in_client(self.class_obj.instructor)
+
+    def upload(self, roster, class_obj=None, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("upload_csv", args=[(class_obj or self.class_obj).id]), dict(data, csv_file=roster),
+            )
+        return response
+
+    def test_roster_is_upserted_and_bad_rows_reported(self):
+        self.upload(roster_file("S-1,Cruz,Ana,B,F,BSIT,1,3,A", "S-2,Reyes,Ben,,M,BSIT,1,3,A"))
+        self.assertEqual(Student.objects.filter(class_obj=self.class_obj).count(), 2)
+
+        self.upload(roster_file(
+            "S-1,Cruz,Ana,B,F,BSIT,1,3,A",      # unchanged
+            "S-2,Reyes,Benjamin,,M,BSIT,1,3,A",  # renamed
+            "S-3,Santos,Carla,,F,BSIT,1,3,A",    # new
+            "S-3,Santos,Carla,,F,BSIT,1,3,A",    # repeated in the file
+            "S-4,,Dan,,M,BSIT,1,3,A",            # no last name
+            "S-5,Lim,Eve,,F,BSIT,1,3," + "X" * 200,
+        ))
+        job = ImportJob.objects.latest("id")
+        self.assertEqual(job.status, "completed")
+        self.assertEqual((job.created_count, job.updated_count, job.unchanged_count), (1, 1, 1))
+        self.assertEqual(
+            [(error["row"], error["code"], error["message"]) for error in job.errors],
+            [(5, "S-3", "Duplicate code in file"), (6, "S-4", "Missing last name"),
+             (7, "S-5", "Section is longer than 50 characters")],
+        )
+        self.assertEqual(
+            sorted(Student.objects.filter(class_obj=self.class_obj).values_list("student_id", "first_name")),
+            [("S-1", "Ana"), ("S-2", "Benjamin"), ("S-3", "Carla")],
+        )
+
+    def test_dry_run_previews_the_diff_and_commits_once(self):
+        self.upload(roster_file("S-1,Cruz,Ana,B,F,BSIT,1,3,A", "S-2,Reyes,Ben,,M,BSIT,1,3,A"))
+        self.upload(roster_file(
+            "S-1,Cruz,Ana,B,F,BSIT,1,3,A",
+            "S-2,Reyes,Benjamin,,M,BSIT,1,3,A",
+            "S-3,Santos,Carla,,F,BSIT,1,3,A",
+        ), dry_run="on")
+        preview = ImportJob.objects.latest("id")
+        self.assertTrue(preview.dry_run)
+        self.assertEqual((preview.created_count, preview.updated_count, preview.unchanged_count), (1, 1, 1))
+        self.assertEqual(preview.diff, {
+            "inserted": [{"row": 4, "code": "S-3"}],
+            "changed": [{"row": 3, "code": "S-2", "fields": ["first_name"]}],
+        })
+        # Nothing was written
+        self.assertEqual(Student.objects.get(student_id="S-2").first_name, "Ben")
+        self.assertFalse(Student.objects.filter(student_id="S-3").exists())
+
+        url = reverse("commit_import_job", args=[preview.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url).status_code, 200)
+        preview.refresh_from_db()
+        committed = preview.committed_job
+        self.assertEqual((committed.status, committed.created_count, committed.updated_count), ("completed", 1, 1))
+        self.assertEqual(Student.objects.get(student_id="S-2").first_name, "Benjamin")
+
+        # A second submit (another tab, a double click) imports nothing
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse("upload_csv", args=[self.class_obj.id]), fetch_redirect_response=False)
+        self.assertEqual(
+            [str(m) for m in get_messages(response.wsgi_request)], ["This preview has already been imported."],
+        )
+        with self.assertRaises(AlreadyCommitted):
+            commit_dry_run(ImportJob.objects.get(pk=preview.pk))
+        self.assertEqual(ImportJob.objects.count(), 3)
+
+    def test_other_instructors_class_is_not_found(self):
+        other = create_class(create_instructor("other"))
+        response = self.upload(roster_file("S-1,Cruz,Ana,B,F,BSIT,1,3,A"), class_obj=other)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Student.objects.exists())
+        self.assertFalse(ImportJob.objects.exists())
+
+
+class _WorkerDied(BaseException):
+    """Stands in for a worker process killed mid-import (not caught by run_import_job)"""
+
+
+@override_settings(ACTIVITY_LOG_BUFFERED=False, IMPORT_JOBS_ASYNC=False, IMPORT_JOB_BATCH_SIZE=2)
+class ImportJobResumeTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def test_abandoned_job_resumes_from_its_checkpoint(self):
+        class_obj = create_class(create_instructor("resume"))
+        job = ImportJob(user=class_obj.instructor, class_obj=class_obj, original_name="roster.csv")
+        job.file.save("roster.csv", roster_file(*(f"R-{n},Last{n},First{n},,F,BSIT,1,3,A" for n in range(5))))
+
+        batches = []
+
+        def die_on_second_batch(*args, **kwargs):
+            batches.append(args[1])
+            if len(batches) == 2:
+                raise _WorkerDied
+            return apply_student_batch(*args, **kwargs)
+
+        with mock.patch("myproject.jobs.apply_student_batch", side_effect=die_on_second_batch):
+            with self.assertRaises(_WorkerDied):
+                run_import_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_processed, job.created_count), ("running", 2, 2))
+
+        # Not abandoned until it has made no progress for IMPORT_JOB_STALE_SECONDS
+        self.assertEqual(resume_import_jobs(), [])
+        ImportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(resume_import_jobs(), [job.pk])
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_processed, job.created_count, job.errors), ("completed", 5, 5, []))
+        self.assertEqual(
+            sorted(Student.objects.values_list("student_id", flat=True)), [f"R-{n}" for n in range(5)],
+        )
+
+    @override_settings(IMPORT_JOBS_ASYNC=True)
+    def test_requests_hand_resumption_to_the_pool_once_per_interval(self):
+        with mock.patch("myproject.jobs._get_executor") as executor, mock.patch("myproject.jobs._last_resume", None):
+            for _ in range(3):
+                request_started.send(sender=self.__class__)
+            executor.return_value.submit.assert_called_once_with(_run_in_thread, resume_import_jobs)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "user-setting"}},
+)
+class UserSettingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = create_instructor("setting")
+
+    def cached(self):
+        return cache.get(setting_cache_key(self.user.pk))
+
+    def test_replica_reads_are_not_cached(self):
+        with mock.patch("myproject.preferences.reading_from_replica", return_value=True):
+            get_user_setting(self.user)
+        self.assertIsNone(self.cached())
+        get_user_setting(User.objects.get(pk=self.user.pk))
+        self.assertIsNotNone(self.cached())
+
+    def test_saved_setting_is_dropped_on_commit(self):
+        setting = get_user_setting(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            setting.school_year = "25-2"
+            setting.save()
+            # Still cached until the save commits
+            self.assertIsNotNone(self.cached())
+        self.assertIsNone(self.cached())
+        self.assertEqual(get_user_setting(User.objects.get(pk=self.user.pk)).school_year, "25-2")
+
+
+@override_settings(ACTIVITY_LOG_BUFFERED=True, ACTIVITY_LOG_BUFFER_SIZE=10000)
+class ActivityBufferTests(TestCase):
+    def setUp(self):
+        # Flushed by the test only, not by a background thread
+        patcher = mock.patch.object(ActivityBuffer, "_ensure_thread")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = ActivityBuffer()
+        self.users = [create_instructor("buffer-a"), create_instructor("buffer-b")]
+
+    def fill(self):
+        for user, count in zip(self.users, (3, 2)):
+            for n in range(count):
+                self.buffer.add(ActivityLog(user=user, action=f"Buffered action {n}", timestamp=timezone.now()))
+
+    def activity_counts(self):
+        return [User.objects.get(pk=user.pk).activity_count for user in self.users]
+
+    def test_flush_writes_entries_and_bumps_counts(self):
+        self.fill()
+        self.assertFalse(ActivityLog.objects.exists())
+        self.assertEqual(self.buffer.flush(), 5)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(ActivityLog.objects.filter(user=self.users[0]).count(), 3)
+        self.assertEqual(self.activity_counts(), [3, 2])
+        self.assertEqual(len(search_activities(self.users[0], "buffered")), 3)
+
+    def test_failed_insert_is_kept_for_the_next_flush(self):
+        self.fill()
+        with mock.patch("myproject.activity.index_activities", side_effect=RuntimeError("index unavailable")):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertFalse(ActivityLog.objects.exists())
+        self.assertEqual(self.activity_counts(), [0, 0])
+
+        self.assertEqual(self.buffer.flush(), 5)
+        self.assertEqual(ActivityLog.objects.count(), 5)
+        self.assertEqual(self.activity_counts(), [3, 2])
+
+    def test_failed_counter_update_does_not_log_twice(self):
+        self.fill()
+        with mock.patch("myproject.activity._bump_activity_counts", side_effect=RuntimeError("counter failed")):
+            self.assertEqual(self.buffer.flush(), 5)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(ActivityLog.objects.count(), 5)
+        self.assertEqual(self.activity_counts(), [0, 0])
+
+
+@override_settings(ACTIVITY_LOG_BUFFERED=False, TIME_ZONE="UTC")
+class ActivityArchiveTests(TestCase):
+    def setUp(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        archive_settings = override_settings(ACTIVITY_ARCHIVE_DIR=archive_dir.name)
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+        self.users = [create_instructor("archive-a"), create_instructor("archive-b")]
+        self.logged = {}
+        for user in self.users:
+            for day in range(1, 61, 4):
+                timestamp = timezone.make_aware(datetime(2024, 1, 1, 8)) + timedelta(days=day)
+                entry = ActivityLog.objects.create(user=user, action=f"Day {day}", timestamp=timestamp)
+                self.logged.setdefault((user.pk, f"{timestamp:%Y-%m}"), []).append(entry.pk)
+        ActivityLog.objects.create(user=self.users[0], action="Recent")
+
+    def test_each_month_is_written_once_newest_first(self):
+        before = timezone.make_aware(datetime(2024, 6, 1))
+        self.assertEqual(
+            archive_activities(before, batch_size=4, dry_run=True),
+            {key: len(ids) for key, ids in self.logged.items()},
+        )
+        self.assertEqual(ActivityLog.objects.count(), 31)
+
+        with mock.patch("myproject.archive._write_month", side_effect=_write_month) as write_month:
+            totals = archive_activities(before, batch_size=4)
+        self.assertEqual(totals, {key: len(ids) for key, ids in self.logged.items()})
+        self.assertEqual(write_month.call_count, len(self.logged))
+        self.assertEqual(list(ActivityLog.objects.values_list("action", flat=True)), ["Recent"])
+
+        for (user_id, month), ids in self.logged.items():
+            archived = list(iter_archived_month(User.objects.get(pk=user_id), month))
+            self.assertEqual([activity.pk for activity in archived], ids[::-1])
+
+        # Archiving again is a no-op; a page stops at the limit and resumes from its cursor
+        self.assertEqual(archive_activities(before), {})
+        user, month = self.users[0], "2024-01"
+        first, cursor = archived_page(user, month, limit=3)
+        rest, last_cursor = archived_page(user, month, cursor=cursor, limit=50)
+        self.assertEqual([a.pk for a in first + rest], self.logged[(user.pk, month)][::-1])
+        self.assertIsNone(last_cursor)
+
+
+class FullTextTableLookupTests(TestCase):
+    def test_missing_table_is_looked_up_once_until_the_next_migrate(self):
+        connection = connections["default"]
+        with mock.patch.object(connection.introspection, "table_names", return_value=[]) as table_names:
+            self.assertFalse(_has_fts(connection, "myproject_missing_fts"))
+            self.assertFalse(_has_fts(connection, "myproject_missing_fts"))
+            self.assertEqual(table_names.call_count, 1)
+            _forget_fts_tables()
+            self.assertFalse(_has_fts(connection, "myproject_missing_fts"))
+            self.assertEqual(table_names.call_count, 2)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "autocomplete"}},
+    ACTIVITY_LOG_BUFFERED=False,
+)
+class StudentAutocompleteTests(TestCase):
+    STUDENTS = 10000
+    LAST_NAMES = ("Cruz", "Dela Cruz", "Garcia", "Reyes", "Santos", "Bautista", "Ocampo", "Mendoza")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_instructor("autocomplete")
+        classes = [create_class(cls.user, section=str(n)) for n in range(10)]
+        Student.objects.bulk_create([
+            Student(class_obj=classes[n % len(classes)], last_name=cls.LAST_NAMES[n % len(cls.LAST_NAMES)],
+                    first_name=f"Name{n:05d}", student_id=f"2025-{n:05d}", program="BSIT", year_level="1",
+                    section="A", academic_year=SCHOOL_YEAR)
+            for n in range(cls.STUDENTS)
+        ], batch_size=1000)
+        cls.class_obj = classes[0]
+
+    def setUp(self):
+        cache.clear()
+        autocomplete._local.clear()
+
+    def test_warm_lookups_at_10k_students(self):
+        autocomplete_students(self.user, SCHOOL_YEAR, "cru")
+        queries = ["2025-0", "2025-09999", "cruz", "dela", "name0", "santos name01", "Ócampo", "zz"] * 25
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            autocomplete_students(self.user, SCHOOL_YEAR, query)
+            timings.append(time.perf_counter() - started)
+        self.assertLess(statistics.median(timings), 0.020)
+
+        self.assertEqual([s["student_id"] for s in autocomplete_students(self.user, SCHOOL_YEAR, "2025-0999")],
+                         [f"2025-0999{n}" for n in range(10)])
+        # Keys are ranked alphabetically, "cruz name00000" before "cruz name00008"...
+        matches = autocomplete_students(self.user, SCHOOL_YEAR, "cruz", limit=3)
+        self.assertEqual([s["name"] for s in matches], ["Cruz, Name00000", "Cruz, Name00008", "Cruz, Name00016"])
+        # ...and "dela cruz" matches by last name, not by its second word
+        dela_cruz = autocomplete_students(self.user, SCHOOL_YEAR, "dela c")
+        self.assertTrue(dela_cruz and all(s["last_name"] == "Dela Cruz" for s in dela_cruz))
+        accented = autocomplete_students(self.user, SCHOOL_YEAR, "ócampo name00006")
+        self.assertEqual(accented[0]["student_id"], "2025-00006")
+
+    def test_roster_change_invalidates_the_index(self):
+        self.assertEqual(autocomplete_students(self.user, SCHOOL_YEAR, "villanueva"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Student.objects.create(
+                class_obj=self.class_obj, last_name="Villanueva", first_name="Ana", student_id="2025-NEW",
+                program="BSIT", year_level="1", section="A", academic_year=SCHOOL_YEAR,
+            )
+        self.assertEqual(
+            [s["student_id"] for s in autocomplete_students(self.user, SCHOOL_YEAR, "villanueva")], ["2025-NEW"],
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "replica"}},
+    # The test database stands in for the replica; what is checked is where reads are sent
+    REPLICA_DATABASE="default",
+    ACTIVITY_LOG_BUFFERED=False,
+    IMPORT_JOBS_ASYNC=False,
+    METRICS_ENABLED=False,
+)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.user = create_instructor("replica")
+        get_user_setting(self.user)
+        self.client = logged_in_client(self.user)
+
+    def reads_from_replica(self, path=None):
+        response = self.client.get(path or reverse("student_autocomplete"), {"q": "a"})
+        self.assertEqual(response.status_code, 200)
+        return response.wsgi_request.replica_state.use_replica
+
+    def test_session_stays_on_the_primary_after_a_write(self):
+        self.assertTrue(self.reads_from_replica())
+        # Not in REPLICA_READ_VIEWS
+        self.assertFalse(self.reads_from_replica(reverse("class_panel")))
+
+        response = self.client.post(reverse("class_panel"), {
+            "subject": "Databases", "program": "BSIT", "year_level": "1st Year", "section": "B",
+            "semester": "1st Semester", "school_year": SCHOOL_YEAR,
+        })
+        self.assertTrue(response.wsgi_request.replica_state.wrote)
+        self.assertTrue(Class.objects.filter(instructor=self.user, subject="Databases").exists())
+
+        self.assertFalse(self.reads_from_replica())
+        later = time.time() + settings.REPLICA_STICKY_SECONDS + 1
+        with mock.patch("myproject.middleware.time.time", return_value=later):
+            self.assertTrue(self.reads_from_replica())
+
+
+@override_settings(ACTIVITY_LOG_BUFFERED=False, IMPORT_JOBS_ASYNC=False, METRICS_ENABLED=False)
+class AttendanceUpdateTests(TestCase):
+    def test_rejected_updates_are_reported(self):
+        class_obj = create_class(create_instructor("attendance"))
+        student = Student.objects.create(
+            class_obj=class_obj, last_name="Cruz", first_name="Ana", student_id="A-001",
+            program="BSIT", year_level="1", section="A", academic_year=SCHOOL_YEAR,
+        )
+        record = Attendance.objects.create(class_obj=class_obj, student=student, date=FIRST_DAY, status="Present")
+        foreign = create_class(create_instructor("other"), section="B")
+        other = Attendance.objects.create(
+            class_obj=foreign, date=FIRST_DAY, status="Present",
+            student=Student.objects.create(
+                class_obj=foreign, last_name="Reyes", first_name="Ben", student_id="A-002",
+                program="BSIT", year_level="1", section="B", academic_year=SCHOOL_YEAR,
+            ),
+        )
+        client = logged_in_client(class_obj.instructor)
+
+        def post(*updates):
+            response = client.post(
+                reverse("update_attendance_ajax"),
+                json.dumps({"updates": [{"attendance_id": pk, "status": status} for pk, status in updates]}),
+                content_type="application/json", HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+            )
+            return response.json()
+
+        result = post((record.id, "Late"), (other.id, "Absent"), (record.id + 1000, "Absent"))
+        self.assertEqual((result["success"], result["updated"]), (True, 1))
+        self.assertEqual(
+            sorted((r["attendance_id"], r["message"]) for r in result["rejected"]),
+            [(other.id, "Attendance record not found or access denied"),
+             (record.id + 1000, "Attendance record not found or access denied")],
+        )
+        record.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((record.status, other.status), ("Late", "Present"))
+
+        result = post((record.id, "Sleeping"))
+        self.assertFalse(result["success"])
+        self.assertEqual(result["rejected"], [
+            {"attendance_id": record.id, "status": "Sleeping", "message": "Invalid attendance status"},
+        ])
+        record.refresh_from_db()
+        self.assertEqual(record.status, "Late")
+
+
+@override_settings(WRITE_RETRY_ATTEMPTS=4, SERIALIZE_DB_WRITES=False)
+class RetriedWriteTests(TransactionTestCase):
+    # run_write() never retries inside an outer transaction, so no TestCase wrapping here
+
+    def attempt(self, errors):
+        """A write that creates a user, then fails with the next of errors (if any)"""
+        calls = []
+
+        def write():
+            create_instructor(f"retry-{len(calls)}")
+            calls.append(1)
+            if errors:
+                raise errors.pop(0)
+            return "written"
+        return write, calls
+
+    def test_locked_database_is_retried_with_backoff(self):
+        write, calls = self.attempt([OperationalError("database is locked")] * 2)
+        with mock.patch("myproject.writes.time.sleep") as sleep:
+            self.assertEqual(run_write("test", write), "written")
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+        for attempt, (args, _) in enumerate(sleep.call_args_list):
+            self.assertLessEqual(args[0], settings.WRITE_RETRY_BASE_DELAY * 2 ** attempt)
+        # The failed attempts were rolled back
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["retry-2"])
+
+    def test_other_errors_and_exhausted_retries_raise(self):
+        write, calls = self.attempt([OperationalError("no such table: x")])
+        with self.assertRaisesMessage(OperationalError, "no such table"):
+            run_write("test", write)
+        self.assertEqual(len(calls), 1)
+
+        write, calls = self.attempt([OperationalError("database is locked")] * 4)
+        with mock.patch("myproject.writes.time.sleep"), self.assertRaisesMessage(OperationalError, "locked"):
+            run_write("test", write)
+        self.assertEqual(len(calls), 4)
+        self.assertFalse(User.objects.exists())
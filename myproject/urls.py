@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path("", views.index, name="index"),
     path("dashboard/", views.dashboard, name="dashboard"),
+    path("dashboard/widgets/<slug:name>/", views.dashboard_widget, name="dashboard_widget"),
     path("logout/", views.logout_view, name="logout"),
     
     # Class Management
@@ -24,6 +25,7 @@ urlpatterns = [
     path("instructor/", views.instructor_panel, name="instructor_panel"),
     # path("students/", views.student_panel, name="student_panel"),
     path("grades/", views.grades_panel, name="grades_panel"),
+    path("grades/<int:class_id>/import-scores/", views.import_scores_view, name="import_scores"),
     path("profile/", views.profile_view, name="profile"),
     # path("score/", views.score_input, name="score_input"),
     path("class/add/", views.add_class, name="add_class"),
@@ -41,6 +43,7 @@ urlpatterns = [
     path("attendance/", views.attendance_panel, name="attendance_panel"),
     path("attendance/update/", views.update_attendance, name="update_attendance"),
     path("attendance/summary/<int:class_id>/", views.attendance_summary, name="attendance_summary"),
+    path("attendance/<int:class_id>/import-logs/", views.import_attendance_view, name="import_attendance"),
     
     # Profile and Settings
     path("profile/", views.profile_view, name="profile"),
@@ -48,9 +51,16 @@ urlpatterns = [
     
     # CSV Upload
     path("class/<int:class_id>/upload-csv/", views.upload_students_csv, name="upload_csv"),
+    path("imports/<int:job_id>/progress/", views.import_job_progress, name="import_job_progress"),
+    path("imports/<int:job_id>/commit/", views.commit_import_job, name="commit_import_job"),
     
     # Activity Log
     path("activity-log/", views.activity_log, name="activity_log"),
+    path("activity-log/feed/", views.activity_feed, name="activity_feed"),
+
+    # Search
+    path("search/", views.search_view, name="search"),
+    path("students/autocomplete/", views.student_autocomplete, name="student_autocomplete"),
     
     # About Page
     path("about/", views.about_view, name="about"),
@@ -67,10 +77,14 @@ urlpatterns = [
     path("reports/grades/<int:class_id>/excel/", views.generate_grades_excel, name="grades_excel"),
     path("reports/summary/<int:class_id>/pdf/", views.generate_summary_pdf, name="summary_pdf"),
     path("reports/summary/<int:class_id>/excel/", views.generate_summary_excel, name="summary_excel"),
+    path("reports/record-book/", views.export_record_book, name="export_record_book"),
     # Data Export
     path("export/all-data/", views.export_all_data, name="export_all_data"),
     path("attendance/update-ajax/", views.update_attendance_ajax, name="update_attendance_ajax"),
 
+    # Monitoring
+    path("metrics/", views.metrics_view, name="metrics"),
+
 
 
 ]
@@ -1,32 +1,54 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.http import (
+    Http404, JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse,
+)
 from django.utils import timezone
 from django.db.models import Q, Count, Avg, Prefetch, Sum
 from datetime import datetime, date
-import csv
+import hmac
 import json
+import time
 from .forms import (
     RegisterForm, ClassForm, StudentForm, AttendanceForm, ScoreForm,
     GradeCalculationSettingsForm, CSVUploadForm, ProfileUpdateForm
 )
 from .models import (
     User, Class, Student, GradeSummary, Setting, UserSettings,
-    Attendance, Score, GradeCalculationSettings, ActivityLog,
+    Attendance, Score, GradeCalculationSettings,
     GradeCategory, GradeItem, StudentScore, TransmutationTable,
-    EmailVerification
+    EmailVerification, ImportJob
 )
 from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
-import csv
-import io
-import openpyxl
-import unicodedata 
-from django.db import transaction
+from django.views.decorators.http import condition
+from .activity import PAGE_SIZE as ACTIVITY_PAGE_SIZE, activity_json, activity_page, log_activity
+from .archive import archived_months, archived_page
+from .autocomplete import DEFAULT_LIMIT as AUTOCOMPLETE_LIMIT, autocomplete_students
+from .conditional import class_etag, class_last_modified, instructor_classes_etag
+from .dashboard import WIDGETS as DASHBOARD_WIDGETS, UNCACHED_WIDGETS as UNCACHED_DASHBOARD_WIDGETS, widget_data
+from .exports import build_data_export, parse_cursor
+from .grading import InvalidCategoryWeights, recompute_grade_summaries
+from .importers import (
+    DEFAULT_TOTAL_ITEMS, UnsupportedFileType, header_problems, import_attendance_logs, import_scores,
+    iter_upload_rows, normalize_headers, upsert_scores,
+)
+from .jobs import AlreadyCommitted, commit_dry_run, enqueue_import_job
+from .metrics import render_prometheus
+from .preferences import DEFAULT_SCHOOL_YEAR, DEFAULT_THEME, get_user_setting
+from .reports import attendance_rows, grade_rows, student_attendance_stats, summary_rows, stream_record_book
+from .search import (
+    DEFAULT_LIMIT as SEARCH_DEFAULT_LIMIT, MAX_LIMIT as SEARCH_MAX_LIMIT, backend_name as search_backend,
+    search_activities, search_students,
+)
+from .signals import mark_class_changed
+from .workbooks import attendance_workbook, grades_workbook, summary_workbook
+from .writes import run_write
 
 # -----------------------------
 # HELPER FUNCTIONS
@@ -34,20 +56,16 @@ from django.db import transaction
 def get_current_school_year(user):
     """Get the current school year setting for the user"""
     try:
-        setting, created = Setting.objects.get_or_create(
-            user=user,
-            defaults={'school_year': '25-1', 'theme': 'light'}
-        )
-        return setting.school_year or '25-1'
+        return get_user_setting(user).school_year or DEFAULT_SCHOOL_YEAR
     except Exception:
-        return "25-1"
+        return DEFAULT_SCHOOL_YEAR
 
 def get_user_theme(user):
     """Get the current theme setting for the user"""
     try:
-        return user.app_setting.theme
+        return get_user_setting(user).theme
     except:
-        return "light"  # Default fallback
+        return DEFAULT_THEME  # Default fallback
 
 # -----------------------------
 # EMAIL VERIFICATION HELPER
@@ -293,80 +311,34 @@ def verify_email(request):
 
 @login_required
 def dashboard(request):
-    # Get current school year
-    current_school_year = get_current_school_year(request.user)
-    
-    # Basic statistics - filtered by school year
-    total_classes = Class.objects.filter(instructor=request.user, school_year=current_school_year).count()
-    total_students = Student.objects.filter(class_obj__instructor=request.user, class_obj__school_year=current_school_year).distinct().count()
-    pending_grades = GradeSummary.objects.filter(class_obj__instructor=request.user, class_obj__school_year=current_school_year, is_locked=False).count()
-
-    # Recent activities
-    recent_activities = ActivityLog.objects.filter(user=request.user)[:10]
-
-    # Top performing students - filtered by school year
-    top_students = GradeSummary.objects.filter(
-        class_obj__instructor=request.user,
-        class_obj__school_year=current_school_year
-    ).order_by('-final_grade')[:5]
-
-    # Attendance statistics - filtered by school year
-    total_attendance_records = Attendance.objects.filter(class_obj__instructor=request.user, class_obj__school_year=current_school_year).count()
-    present_count = Attendance.objects.filter(class_obj__instructor=request.user, class_obj__school_year=current_school_year, status='Present').count()
-    absent_count = Attendance.objects.filter(class_obj__instructor=request.user, class_obj__school_year=current_school_year, status='Absent').count()
-    late_count = Attendance.objects.filter(class_obj__instructor=request.user, class_obj__school_year=current_school_year, status='Late').count()
-    excused_count = Attendance.objects.filter(class_obj__instructor=request.user, class_obj__school_year=current_school_year, status='Excused').count()
-
-    # Calculate attendance percentage
-    attendance_percentage = (present_count / total_attendance_records * 100) if total_attendance_records > 0 else 0
-
-    # Class distribution by semester - filtered by school year
-    class_distribution = Class.objects.filter(instructor=request.user, school_year=current_school_year).values('semester').annotate(count=Count('id'))
-
-    # Recent classes - filtered by school year
-    recent_classes = Class.objects.filter(instructor=request.user, school_year=current_school_year).order_by('-id')[:5]
-
-    # Students with low attendance (for dropping list) - filtered by school year
-    dropping_list = []
-    for class_obj in Class.objects.filter(instructor=request.user, school_year=current_school_year):
-        students = Student.objects.filter(class_obj=class_obj)
-        for student in students:
-            total_days = Attendance.objects.filter(student=student, class_obj=class_obj).count()
-            absent_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Absent').count()
-            if total_days > 0:
-                absence_rate = (absent_days / total_days) * 100
-                if absence_rate > 20:  # More than 20% absence
-                    dropping_list.append({
-                        'student': student,
-                        'class': class_obj,
-                        'absence_rate': round(absence_rate, 2)
-                    })
-
-    # Sort by absence rate
-    dropping_list.sort(key=lambda x: x['absence_rate'], reverse=True)
-    dropping_list = dropping_list[:10]  # Top 10
-
+    # Widgets load their data from dashboard_widget after the page renders
     context = {
-        "total_classes": total_classes,
-        "total_students": total_students,
-        "pending_grades": pending_grades,
-        "recent_activities": recent_activities,
-        "top_students": top_students,
-        "total_attendance_records": total_attendance_records,
-        "present_count": present_count,
-        "absent_count": absent_count,
-        "late_count": late_count,
-        "excused_count": excused_count,
-        "attendance_percentage": round(attendance_percentage, 2),
-        "class_distribution": list(class_distribution),
-        "recent_classes": recent_classes,
-        "dropping_list": dropping_list,
-        "current_school_year": current_school_year,
+        "current_school_year": get_current_school_year(request.user),
+        "widget_urls": {
+            name.replace("-", "_"): reverse("dashboard_widget", args=[name]) for name in DASHBOARD_WIDGETS
+        },
     }
-    
     context['user_theme'] = get_user_theme(request.user)
     return render(request, "dashboard.html", context)
 
+
+@login_required
+def dashboard_widget(request, name):
+    """JSON data for one dashboard widget, with its timings in a Server-Timing header"""
+    if name not in DASHBOARD_WIDGETS:
+        raise Http404("Unknown dashboard widget")
+    started = time.perf_counter()
+    data, compute_seconds = widget_data(request.user, get_current_school_year(request.user), name)
+    response = JsonResponse({"widget": name, "data": data})
+
+    timings = []
+    if compute_seconds is not None:
+        timings.append(f'compute;desc="{name}";dur={compute_seconds * 1000:.1f}')
+    cache_state = "uncached" if name in UNCACHED_DASHBOARD_WIDGETS else ("miss" if compute_seconds is not None else "hit")
+    timings.append(f'total;desc="{name} ({cache_state})";dur={(time.perf_counter() - started) * 1000:.1f}')
+    response["Server-Timing"] = ", ".join(timings)
+    return response
+
 def logout_view(request):
     logout(request)
     return redirect("index")
@@ -502,12 +474,24 @@ def class_list(request):
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
 from django.db.models import Prefetch
-from .models import Class, Student, GradeCategory, GradeItem, StudentScore, GradeSummary, GradeCalculationSettings, TransmutationTable, ActivityLog
+from .models import Class, Student, GradeCategory, GradeItem, StudentScore, GradeSummary, GradeCalculationSettings, TransmutationTable
+
+
+def _save_scores(class_obj, scores):
+    """Upsert the gradebook form's scores (run through run_write)"""
+    for score in scores:
+        # A retried attempt must not reuse ids handed out by a rolled-back insert
+        score.pk = None
+    saved = upsert_scores(scores)
+    if saved:
+        # Bulk writes bypass the post_save handlers
+        mark_class_changed(class_obj.id)
+    return saved
 
 
 @login_required
+@condition(etag_func=instructor_classes_etag)
 def grades_panel(request):
     """
     Unified grades_panel:
@@ -601,28 +585,6 @@ def grades_panel(request):
                     return r.equivalent_grade
             return rows[-1].equivalent_grade
 
-    def get_final_equivalent_grade(percentage):
-        """Convert final grade percentage to equivalent grade (1.0-5.0 scale)"""
-        # Based on the grading table provided
-        grade_scale = [
-            (90, 100, 1.0), (89, 89, 1.1), (88, 88, 1.2), (87, 87, 1.3), (86, 86, 1.4),
-            (85, 85, 1.5), (84, 84, 1.6), (83, 83, 1.7), (82, 82, 1.8), (81, 81, 1.9),
-            (80, 80, 2.0), (79, 79, 2.1), (78, 78, 2.2), (77, 77, 2.3), (76, 76, 2.4),
-            (75, 75, 2.5), (74, 74, 2.6), (73, 73, 2.7), (72, 72, 2.8), (71, 71, 2.9),
-            (70, 70, 3.0), (69, 69, 3.1), (68, 68, 3.2), (67, 67, 3.3), (66, 66, 3.4),
-            (65, 65, 3.5), (64, 64, 3.6), (63, 63, 3.7), (62, 62, 3.8), (61, 61, 3.9),
-            (60, 60, 4.0), (59, 59, 4.1), (58, 58, 4.2), (57, 57, 4.3), (56, 56, 4.4),
-            (55, 55, 4.5), (54, 54, 4.6), (53, 53, 4.7), (52, 52, 4.8), (0, 51, 4.9),
-        ]
-        
-        percentage = round(percentage)  # Round to nearest integer
-        
-        for min_pct, max_pct, equiv in grade_scale:
-            if min_pct <= percentage <= max_pct:
-                return equiv
-        
-        return 5.0  # Default for very low scores
-
     # -------------------------
     # Handle POST Actions
     # -------------------------
@@ -708,81 +670,37 @@ def grades_panel(request):
 
         # ---------- SAVE SCORES ----------
         elif action == "save_scores":
-            saved_count = 0
-            with transaction.atomic():
-                for key, value in request.POST.items():
-                    if key.startswith("scores-"):
-                        try:
-                            _, student_id, item_id = key.split("-")
-                            if value.strip() == "":
-                                continue
-                            score_value = float(value)
-                            student = Student.objects.get(id=student_id, class_obj=selected_class)
-                            item = GradeItem.objects.get(id=item_id, category__class_obj=selected_class)
-                            StudentScore.objects.update_or_create(
-                                student=student,
-                                item=item,
-                                defaults={"score_percentage": score_value}
-                            )
-                            saved_count += 1
-                        except Exception as e:
-                            print("Error saving score:", e)
-                            continue
+            entries = {}
+            for key, value in request.POST.items():
+                if key.startswith("scores-") and value.strip() != "":
+                    try:
+                        _, student_id, item_id = key.split("-")
+                        entries[(int(student_id), int(item_id))] = float(value)
+                    except ValueError as e:
+                        print("Error saving score:", e)
+            student_ids = set(Student.objects.filter(
+                class_obj=selected_class, id__in={s for s, _ in entries}
+            ).values_list("id", flat=True))
+            item_ids = set(GradeItem.objects.filter(
+                category__class_obj=selected_class, id__in={i for _, i in entries}
+            ).values_list("id", flat=True))
+            scores = [
+                StudentScore(student_id=student_id, item_id=item_id, score_percentage=score)
+                for (student_id, item_id), score in entries.items()
+                if student_id in student_ids and item_id in item_ids
+            ]
+            saved_count = run_write("save_scores", _save_scores, selected_class, scores)
             messages.success(request, f"Saved {saved_count} scores successfully!")
             return redirect(f"{request.path}?class_id={selected_class.id}&category_id={selected_category_id or ''}")
 
         # ---------- COMPUTE FINAL GRADES ----------
         elif action == "compute_final":
-            categories_qs = GradeCategory.objects.filter(class_obj=selected_class)
-            total_percentage = sum([c.percentage for c in categories_qs])
-            if abs(total_percentage - 100.0) > 0.001:
-                messages.error(request, "Total category percentage must equal 100%.")
+            try:
+                run_write("compute_final", recompute_grade_summaries, selected_class)
+            except InvalidCategoryWeights as e:
+                messages.error(request, str(e))
                 return redirect(f"{request.path}?class_id={selected_class.id}")
 
-            with transaction.atomic():
-                try:
-                    passing_threshold = selected_class.grade_settings.passing_grade
-                except GradeCalculationSettings.DoesNotExist:
-                    passing_threshold = 75.0
-
-                for student in students_qs:
-                    final_percentage = 0.0
-                    for category in categories_qs:
-                        items = GradeItem.objects.filter(category=category)
-                        item_percentages = []
-                        for item in items:
-                            ss = StudentScore.objects.filter(student=student, item=item).first()
-                            if ss and item.total_items > 0:
-                                # Convert raw score to percentage
-                                item_pct = (ss.score_percentage / item.total_items) * 100
-                            else:
-                                item_pct = 0.0
-                            item_percentages.append(item_pct)
-
-                        # Calculate category average from percentages
-                        category_average = sum(item_percentages) / len(item_percentages) if item_percentages else 0.0
-                        
-                        # Apply category weight
-                        weighted_category = category_average * (category.percentage / 100)
-                        final_percentage += weighted_category
-
-                    final_percentage = round(final_percentage, 2)
-                    remarks = "Passed" if final_percentage >= passing_threshold else "Failed"
-                    
-                    # Calculate equivalent grade
-                    equivalent_grade = get_final_equivalent_grade(final_percentage)
-
-                    GradeSummary.objects.update_or_create(
-                        student=student,
-                        class_obj=selected_class,
-                        defaults={
-                            "final_grade": final_percentage,
-                            "equivalent_grade": equivalent_grade,
-                            "remarks": remarks,
-                            "is_locked": False,
-                        }
-                    )
-
             messages.success(request, "Final grades computed successfully!")
             return redirect(f"{request.path}?class_id={selected_class.id}")
 
@@ -891,6 +809,50 @@ def grades_panel(request):
         "current_school_year": current_school_year,
     })
 
+
+@login_required
+def import_scores_view(request, class_id):
+    """Import a gradebook sheet into one category of a class, then recompute final grades"""
+    class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
+    redirect_url = f"{reverse('grades_panel')}?class_id={class_obj.id}"
+    if request.method != "POST" or not request.FILES.get("scores_file"):
+        messages.error(request, "Please choose a CSV or Excel file to import.")
+        return redirect(redirect_url)
+
+    category = get_object_or_404(GradeCategory, id=request.POST.get("category_id"), class_obj=class_obj)
+    try:
+        total_items = int(request.POST.get("total_items") or DEFAULT_TOTAL_ITEMS)
+    except ValueError:
+        total_items = DEFAULT_TOTAL_ITEMS
+
+    uploaded_file = request.FILES["scores_file"]
+    try:
+        result = import_scores(class_obj, category, uploaded_file, total_items=total_items)
+    except ValueError as e:
+        messages.error(request, str(e) if isinstance(e, UnsupportedFileType) else f"Error reading file: {e}")
+        return redirect(f"{redirect_url}&category_id={category.id}")
+
+    log_activity(
+        user=request.user,
+        action=f"Imported scores for {class_obj.program}",
+        description=f"{result['scores']} scores imported into {category.name} from {uploaded_file.name}",
+        class_obj=class_obj,
+    )
+
+    summary = f"Imported {result['scores']} scores into {category.name}."
+    if result["items_created"]:
+        summary += f" New items: {', '.join(result['items_created'])}."
+    messages.success(request, summary)
+    if result["message"]:
+        messages.warning(request, result["message"])
+    if result["errors"]:
+        shown = "; ".join(
+            f"Row {e['row']} ({e['code'] or 'no code'}): {e['message']}" for e in result["errors"][:20]
+        )
+        more = len(result["errors"]) - 20
+        messages.error(request, f"{len(result['errors'])} problems were skipped: {shown}" + (f"; …and {more} more" if more > 0 else ""))
+    return redirect(f"{redirect_url}&category_id={category.id}")
+
 @login_required
 def debug_grades(request):
     """Temporary debug view to check grade calculation"""
@@ -968,6 +930,72 @@ def debug_grades(request):
 # Add this to your urls.py temporarily:
 # path('debug-grades/', views.debug_grades, name='debug_grades'),
 
+ATTENDANCE_STATUSES = {value for value, _ in Attendance._meta.get_field('status').choices}
+NO_ATTENDANCE_RECORD = 'Attendance record not found or access denied'
+
+
+def _ensure_attendance_rows(class_obj, day):
+    """Create a Present record for every student of class_obj without one on day"""
+    existing = set(Attendance.objects.filter(class_obj=class_obj, date=day).values_list('student_id', flat=True))
+    now = timezone.now()
+    missing = [
+        Attendance(class_obj=class_obj, student_id=student_id, date=day, status='Present', updated_at=now)
+        for student_id in class_obj.students.values_list('id', flat=True) if student_id not in existing
+    ]
+    if missing:
+        Attendance.objects.bulk_create(missing, ignore_conflicts=True)
+        # Bulk writes bypass the post_save handlers
+        mark_class_changed(class_obj.id)
+
+
+def _save_attendance_statuses(user, statuses):
+    """
+    Apply {attendance id: status} to user's records with one bulk update
+    (retried on a locked database), then log each change. Returns
+    (updated records, rejected) where rejected lists the
+    {'attendance_id', 'status', 'message'} of every entry not applied.
+    """
+    rejected = []
+    valid = {}
+    for pk, status in statuses.items():
+        if status not in ATTENDANCE_STATUSES:
+            rejected.append({'attendance_id': pk, 'status': status, 'message': 'Invalid attendance status'})
+        elif str(pk).isdigit():
+            valid[int(pk)] = status
+        else:
+            rejected.append({'attendance_id': pk, 'status': status, 'message': NO_ATTENDANCE_RECORD})
+    records = list(
+        Attendance.objects.filter(id__in=valid, class_obj__instructor=user).select_related('student', 'class_obj')
+    )
+    found = {record.id for record in records}
+    rejected += [
+        {'attendance_id': pk, 'status': status, 'message': NO_ATTENDANCE_RECORD}
+        for pk, status in valid.items() if pk not in found
+    ]
+    if not records:
+        return records, rejected
+    now = timezone.now()
+    for record in records:
+        record.status = valid[record.id]
+        record.updated_at = now
+
+    def write():
+        Attendance.objects.bulk_update(records, ['status', 'updated_at'])
+        # Bulk writes bypass the post_save handlers
+        mark_class_changed(*{record.class_obj_id for record in records})
+
+    run_write("attendance", write)
+    for record in records:
+        log_activity(
+            user=user,
+            action=f"Updated attendance for {record.student.display_name}",
+            description=f"Changed status to {record.status} on {record.date}",
+            class_obj=record.class_obj,
+            student=record.student
+        )
+    return records, rejected
+
+
 @login_required
 def attendance_panel(request):
     # Get all classes for the instructor - filtered by school year
@@ -989,28 +1017,15 @@ def attendance_panel(request):
     if request.method == 'POST' and request.POST.get('action') == 'save_attendance':
         selected_class = get_object_or_404(Class, id=selected_class_id, instructor=request.user)
         
-        saved_count = 0
-        for key, value in request.POST.items():
-            if key.startswith('attendance_'):
-                attendance_id = key.replace('attendance_', '')
-                try:
-                    attendance = Attendance.objects.get(id=attendance_id, class_obj__instructor=request.user)
-                    attendance.status = value
-                    attendance.save()
-                    
-                    # Log activity
-                    ActivityLog.objects.create(
-                        user=request.user,
-                        action=f"Updated attendance for {attendance.student.display_name}",
-                        description=f"Changed status to {value} on {attendance.date}",
-                        class_obj=attendance.class_obj,
-                        student=attendance.student
-                    )
-                    saved_count += 1
-                except Attendance.DoesNotExist:
-                    continue
-        
-        messages.success(request, f'Attendance saved successfully! Updated {saved_count} records.')
+        statuses = {
+            key.replace('attendance_', ''): value
+            for key, value in request.POST.items() if key.startswith('attendance_')
+        }
+        saved, rejected = _save_attendance_statuses(request.user, statuses)
+
+        messages.success(request, f'Attendance saved successfully! Updated {len(saved)} records.')
+        if rejected:
+            messages.error(request, f'{len(rejected)} records could not be saved: {rejected[0]["message"]}.')
         return redirect(f"{request.path}?class_id={selected_class_id}&date={selected_date_str}")
 
     if selected_class_id:
@@ -1021,13 +1036,7 @@ def attendance_panel(request):
         
         if students.exists():
             # Ensure attendance exists for each student for the selected date
-            for student in students:
-                attendance, created = Attendance.objects.get_or_create(
-                    class_obj=selected_class,
-                    student=student,
-                    date=selected_date,
-                    defaults={'status': 'Present'}
-                )
+            run_write("attendance", _ensure_attendance_rows, selected_class, selected_date)
 
             # Fetch attendance records with related student data
             attendance_records = Attendance.objects.filter(
@@ -1044,6 +1053,53 @@ def attendance_panel(request):
     })
 
 @login_required
+def import_attendance_view(request, class_id):
+    """Import a card reader check-in log into a class's attendance"""
+    class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
+    redirect_url = f"{reverse('attendance_panel')}?class_id={class_obj.id}"
+    if request.method != "POST" or not request.FILES.get("log_file"):
+        messages.error(request, "Please choose a CSV or Excel check-in log to import.")
+        return redirect(redirect_url)
+
+    try:
+        late_after = datetime.strptime(request.POST.get("late_after", ""), "%H:%M").time()
+        date_from = datetime.strptime(request.POST["date_from"], "%Y-%m-%d").date() if request.POST.get("date_from") else None
+        date_to = datetime.strptime(request.POST["date_to"], "%Y-%m-%d").date() if request.POST.get("date_to") else None
+    except ValueError:
+        messages.error(request, "Please enter a valid late cutoff time and date range.")
+        return redirect(redirect_url)
+
+    uploaded_file = request.FILES["log_file"]
+    try:
+        result = import_attendance_logs(class_obj, uploaded_file, late_after, date_from=date_from, date_to=date_to)
+    except ValueError as e:
+        messages.error(request, str(e) if isinstance(e, UnsupportedFileType) else f"Error reading file: {e}")
+        return redirect(redirect_url)
+
+    sessions = result["sessions"]
+    if not sessions:
+        messages.warning(request, "No check-ins for students of this class were found in the log.")
+        return redirect(redirect_url)
+
+    log_activity(
+        user=request.user,
+        action=f"Imported attendance logs for {class_obj.program}",
+        description=f"{len(sessions)} sessions ({sessions[0]} to {sessions[-1]}) imported from {uploaded_file.name}",
+        class_obj=class_obj,
+    )
+    messages.success(
+        request,
+        f"Imported {len(sessions)} sessions: {result['present']} present, {result['late']} late, "
+        f"{result['absent']} absent ({result['excused']} excused records kept).",
+    )
+    if result["errors"]:
+        shown = "; ".join(f"Row {e['row']} ({e['code']}): {e['message']}" for e in result["errors"][:20])
+        more = len(result["errors"]) - 20
+        messages.error(request, f"{len(result['errors'])} rows were skipped: {shown}" + (f"; …and {more} more" if more > 0 else ""))
+    return redirect(f"{redirect_url}&date={sessions[-1]:%Y-%m-%d}")
+
+@login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def attendance_summary(request, class_id):
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
 
@@ -1053,28 +1109,7 @@ def attendance_summary(request, class_id):
         Q(attendance__class_obj=class_obj)
     ).distinct()
 
-    attendance_stats = []
-    for student in students:
-        # Fetch all attendance records for this student in this class
-        records = Attendance.objects.filter(student=student, class_obj=class_obj)
-
-        total_days = records.count()
-        present_days = records.filter(status='Present').count()
-        absent_days = records.filter(status='Absent').count()
-        late_days = records.filter(status='Late').count()
-        excused_days = records.filter(status='Excused').count()
-
-        attendance_percentage = (present_days / total_days * 100) if total_days > 0 else 0
-
-        attendance_stats.append({
-            'student': student,
-            'total_days': total_days,
-            'present_days': present_days,
-            'absent_days': absent_days,
-            'late_days': late_days,
-            'excused_days': excused_days,
-            'attendance_percentage': round(attendance_percentage, 2)
-        })
+    attendance_stats = student_attendance_stats(class_obj, students)
 
     return render(request, 'attendance_summary.html', {
         'class_obj': class_obj,
@@ -1090,22 +1125,13 @@ def update_attendance_ajax(request):
         try:
             data = json.loads(request.body)
             updates = data.get('updates', [])
-            for item in updates:
-                attendance_id = item.get('attendance_id')
-                status = item.get('status')
-                attendance = Attendance.objects.get(id=attendance_id, class_obj__instructor=request.user)
-                attendance.status = status
-                attendance.save()
-                
-                # Log activity
-                ActivityLog.objects.create(
-                    user=request.user,
-                    action=f"Updated attendance for {attendance.student.display_name}",
-                    description=f"Changed status to {status} on {attendance.date}",
-                    class_obj=attendance.class_obj,
-                    student=attendance.student
-                )
-            return JsonResponse({'success': True})
+            saved, rejected = _save_attendance_statuses(
+                request.user, {item.get('attendance_id'): item.get('status') for item in updates}
+            )
+            response = {'success': bool(saved), 'updated': len(saved), 'rejected': rejected}
+            if not saved:
+                response['message'] = 'No attendance records were updated'
+            return JsonResponse(response)
         except Exception as e:
             return JsonResponse({'success': False, 'message': str(e)})
     return JsonResponse({'success': False, 'message': 'Invalid request'})
@@ -1119,27 +1145,10 @@ def update_attendance(request):
             attendance_id = data.get('attendance_id')
             status = data.get('status')
 
-            # Safely get the attendance record for the current instructor
-            attendance = Attendance.objects.filter(
-                id=attendance_id,
-                class_obj__instructor=request.user
-            ).first()
-
-            if not attendance:
-                return JsonResponse({'success': False, 'message': 'Attendance record not found or access denied'})
-
-            # Update the status
-            attendance.status = status
-            attendance.save()
-
-            # Log activity
-            ActivityLog.objects.create(
-                user=request.user,
-                action=f"Updated attendance for {attendance.student.full_name}",
-                description=f"Changed status to {status} on {attendance.date}",
-                class_obj=attendance.class_obj,
-                student=attendance.student
-            )
+            # Only the current instructor's records are updated
+            saved, rejected = _save_attendance_statuses(request.user, {attendance_id: status})
+            if not saved:
+                return JsonResponse({'success': False, 'message': rejected[0]['message']})
 
             return JsonResponse({'success': True, 'message': 'Attendance updated successfully'})
 
@@ -1170,7 +1179,7 @@ def profile_view(request):
     current_school_year = get_current_school_year(request.user)
     total_classes = Class.objects.filter(instructor=request.user, school_year=current_school_year).count()
     total_students = Student.objects.filter(class_obj__instructor=request.user, class_obj__school_year=current_school_year).distinct().count()
-    total_activities = ActivityLog.objects.filter(user=request.user).count()
+    total_activities = request.user.activity_count
 
     return render(request, 'user_profile.html', {
         'form': form,
@@ -1183,16 +1192,7 @@ def profile_view(request):
 @login_required
 def settings_view(request):
     """User settings page"""
-    try:
-        user_settings = request.user.app_setting
-    except Setting.DoesNotExist:
-        user_settings = Setting.objects.create(
-            user=request.user,
-            school_year='25-1',
-            theme='light',
-            notification_pref='email',
-            default_report_format='pdf'
-        )
+    user_settings = get_user_setting(request.user)
 
     if request.method == 'POST':
         try:
@@ -1226,49 +1226,26 @@ def settings_view(request):
 
 @login_required
 def upload_students_csv(request, class_id):
-    class_obj = get_object_or_404(Class, id=class_id)
+    class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
 
     if request.method == "POST" and request.FILES.get("csv_file"):
-        uploaded_file = request.FILES["csv_file"]
-        ext = uploaded_file.name.split(".")[-1].lower()
-
+        rows = iter_upload_rows(request.FILES["csv_file"])
         try:
-            if ext == "csv":
-                data = uploaded_file.read().decode("utf-8-sig")
-                csv_reader = csv.reader(io.StringIO(data))
-                headers = next(csv_reader)
-                rows = list(csv_reader)
-            elif ext in ["xlsx", "xls"]:
-                wb = openpyxl.load_workbook(uploaded_file, data_only=True)
-                ws = wb.active
-                headers = [str(cell.value or "").strip() for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-                rows = list(ws.iter_rows(min_row=2, values_only=True))
-            else:
-                messages.error(request, "Unsupported file type. Please upload a .csv or .xlsx file.")
-                return render(request, "upload_csv.html", {"class_obj": class_obj})
+            headers = next(rows)
+        except UnsupportedFileType as e:
+            messages.error(request, str(e))
+            return render(request, "upload_csv.html", {"class_obj": class_obj})
+        except StopIteration:
+            messages.error(request, "Error reading file: the file is empty.")
+            return render(request, "upload_csv.html", {"class_obj": class_obj})
         except Exception as e:
             messages.error(request, f"Error reading file: {e}")
             return render(request, "upload_csv.html", {"class_obj": class_obj})
 
-        # Normalize headers
-        headers_normalized = [h.strip().lower().replace("_", " ") for h in headers]
-
-        # Allowed variations (in case CSV uses 'middlename' instead of 'middle name')
-        header_aliases = {
-            "middlename": "middle name",
-            "middle": "middle name",
-            "middle initial": "middle name",
-        }
-        headers_normalized = [header_aliases.get(h, h) for h in headers_normalized]
-
-        required_headers = [
-            "code", "last name", "first name", "middle name",
-            "sex", "course", "year", "units", "section"
-        ]
+        headers_normalized = normalize_headers(headers)
 
         # Identify missing/unexpected headers for better debugging
-        missing = [h for h in required_headers if h not in headers_normalized]
-        unexpected = [h for h in headers_normalized if h not in required_headers]
+        missing, unexpected = header_problems(headers_normalized)
 
         if missing or unexpected:
             msg = "❌ CSV header mismatch.<br>"
@@ -1279,37 +1256,75 @@ def upload_students_csv(request, class_id):
             messages.error(request, msg)
             return render(request, "upload_csv.html", {"class_obj": class_obj})
 
-        success_count = 0
-        for row in rows:
-            if not any(row):
-                continue
+        rows.close()
 
-            try:
-                data = dict(zip(headers_normalized, row))
-
-                # Create or update student record
-                Student.objects.update_or_create(
-                    student_id=str(data.get("code", "")).strip(),
-                    defaults={
-                        "last_name": str(data.get("last name", "")).strip(),
-                        "first_name": str(data.get("first name", "")).strip(),
-                        "middle_initial": str(data.get("middle name", "") or "").strip(),
-                        "program": str(data.get("course", "")).strip(),
-                        "year_level": str(data.get("year", "")).strip(),
-                        "section": str(data.get("section", "")).strip(),
-                        "class_obj": class_obj,
-                    },
-                )
-                success_count += 1
-            except Exception as e:
-                messages.warning(request, f"⚠️ Skipped a row due to error: {e}")
-
-        messages.success(request, f"✅ Successfully imported {success_count} students.")
-        return redirect("class_detail", class_id=class_obj.id)
+        uploaded_file = request.FILES["csv_file"]
+        job = ImportJob(
+            user=request.user, class_obj=class_obj, original_name=uploaded_file.name,
+            dry_run=request.POST.get("dry_run") == "on",
+        )
+        job.file.save(uploaded_file.name, uploaded_file, save=False)
+        job.save()
+        enqueue_import_job(job)
+
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'success': True, 'job': import_job_status(job)})
+        return render(request, "upload_csv.html", {"class_obj": class_obj, "job": job})
 
     return render(request, "upload_csv.html", {"class_obj": class_obj})
 
 
+def import_job_status(job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'file': job.original_name,
+        'rows_processed': job.rows_processed,
+        'rows_per_second': job.rows_per_second,
+        'created': job.created_count,
+        'updated': job.updated_count,
+        'unchanged': job.unchanged_count,
+        'error_count': job.error_count,
+        'errors': job.errors,
+        'dry_run': job.dry_run,
+        'diff': job.diff,
+        'message': job.message,
+        'finished': job.is_finished,
+        'progress_url': reverse('import_job_progress', args=[job.id]),
+        'commit_url': reverse('commit_import_job', args=[job.id]) if job.dry_run and not job.committed_job_id else None,
+    }
+
+
+@login_required
+def import_job_progress(request, job_id):
+    """Progress of a background roster import"""
+    job = get_object_or_404(ImportJob, id=job_id, user=request.user)
+    return JsonResponse(import_job_status(job))
+
+
+@login_required
+def commit_import_job(request, job_id):
+    """Apply a previewed (dry-run) roster import"""
+    job = get_object_or_404(ImportJob, id=job_id, user=request.user, dry_run=True)
+    if request.method != "POST":
+        return redirect("upload_csv", class_id=job.class_obj_id)
+    if job.committed_job_id:
+        messages.error(request, "This preview has already been imported.")
+        return redirect("upload_csv", class_id=job.class_obj_id)
+    if job.status != "completed" or not job.file or not job.file.storage.exists(job.file.name):
+        messages.error(request, "This preview can no longer be imported. Please upload the file again.")
+        return redirect("upload_csv", class_id=job.class_obj_id)
+
+    try:
+        commit_job = commit_dry_run(job)
+    except AlreadyCommitted:
+        messages.error(request, "This preview has already been imported.")
+        return redirect("upload_csv", class_id=job.class_obj_id)
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return JsonResponse({'success': True, 'job': import_job_status(commit_job)})
+    return render(request, "upload_csv.html", {"class_obj": job.class_obj, "job": commit_job})
+
+
 @login_required
 def class_panel(request):
     current_school_year = get_current_school_year(request.user)
@@ -1337,9 +1352,119 @@ def class_panel(request):
 # -----------------------------
 @login_required
 def activity_log(request):
-    """View recent activity log"""
-    activities = ActivityLog.objects.filter(user=request.user)[:50]
-    return render(request, 'activity_log.html', {'activities': activities})
+    """View the activity log; older entries are loaded by activity_feed as the page scrolls"""
+    filters = _activity_filters(request)
+    if filters is None:
+        messages.error(request, "Invalid activity log filter.")
+        return redirect('activity_log')
+    archive_month = request.GET.get('archive') or None
+    try:
+        activities, next_cursor = _activity_log_page(request, archive_month, filters)
+    except ValueError:
+        messages.error(request, "Invalid archive month.")
+        return redirect('activity_log')
+    feed_query = request.GET.copy()
+    feed_query.pop('cursor', None)
+    return render(request, 'activity_log.html', {
+        'activities': activities,
+        'next_cursor': next_cursor,
+        'feed_url': f"{reverse('activity_feed')}?{feed_query.urlencode()}",
+        'filters': filters,
+        'filter_classes': Class.objects.filter(instructor=request.user).order_by('-school_year', 'program'),
+        'archive_month': archive_month,
+        'archived_months': archived_months(request.user),
+        'total_activities': request.user.activity_count,
+    })
+
+
+@login_required
+def activity_feed(request):
+    """JSON page of the activity log for infinite scroll (?cursor=&limit=&archive= plus the log filters)"""
+    filters = _activity_filters(request)
+    if filters is None:
+        return HttpResponseBadRequest("Invalid activity log filter.")
+    try:
+        limit = int(request.GET.get('limit') or ACTIVITY_PAGE_SIZE)
+        activities, next_cursor = _activity_log_page(
+            request, request.GET.get('archive') or None, filters,
+            cursor=request.GET.get('cursor'), limit=limit,
+        )
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return JsonResponse({
+        'results': [activity_json(a) for a in activities],
+        'next_cursor': next_cursor,
+    })
+
+
+def _activity_log_page(request, archive_month, filters, cursor=None, limit=ACTIVITY_PAGE_SIZE):
+    """A page of the live log, or of an archived month (YYYY-MM); raises ValueError on bad input"""
+    if archive_month:
+        return archived_page(request.user, archive_month, cursor=cursor, limit=limit, **filters)
+    return activity_page(request.user, cursor=cursor, limit=limit, **filters)
+
+
+def _activity_filters(request):
+    """Activity log filters from the query string, or None if one is malformed"""
+    try:
+        return {
+            'class_id': int(request.GET['class_id']) if request.GET.get('class_id') else None,
+            'student_id': int(request.GET['student_id']) if request.GET.get('student_id') else None,
+            'action': request.GET.get('action_filter') or None,
+            'date_from': datetime.strptime(request.GET['date_from'], "%Y-%m-%d").date() if request.GET.get('date_from') else None,
+            'date_to': datetime.strptime(request.GET['date_to'], "%Y-%m-%d").date() if request.GET.get('date_to') else None,
+        }
+    except ValueError:
+        return None
+
+
+@login_required
+def search_view(request):
+    """Ranked JSON search over the instructor's students and activity log (?q=&scope=students|activities&limit=)"""
+    started = time.perf_counter()
+    query = request.GET.get('q', '').strip()
+    scope = request.GET.get('scope') or 'all'
+    if scope not in ('all', 'students', 'activities'):
+        return HttpResponseBadRequest("Invalid search scope.")
+    try:
+        limit = max(1, min(int(request.GET.get('limit') or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid limit.")
+
+    results = {'query': query, 'backend': search_backend()}
+    if scope in ('all', 'students'):
+        results['students'] = [
+            {
+                'id': student.id,
+                'student_id': student.student_id,
+                'name': student.display_name,
+                'class_id': student.class_obj_id,
+                'class_name': student.class_obj.class_name,
+                'url': reverse('class_detail', args=[student.class_obj_id]),
+            }
+            for student in search_students(request.user, query, limit)
+        ]
+    if scope in ('all', 'activities'):
+        results['activities'] = [activity_json(a) for a in search_activities(request.user, query, limit)]
+    results['took_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return JsonResponse(results)
+
+
+@login_required
+def student_autocomplete(request):
+    """Type-ahead over the students of the instructor's current school year (?q=&limit=)"""
+    started = time.perf_counter()
+    try:
+        limit = int(request.GET.get('limit') or AUTOCOMPLETE_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid limit.")
+    school_year = get_current_school_year(request.user)
+    results = autocomplete_students(request.user, school_year, request.GET.get('q', ''), limit)
+    return JsonResponse({
+        'results': [dict(student, url=reverse('class_detail', args=[student['class_id']])) for student in results],
+        'school_year': school_year,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
 
 
 def about_view(request):
@@ -1348,34 +1473,17 @@ def about_view(request):
 
 
 @login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def generate_attendance_report(request, class_id):
     """Generate attendance report for a class"""
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
     students = Student.objects.filter(class_obj=class_obj)
 
     # Calculate attendance statistics
-    attendance_stats = []
-    for student in students:
-        total_days = Attendance.objects.filter(student=student, class_obj=class_obj).count()
-        present_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Present').count()
-        absent_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Absent').count()
-        late_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Late').count()
-        excused_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Excused').count()
-
-        attendance_percentage = (present_days / total_days * 100) if total_days > 0 else 0
-
-        attendance_stats.append({
-            'student': student,
-            'total_days': total_days,
-            'present_days': present_days,
-            'absent_days': absent_days,
-            'late_days': late_days,
-            'excused_days': excused_days,
-            'attendance_percentage': round(attendance_percentage, 2)
-        })
+    attendance_stats = student_attendance_stats(class_obj, students)
 
     # Log activity
-    ActivityLog.objects.create(
+    log_activity(
         user=request.user,
         action=f"Generated attendance report for {class_obj.program}",
         description=f"PDF report generated for {len(attendance_stats)} students",
@@ -1390,6 +1498,7 @@ def generate_attendance_report(request, class_id):
 
 
 @login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def generate_grade_report(request, class_id):
     """Generate grade report for a class"""
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
@@ -1409,7 +1518,7 @@ def generate_grade_report(request, class_id):
     average_grade = summaries.aggregate(avg_grade=Avg('final_grade'))['avg_grade'] or 0
 
     # Log activity
-    ActivityLog.objects.create(
+    log_activity(
         user=request.user,
         action=f"Generated grade report for {class_obj.program}",
         description=f"PDF report generated for {total_students} students",
@@ -1429,6 +1538,7 @@ def generate_grade_report(request, class_id):
 
 
 @login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def generate_class_summary(request, class_id):
     """Generate comprehensive class summary report"""
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
@@ -1436,16 +1546,7 @@ def generate_class_summary(request, class_id):
     summaries = GradeSummary.objects.filter(class_obj=class_obj)
 
     # Attendance statistics
-    attendance_stats = []
-    for student in students:
-        total_days = Attendance.objects.filter(student=student, class_obj=class_obj).count()
-        present_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Present').count()
-        attendance_percentage = (present_days / total_days * 100) if total_days > 0 else 0
-
-        attendance_stats.append({
-            'student': student,
-            'attendance_percentage': round(attendance_percentage, 2)
-        })
+    attendance_stats = student_attendance_stats(class_obj, students)
 
     # Grade statistics
     total_students = students.count()
@@ -1454,7 +1555,7 @@ def generate_class_summary(request, class_id):
     average_grade = summaries.aggregate(avg_grade=Avg('final_grade'))['avg_grade'] or 0
 
     # Log activity
-    ActivityLog.objects.create(
+    log_activity(
         user=request.user,
         action=f"Generated class summary for {class_obj.program}",
         description=f"Comprehensive report generated",
@@ -1488,29 +1589,13 @@ def reports_panel(request):
 
 # PDF Report Generation (HTML format)
 @login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def generate_attendance_pdf(request, class_id):
     """Generate attendance report as HTML (printable)"""
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
     students = Student.objects.filter(class_obj=class_obj)
     
-    attendance_stats = []
-    for student in students:
-        total_days = Attendance.objects.filter(student=student, class_obj=class_obj).count()
-        present_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Present').count()
-        absent_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Absent').count()
-        late_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Late').count()
-        excused_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Excused').count()
-        attendance_percentage = (present_days / total_days * 100) if total_days > 0 else 0
-        
-        attendance_stats.append({
-            'student': student,
-            'total_days': total_days,
-            'present_days': present_days,
-            'absent_days': absent_days,
-            'late_days': late_days,
-            'excused_days': excused_days,
-            'attendance_percentage': round(attendance_percentage, 2)
-        })
+    attendance_stats = student_attendance_stats(class_obj, students)
     
     return render(request, 'reports/attendance_pdf.html', {
         'class_obj': class_obj,
@@ -1520,10 +1605,11 @@ def generate_attendance_pdf(request, class_id):
 
 
 @login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def generate_grades_pdf(request, class_id):
     """Generate grades report as HTML (printable)"""
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
-    summaries = GradeSummary.objects.filter(class_obj=class_obj).order_by('student__last_name')
+    summaries = GradeSummary.objects.filter(class_obj=class_obj).select_related('student').order_by('student__last_name')
     
     return render(request, 'reports/grades_pdf.html', {
         'class_obj': class_obj,
@@ -1533,22 +1619,15 @@ def generate_grades_pdf(request, class_id):
 
 
 @login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def generate_summary_pdf(request, class_id):
     """Generate class summary report as HTML (printable)"""
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
     students = Student.objects.filter(class_obj=class_obj)
-    summaries = GradeSummary.objects.filter(class_obj=class_obj)
+    summaries = GradeSummary.objects.filter(class_obj=class_obj).select_related('student')
     
     # Attendance stats
-    attendance_stats = []
-    for student in students:
-        total_days = Attendance.objects.filter(student=student, class_obj=class_obj).count()
-        present_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Present').count()
-        attendance_percentage = (present_days / total_days * 100) if total_days > 0 else 0
-        attendance_stats.append({
-            'student': student,
-            'attendance_percentage': round(attendance_percentage, 2)
-        })
+    attendance_stats = student_attendance_stats(class_obj, students)
     
     return render(request, 'reports/summary_pdf.html', {
         'class_obj': class_obj,
@@ -1561,43 +1640,12 @@ def generate_summary_pdf(request, class_id):
 
 # Excel Report Generation
 @login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def generate_attendance_excel(request, class_id):
     """Generate attendance report as Excel"""
-    import openpyxl
-    from openpyxl.styles import Font, Alignment
-    
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
-    students = Student.objects.filter(class_obj=class_obj)
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Attendance Report"
-    
-    # Headers
-    headers = ['Student ID', 'Student Name', 'Total Days', 'Present', 'Absent', 'Late', 'Excused', 'Attendance %']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Data
-    for row, student in enumerate(students, 2):
-        total_days = Attendance.objects.filter(student=student, class_obj=class_obj).count()
-        present_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Present').count()
-        absent_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Absent').count()
-        late_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Late').count()
-        excused_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Excused').count()
-        attendance_percentage = (present_days / total_days * 100) if total_days > 0 else 0
-        
-        ws.cell(row=row, column=1, value=student.student_id)
-        ws.cell(row=row, column=2, value=student.display_name)
-        ws.cell(row=row, column=3, value=total_days)
-        ws.cell(row=row, column=4, value=present_days)
-        ws.cell(row=row, column=5, value=absent_days)
-        ws.cell(row=row, column=6, value=late_days)
-        ws.cell(row=row, column=7, value=excused_days)
-        ws.cell(row=row, column=8, value=f"{attendance_percentage:.2f}%")
-    
+    wb = attendance_workbook(attendance_rows(class_obj))
+
     response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
     response['Content-Disposition'] = f'attachment; filename="attendance_report_{class_obj.program}.xlsx"'
     wb.save(response)
@@ -1605,33 +1653,12 @@ def generate_attendance_excel(request, class_id):
 
 
 @login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def generate_grades_excel(request, class_id):
     """Generate grades report as Excel"""
-    import openpyxl
-    from openpyxl.styles import Font, Alignment
-    
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
-    summaries = GradeSummary.objects.filter(class_obj=class_obj).order_by('student__last_name')
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Grades Report"
-    
-    # Headers
-    headers = ['Student ID', 'Student Name', 'Final Grade', 'Equivalent Grade', 'Remarks']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Data
-    for row, summary in enumerate(summaries, 2):
-        ws.cell(row=row, column=1, value=summary.student.student_id)
-        ws.cell(row=row, column=2, value=summary.student.display_name)
-        ws.cell(row=row, column=3, value=f"{summary.final_grade:.2f}%")
-        ws.cell(row=row, column=4, value=summary.equivalent_grade or '-')
-        ws.cell(row=row, column=5, value=summary.remarks)
-    
+    wb = grades_workbook(grade_rows(class_obj))
+
     response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
     response['Content-Disposition'] = f'attachment; filename="grades_report_{class_obj.program}.xlsx"'
     wb.save(response)
@@ -1639,108 +1666,70 @@ def generate_grades_excel(request, class_id):
 
 
 @login_required
+@condition(etag_func=class_etag, last_modified_func=class_last_modified)
 def generate_summary_excel(request, class_id):
     """Generate class summary report as Excel"""
-    import openpyxl
-    from openpyxl.styles import Font, Alignment
-    
     class_obj = get_object_or_404(Class, id=class_id, instructor=request.user)
-    students = Student.objects.filter(class_obj=class_obj)
-    summaries = {s.student.id: s for s in GradeSummary.objects.filter(class_obj=class_obj)}
-    
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Class Summary"
-    
-    # Headers
-    headers = ['Student ID', 'Student Name', 'Final Grade', 'Equivalent Grade', 'Remarks', 'Attendance %']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
-    
-    # Data
-    for row, student in enumerate(students, 2):
-        summary = summaries.get(student.id)
-        
-        # Calculate attendance
-        total_days = Attendance.objects.filter(student=student, class_obj=class_obj).count()
-        present_days = Attendance.objects.filter(student=student, class_obj=class_obj, status='Present').count()
-        attendance_percentage = (present_days / total_days * 100) if total_days > 0 else 0
-        
-        ws.cell(row=row, column=1, value=student.student_id)
-        ws.cell(row=row, column=2, value=student.display_name)
-        ws.cell(row=row, column=3, value=f"{summary.final_grade:.2f}%" if summary else '-')
-        ws.cell(row=row, column=4, value=summary.equivalent_grade if summary and summary.equivalent_grade else '-')
-        ws.cell(row=row, column=5, value=summary.remarks if summary else '-')
-        ws.cell(row=row, column=6, value=f"{attendance_percentage:.2f}%")
-    
+    wb = summary_workbook(summary_rows(class_obj))
+
     response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
     response['Content-Disposition'] = f'attachment; filename="summary_report_{class_obj.program}.xlsx"'
     wb.save(response)
     return response
 
 
+@login_required
+def export_record_book(request):
+    """Download every report for every class in the current school year as one ZIP"""
+    current_school_year = get_current_school_year(request.user)
+    classes = list(Class.objects.filter(instructor=request.user, school_year=current_school_year).order_by('program', 'id'))
+
+    log_activity(
+        user=request.user,
+        action="Exported class record book",
+        description=f"Batch export of {len(classes)} classes for school year {current_school_year}",
+    )
+
+    response = StreamingHttpResponse(stream_record_book(classes), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="class_record_book_{current_school_year}.zip"'
+    return response
+
+
 @login_required
 def export_all_data(request):
-    """Export all user data to Excel"""
-    import openpyxl
-    from openpyxl.styles import Font, Alignment
-    
-    wb = openpyxl.Workbook()
-    
-    # Classes sheet
-    ws_classes = wb.active
-    ws_classes.title = "Classes"
-    classes_headers = ['Program', 'Subject', 'Year Level', 'Section', 'Semester', 'School Year']
-    for col, header in enumerate(classes_headers, 1):
-        cell = ws_classes.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-    
-    classes = Class.objects.filter(instructor=request.user)
-    for row, cls in enumerate(classes, 2):
-        ws_classes.cell(row=row, column=1, value=cls.program)
-        ws_classes.cell(row=row, column=2, value=cls.subject)
-        ws_classes.cell(row=row, column=3, value=cls.year_level)
-        ws_classes.cell(row=row, column=4, value=cls.section)
-        ws_classes.cell(row=row, column=5, value=cls.semester)
-        ws_classes.cell(row=row, column=6, value=cls.school_year)
-    
-    # Students sheet
-    ws_students = wb.create_sheet("Students")
-    students_headers = ['Student ID', 'Last Name', 'First Name', 'Middle Initial', 'Program', 'Year Level', 'Section', 'Class']
-    for col, header in enumerate(students_headers, 1):
-        cell = ws_students.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-    
-    students = Student.objects.filter(class_obj__instructor=request.user)
-    for row, student in enumerate(students, 2):
-        ws_students.cell(row=row, column=1, value=student.student_id)
-        ws_students.cell(row=row, column=2, value=student.last_name)
-        ws_students.cell(row=row, column=3, value=student.first_name)
-        ws_students.cell(row=row, column=4, value=student.middle_initial or '')
-        ws_students.cell(row=row, column=5, value=student.program)
-        ws_students.cell(row=row, column=6, value=student.year_level)
-        ws_students.cell(row=row, column=7, value=student.section)
-        ws_students.cell(row=row, column=8, value=student.class_obj.program)
-    
-    # Grades sheet
-    ws_grades = wb.create_sheet("Grades")
-    grades_headers = ['Student ID', 'Student Name', 'Class', 'Final Grade', 'Equivalent Grade', 'Remarks']
-    for col, header in enumerate(grades_headers, 1):
-        cell = ws_grades.cell(row=1, column=col, value=header)
-        cell.font = Font(bold=True)
-    
-    grades = GradeSummary.objects.filter(class_obj__instructor=request.user)
-    for row, grade in enumerate(grades, 2):
-        ws_grades.cell(row=row, column=1, value=grade.student.student_id)
-        ws_grades.cell(row=row, column=2, value=grade.student.display_name)
-        ws_grades.cell(row=row, column=3, value=grade.class_obj.program)
-        ws_grades.cell(row=row, column=4, value=f"{grade.final_grade:.2f}%")
-        ws_grades.cell(row=row, column=5, value=grade.equivalent_grade or '-')
-        ws_grades.cell(row=row, column=6, value=grade.remarks)
-    
+    """
+    Export all user data to Excel.
+
+    Pass ?since=<cursor> to export only rows created or changed after a
+    previous export; the next cursor is returned in the X-Export-Cursor
+    header and on the "Export Info" sheet.
+    """
+    since = None
+    if request.GET.get('since'):
+        try:
+            since = parse_cursor(request.GET['since'])
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+
+    wb, next_cursor = build_data_export(request.user, since=since)
+
+    filename = "ascrem_data_export_incremental.xlsx" if since else "ascrem_data_export.xlsx"
     response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="ascrem_data_export.xlsx"'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['X-Export-Cursor'] = next_cursor
     wb.save(response)
     return response
+
+
+def metrics_view(request):
+    """Request metrics of this worker process in Prometheus text format (staff or METRICS_TOKEN only)"""
+    from django.conf import settings
+
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    authorized = request.user.is_authenticated and request.user.is_staff
+    if token and not authorized:
+        authorized = hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
+    if not authorized:
+        return HttpResponseForbidden("Staff only")
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,75 @@
+"""
+Excel workbook builders for class reports.
+
+These functions only take plain rows (tuples of str/number values) and never
+touch the ORM, so they can run inside a process pool worker.
+"""
+import io
+import time
+
+import openpyxl
+from openpyxl.styles import Font, Alignment
+
+ATTENDANCE_HEADERS = ['Student ID', 'Student Name', 'Total Days', 'Present', 'Absent', 'Late', 'Excused', 'Attendance %']
+GRADES_HEADERS = ['Student ID', 'Student Name', 'Final Grade', 'Equivalent Grade', 'Remarks']
+SUMMARY_HEADERS = ['Student ID', 'Student Name', 'Final Grade', 'Equivalent Grade', 'Remarks', 'Attendance %']
+
+
+def _new_sheet(title, headers):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = title
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+    return wb, ws
+
+
+def _fill(ws, rows):
+    for row, values in enumerate(rows, 2):
+        for col, value in enumerate(values, 1):
+            ws.cell(row=row, column=col, value=value)
+
+
+def attendance_workbook(rows):
+    """rows: (student_id, name, total, present, absent, late, excused, attendance %)"""
+    wb, ws = _new_sheet("Attendance Report", ATTENDANCE_HEADERS)
+    _fill(ws, rows)
+    return wb
+
+
+def grades_workbook(rows):
+    """rows: (student_id, name, final grade, equivalent grade, remarks)"""
+    wb, ws = _new_sheet("Grades Report", GRADES_HEADERS)
+    _fill(ws, rows)
+    return wb
+
+
+def summary_workbook(rows):
+    """rows: (student_id, name, final grade, equivalent grade, remarks, attendance %)"""
+    wb, ws = _new_sheet("Class Summary", SUMMARY_HEADERS)
+    _fill(ws, rows)
+    return wb
+
+
+def workbook_bytes(wb):
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def build_record_book(payload):
+    """
+    Build the attendance, grades and summary workbooks for one class.
+
+    Returns (class_id, [(filename, bytes), ...], build_seconds).
+    """
+    started = time.perf_counter()
+    folder = payload['folder']
+    files = [
+        (f"{folder}/attendance_report.xlsx", workbook_bytes(attendance_workbook(payload['attendance']))),
+        (f"{folder}/grades_report.xlsx", workbook_bytes(grades_workbook(payload['grades']))),
+        (f"{folder}/summary_report.xlsx", workbook_bytes(summary_workbook(payload['summary']))),
+    ]
+    return payload['class_id'], files, time.perf_counter() - started
@@ -0,0 +1,120 @@
+"""
+Retried database writes for the write-heavy paths (score saving, final
+grade computation, attendance updates and imports).
+
+SQLite lets one writer at a time hold the database; a transaction that
+cannot get the lock within busy_timeout fails with "database is locked"
+(PostgreSQL reports deadlocks and serialization failures the same way).
+run_write() runs a function in its own transaction and, on that error,
+rolls back and tries again after a full-jitter exponential backoff
+(a random sleep between 0 and WRITE_RETRY_BASE_DELAY * 2**attempt,
+capped at WRITE_RETRY_MAX_DELAY), so a burst of workers spreads out
+instead of colliding again in step:
+
+    run_write("compute_final", recompute_grade_summaries, class_obj)
+
+    @retried_write("save_scores")
+    def save(): ...
+
+The function may run more than once, so it must not change anything
+outside the database until it returns. Called inside an outer atomic
+block nothing is retried (the outer transaction is already lost); the
+error goes to whoever owns that transaction.
+
+With SERIALIZE_DB_WRITES on, the writes of one process also queue on a
+process-wide lock, so its threads never compete for the SQLite lock with
+each other and only other processes can cause a retry.
+
+Calls, retries, failures and time spent waiting are counted per name in
+memory; write_stats() returns a snapshot.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+# SQLite lock errors, and PostgreSQL deadlocks / serialization failures
+# (the server has already rolled the transaction back, so it is safe to rerun)
+LOCK_ERRORS = (
+    "database is locked", "database table is locked", "database is busy",
+    "deadlock detected", "could not serialize access",
+)
+
+_writer_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and any(text in str(error).lower() for text in LOCK_ERRORS)
+
+
+def backoff_delay(attempt):
+    """Full-jitter delay before retry number attempt (0-based)"""
+    ceiling = min(settings.WRITE_RETRY_MAX_DELAY, settings.WRITE_RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+
+def _record(name, **counts):
+    with _stats_lock:
+        stats = _stats.setdefault(name, {"calls": 0, "retries": 0, "failures": 0, "wait_seconds": 0.0})
+        for key, value in counts.items():
+            stats[key] += value
+
+
+def write_stats():
+    """{name: {'calls', 'retries', 'failures', 'wait_seconds'}} since the process started"""
+    with _stats_lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def reset_write_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def run_write(name, fn, *args, using=None, **kwargs):
+    """Run fn(*args, **kwargs) in a transaction, retrying it on lock errors; returns its result"""
+    using = using or DEFAULT_DB_ALIAS
+    _record(name, calls=1)
+    if transaction.get_connection(using).in_atomic_block:
+        return fn(*args, **kwargs)
+
+    attempts = max(1, settings.WRITE_RETRY_ATTEMPTS)
+    for attempt in range(attempts):
+        started = time.perf_counter()
+        serialized = _writer_lock if settings.SERIALIZE_DB_WRITES else nullcontext()
+        try:
+            with serialized:
+                _record(name, wait_seconds=time.perf_counter() - started)
+                with transaction.atomic(using=using):
+                    return fn(*args, **kwargs)
+        except OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            if attempt + 1 == attempts:
+                _record(name, failures=1)
+                logger.error("%s failed after %d attempts: %s", name, attempts, e)
+                raise
+            delay = backoff_delay(attempt)
+            _record(name, retries=1, wait_seconds=delay)
+            logger.warning("%s hit a locked database (attempt %d of %d); retrying in %.3fs",
+                           name, attempt + 1, attempts, delay)
+            time.sleep(delay)
+
+
+def retried_write(name, using=None):
+    """Decorator form of run_write()"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            return run_write(name, fn, *args, using=using, **kwargs)
+        return wrapper
+    return decorator